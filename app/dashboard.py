@@ -1,10 +1,20 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
+import os
+import sys
 import warnings
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.change_feed import ChangeListener
+from src.config import Config
+from src.dashboard_views import (
+    DashboardFilters, DashboardResources, apply_filters, comparable_sales, distance_pie,
+    fair_value, filter_options, house_vs_apt, key_metrics, prepare_data, price_bounds,
+    price_histogram, price_trend, price_vs_distance, select_sketch, suburb_table
+)
+
 warnings.filterwarnings('ignore')
 
 
@@ -26,18 +36,26 @@ st.set_page_config(
 #    )
 #    return conn 
 
-@st.cache_data
-def load_data():
+config = Config()
+# 0 keeps cached data until the app restarts
+CACHE_TTL = config.DASHBOARD_CACHE_TTL_SECONDS or None
+DATA_FILE = f"{config.PROCESSED_DATA_PATH}/properties_processed_latest.csv"
+
+def data_version():
+    """Changes whenever the data file is rewritten; both caches are keyed on it"""
+    try:
+        stat = os.stat(DATA_FILE)
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+@st.cache_data(ttl = CACHE_TTL)
+def load_data(version):
     """Load data from CSV file"""
     try:
         # Use relative path for deployment
-        df = pd.read_csv('data/processed/properties_processed_latest.csv')
-        
-        # Convert date column if needed
-        if 'date_sold' in df.columns:
-            df['date_sold'] = pd.to_datetime(df['date_sold'], errors='coerce')
-        
-        return df
+        df = pd.read_csv(DATA_FILE)
+        return prepare_data(df)
     except FileNotFoundError:
         st.error("Data file not found. Please check the data directory.")
         return pd.DataFrame()
@@ -45,70 +63,74 @@ def load_data():
         st.error(f"Error loading data: {e}")
         return pd.DataFrame()
 
+@st.cache_resource(ttl = CACHE_TTL)
+def load_resources(version, _df):
+    """Spatial index, sketches, valuation model, comps index and rollups, shared by all sessions.
+
+    Keyed on the data version, so a rewritten data file gets resources built from it.
+    """
+    return DashboardResources(_df, config)
+
+@st.cache_resource
+def change_listener():
+    """One properties_processed change listener for all sessions; None without a database"""
+    if not config.CHANGE_FEED_ENABLED:
+        return None
+    try:
+        return ChangeListener(config = config).start()
+    except Exception:
+        # deployed with the CSV only: serve it as loaded
+        return None
+
+def render_bar(fig):
+    if fig is not None:
+        st.plotly_chart(fig, config={'responsive': True})
+    else:
+        st.info("No data for this comparison")
+
 def main():
     st.title("🏡 Sydney Property Market Analytics Dashboard")
     st.markdown("---")
+    version = data_version()
     with st.spinner("Loading data......"):
-        df = load_data()
+        df = load_data(version)
+    resources = load_resources(version, df)
+    listener = change_listener()
+    if listener is not None:
+        # reload just the suburbs the ETL changed since the last rerun
+        resources.sync(listener)
+        df = resources.df
+    options = filter_options(df, resources.spatial_index)
 
     st.sidebar.header("Filters")
 
-    min_price = int(df['price'].min())
-    max_price = int(df['price'].max())
-    price_range = st.sidebar.slider(
+    min_price, max_price = price_bounds(df)
+    filters = DashboardFilters()
+    filters.price_range = st.sidebar.slider(
         "Price Range ($)",
         min_price,
         max_price,
         (min_price, max_price),
         step = 50000
     )
+    filters.property_type = st.sidebar.selectbox("Property Type", options['property_type'])
+    filters.distance = st.sidebar.selectbox("Distance from CBD", options['distance'])
 
-    property_types = ['All'] + sorted(df['type'].unique().tolist())
-    selected_type = st.sidebar.selectbox("Property Type", property_types)
+    if resources.spatial_index is not None:
+        filters.near_suburb = st.sidebar.selectbox("Near Suburb", options['near_suburb'])
+        if filters.near_suburb != 'All':
+            filters.radius_km = st.sidebar.slider("Radius (km)", 1, 50, 10)
 
-    distance_cats = ['All'] + sorted(df['distance_category'].dropna().unique().tolist())
-    selected_distance = st.sidebar.selectbox("Distance from CBD", distance_cats)
+    filters.use_sketches = st.sidebar.checkbox("Approximate aggregates (sketches)", value=False)
 
-    filtered_df = df[(df['price'] >= price_range[0]) & (df['price'] <= price_range[1])]
-
-    if selected_type != 'All':
-        filtered_df = filtered_df[filtered_df['type'] == selected_type]
-    
-    if selected_distance != 'All':
-        filtered_df = filtered_df[filtered_df['distance_category'] == selected_distance]
+    filtered_df = apply_filters(df, filters, resources.spatial_index)
+    sketch = select_sketch(resources, filters)
 
     #KPI Metrics
     st.header("📊 Key Metrics")
-    col1, col2, col3, col4 = st.columns(4)
-
-    with col1:
-        st.metric(
-            "Total Properties",
-            f"{len(filtered_df):,}",
-            delta=f"{len(filtered_df) - len(df):,} filtered"
-        )
-    
-    with col2:
-        avg_price = filtered_df['price'].mean()
-        st.metric(
-            "Average Price",
-            f"${avg_price:,.0f}"
-        )
-    
-    with col3:
-        avg_sqm = filtered_df['price_per_sqm'].mean()
-        st.metric(
-            "Avg Price/Sqm",
-            f"${avg_sqm:,.0f}" if pd.notnull(avg_sqm) else "N/A"
-        )
-
-    with col4:
-        num_suburbs = filtered_df['suburb'].nunique()
-        st.metric(
-            "Suburbs",
-            f"{num_suburbs:,}"
-        )
-
+    for col, (label, value, delta) in zip(st.columns(4), key_metrics(df, filtered_df, sketch)):
+        with col:
+            st.metric(label, value, delta=delta)
 
     st.markdown("---")
 
@@ -116,142 +138,68 @@ def main():
 
     with col1:
         st.subheader("📈 Price Distribution")
-        fig_hist = px.histogram(
-            filtered_df,
-            x='price',
-            nbins=50,
-            title='Property Price Distribution',
-            labels = {'price': 'Price($)', 'count': 'Number of Properties'}
-        )
-
-        fig_hist.update_layout(showlegend = False)
-        st.plotly_chart(fig_hist, config={'responsive': True})
+        st.plotly_chart(price_histogram(filtered_df, sketch), config={'responsive': True})
 
     with col2:
         st.subheader("🏘️ Properties by Distance Category")
-        distance_counts = filtered_df['distance_category'].value_counts()
-        fig_pie = px.pie(
-            values = distance_counts.values,
-            names=distance_counts.index,
-            title = 'Distribution by Distance from CBD'
-        )
-
-        st.plotly_chart(fig_pie, config={'responsive': True})
+        st.plotly_chart(distance_pie(filtered_df), config={'responsive': True})
 
-    
     st.subheader("📍 Price vs Distance from CBD")
-    fig_scatter = px.scatter(
-        filtered_df,
-        x='km_from_cbd',
-        y='price',
-        color='is_house',
-        size='num_bed',
-        hover_data=['suburb', 'type', 'num_bed', 'num_bath'],
-        title='Property Price vs Distance from CBD',
-        labels={
-            'km_from_cbd':'Distance from CBD(km)',
-            'price': 'Price($)',
-            'is_House': 'Property Type'
-        },
-        color_discrete_map={True: '#FF6B6B', False: '#4ECDC4'}
-    )
-    st.plotly_chart(fig_scatter, config={'responsive': True})
+    st.plotly_chart(price_vs_distance(filtered_df), config={'responsive': True})
+
+    st.subheader("📅 Median Price Over Time")
+    st.plotly_chart(price_trend(resources.timeseries, filters), config={'responsive': True})
 
     st.subheader("Top 10 Most Expensive Suburbs")
-    suburb_stats = filtered_df.groupby('suburb').agg({
-        'price':['count', 'mean', 'max'],
-        'km_from_cbd': 'mean'
-    }).round(2)
-
-    suburb_stats.columns=['Count', 'Avg Price', 'Max Price', 'Avg Distance (km)']
-    suburb_stats = suburb_stats.sort_values('Avg Price', ascending=False)
-    suburb_stats['Avg Price']=suburb_stats['Avg Price'].apply(lambda x: f"${x:,.0f}")
-    suburb_stats['Max Price']=suburb_stats['Max Price'].apply(lambda x: f"${x:,.0f}")
-    st.dataframe(suburb_stats, width='stretch')
-    
+    st.dataframe(suburb_table(filtered_df), width='stretch')
+
     # House vs Apartment comparison
     st.subheader("🏠 House vs Apartment Comparison")
 
     # Check if we have enough data
     if len(filtered_df) > 0 and 'is_house' in filtered_df.columns:
+        fig_bar, fig_count = house_vs_apt(filtered_df)
         col1, col2 = st.columns(2)
-        
         with col1:
-            # Average price comparison
-            house_apt_avg = filtered_df.groupby('is_house')['price'].mean()
-            
-            categories = []
-            values = []
-            colors = []
-            
-            if False in house_apt_avg.index:
-                categories.append('Apartment')
-                values.append(house_apt_avg[False])
-                colors.append('#4ECDC4')
-            
-            if True in house_apt_avg.index:
-                categories.append('House')
-                values.append(house_apt_avg[True])
-                colors.append('#FF6B6B')
-            
-            if len(categories) > 0:
-                fig_bar = go.Figure(data=[
-                    go.Bar(
-                        x=categories,
-                        y=values,
-                        marker_color=colors,
-                        text=[f'${v:,.0f}' for v in values],
-                        textposition='outside'
-                    )
-                ])
-                fig_bar.update_layout(
-                    title='Average Price: House vs Apartment',
-                    yaxis_title='Average Price ($)',
-                    showlegend=False
-                )
-                st.plotly_chart(fig_bar, config={'responsive': True})
-            else:
-                st.info("No data for this comparison")
-        
+            render_bar(fig_bar)
         with col2:
-            # Count comparison
-            house_apt_count = filtered_df['is_house'].value_counts()
-            
-            categories = []
-            counts = []
-            colors = []
-            
-            if False in house_apt_count.index:
-                categories.append('Apartment')
-                counts.append(house_apt_count[False])
-                colors.append('#4ECDC4')
-            
-            if True in house_apt_count.index:
-                categories.append('House')
-                counts.append(house_apt_count[True])
-                colors.append('#FF6B6B')
-            
-            if len(categories) > 0:
-                fig_count = go.Figure(data=[
-                    go.Bar(
-                        x=categories,
-                        y=counts,
-                        marker_color=colors,
-                        text=counts,
-                        textposition='outside'
-                    )
-                ])
-                fig_count.update_layout(
-                    title='Property Count: House vs Apartment',
-                    yaxis_title='Number of Properties',
-                    showlegend=False
-                )
-                st.plotly_chart(fig_count, config={'responsive': True})
-            else:
-                st.info("No data for this comparison")
+            render_bar(fig_count)
     else:
         st.warning("No properties match the selected filters. Try adjusting the criteria.")
 
+    st.subheader("💰 Fair Value vs Actual Price")
+    fig_value, undervalued = fair_value(resources.valuation_model, filtered_df)
+    if fig_value is not None:
+        st.plotly_chart(fig_value, config={'responsive': True})
+        st.caption("Sales furthest below fair value")
+        st.dataframe(undervalued, width='stretch', hide_index=True)
+
+    st.subheader("🔎 Comparable Sales")
+    comps_index = resources.comparables_index
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        comp_suburb = st.selectbox("Suburb", sorted(df['suburb'].dropna().unique().tolist()))
+    with col2:
+        comp_beds = st.number_input("Bedrooms", min_value=0, max_value=20, value=3, step=1)
+    with col3:
+        comp_size = st.number_input("Property Size (sqm)", min_value=10, max_value=100000, value=500, step=10)
+    with col4:
+        comp_house = st.radio("Property", ['House', 'Apartment'], horizontal=True) == 'House'
+    comps_display, comps_median = comparable_sales(comps_index, comp_suburb, comp_beds, comp_house, comp_size)
+    if comps_display is not None:
+        st.metric(
+            "Median Comparable Price",
+            f"${comps_median:,.0f}",
+            delta=f"{len(comps_display)} sales in the {config.COMPARABLES_MONTHS} months to {comps_index.latest_sale}",
+            delta_color='off'
+        )
+        st.dataframe(comps_display, width='stretch', hide_index=True)
+    else:
+        st.info(
+            f"No comparable sales: same suburb and bedrooms, size within {config.COMPARABLES_SIZE_TOLERANCE:.0%}, "
+            f"sold in the last {config.COMPARABLES_MONTHS} months."
+        )
+
     st.markdown("---")
     st.caption(f"Dashboard last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     st.caption(f"Total dataset: {len(df):,} properties")
@@ -5,12 +5,19 @@ from datetime import datetime, timedelta
 import sys
 import os
 
-PROJECT_PATH = '/Users/wenditang/Desktop/sydney-property-pipeline'  
+# the repo this file lives in, unless the deployment puts it elsewhere;
+# settings come from the environment or PIPELINE_CONFIG_FILE (see src/config.py)
+PROJECT_PATH = os.environ.get('PROJECT_PATH', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, PROJECT_PATH)
 
 
+from src.artifact_cache import ArtifactCache
+from src.change_feed import ChangeFeed
+from src.config import Config
 from src.data_loader import DataLoader
+from src.db_loader import DatabaseLoader
 from src.etl_pipeline import ETLPipeline
+from src.timeseries import TimeSeriesRollup
 
 # Default arguments
 default_args = {
@@ -34,33 +41,47 @@ dag = DAG(
 )
 
 
+def get_cache():
+    """Stage-output cache shared by the tasks (None when disabled)"""
+    return ArtifactCache() if Config.ARTIFACT_CACHE_ENABLED else None
+
+
 def load_raw_data(**context):
     """Task 1: Load raw data"""
     loader = DataLoader()
-    df = loader.load_raw_data()
-    loader.explore_data(df)
-    df_clean = loader.clean_data(df)
-    filepath = loader.save_processed_data(df_clean)
+    # skipped when data/raw is unchanged since a cached run
+    filepath = loader.prepare_processed_data(cache=get_cache())
     
     # Push filepath to XCom for next task
     context['ti'].xcom_push(key='processed_file', value=filepath)
     
-    return f"Loaded {len(df_clean)} records"
+    return f"Prepared {filepath}"
+
+
+def load_raw_to_db(**context):
+    """Task 2: Load the cleaned CSV into properties_raw"""
+    filepath = context['ti'].xcom_pull(task_ids='load_raw_data', key='processed_file')
+    loader = DatabaseLoader()
+    
+    try:
+        cache = get_cache()
+        if cache:
+            inserted = loader.load_csv_cached(filepath, cache)
+        else:
+            inserted = loader.load_csv_streaming(filepath)
+        return f"Loaded {inserted} new raw records"
+    finally:
+        loader.close()
 
 
 def run_etl(**context):
-    """Task 2: Run ETL pipeline"""
+    """Task 3: Run ETL pipeline"""
     pipeline = ETLPipeline()
     
     try:
-        # Extract
-        df_raw = pipeline.extract_from_raw()
-        
-        # Transform
-        df_transformed = pipeline.transform_data(df_raw)
-        
-        # Load
-        pipeline.load_to_processed(df_transformed)
+        # Extract, transform, load and sketch (skipped when properties_raw
+        # is unchanged since a cached run)
+        records = pipeline.run_etl(cache=get_cache())
         
         # Quality checks
         checks_passed = pipeline.run_data_quality_checks()
@@ -68,14 +89,14 @@ def run_etl(**context):
         if not checks_passed:
             raise ValueError("Data quality checks failed!")
         
-        return f"ETL complete: {len(df_transformed)} records processed"
+        return f"ETL complete: {records} records processed"
         
     finally:
         pipeline.close()
 
 
 def generate_summary(**context):
-    """Task 3: Generate summary statistics"""
+    """Task 4: Generate summary statistics"""
     pipeline = ETLPipeline()
     
     try:
@@ -85,6 +106,24 @@ def generate_summary(**context):
         pipeline.close()
 
 
+def refresh_timeseries(**context):
+    """Task 5: Update monthly/quarterly rollups"""
+    rollup = TimeSeriesRollup()
+
+    try:
+        if not Config.CHANGE_FEED_ENABLED:
+            rollups = rollup.refresh()
+        else:
+            # from the earliest month the ETL changed
+            rollups = rollup.refresh_changes(ChangeFeed(rollup.db))
+            if rollups is None:
+                return "Rollups unchanged"
+        rollup.export_csv()
+        return f"Rollups refreshed: {len(rollups)} rows"
+    finally:
+        rollup.close()
+
+
 # Define tasks
 task_load = PythonOperator(
     task_id='load_raw_data',
@@ -93,6 +132,13 @@ task_load = PythonOperator(
     dag=dag,
 )
 
+task_load_db = PythonOperator(
+    task_id='load_raw_to_db',
+    python_callable=load_raw_to_db,
+    provide_context=True,
+    dag=dag,
+)
+
 task_etl = PythonOperator(
     task_id='run_etl_pipeline',
     python_callable=run_etl,
@@ -107,6 +153,13 @@ task_summary = PythonOperator(
     dag=dag,
 )
 
+task_timeseries = PythonOperator(
+    task_id='refresh_timeseries',
+    python_callable=refresh_timeseries,
+    provide_context=True,
+    dag=dag,
+)
+
 task_notify = BashOperator(
     task_id='notify_completion',
     bash_command='echo "Pipeline completed successfully at $(date)"',
@@ -114,4 +167,4 @@ task_notify = BashOperator(
 )
 
 # Set task dependencies
-task_load >> task_etl >> task_summary >> task_notify
\ No newline at end of file
+task_load >> task_load_db >> task_etl >> [task_summary, task_timeseries] >> task_notify
\ No newline at end of file
@@ -1,110 +1,148 @@
+import argparse
 import logging
+import os
+from src import comparables
+from src.config import Config, add_config_arguments, configure
 from src.db_setup import DatabaseSetup
-import pandas as pd
+from src.embedded_analytics import SnapshotQueryEngine
+from src.queries import QueryCatalog
+from src.spatial import SuburbSpatialIndex
+from src.valuation import ValuationModel
 
 logging.basicConfig(level = logging.INFO)
 logger = logging.getLogger(__name__)
 
 class PropertyAnalytics:
     
-    def __init__(self):
-        self.db = DatabaseSetup()
-        self.db.connect()
+    def __init__(self, db = None, engine = None, config = None):
+        #engine: a SnapshotQueryEngine to report on a snapshot instead of Postgres
+        self.config = config or Config()
+        if engine is None and db is None and self.config.ANALYTICS_ENGINE == 'duckdb':
+            engine = SnapshotQueryEngine(config = self.config)
+        if engine is not None:
+            self.db = None
+            self.queries = engine
+        else:
+            if db is None:
+                db = DatabaseSetup(config = self.config)
+                db.connect()
+            self.db = db
+            self.queries = QueryCatalog(db)
+        self.spatial_index = None
+        self.valuation_model = None
+        self.comparables_index = None
 
     def price_by_distance(self):
         logger.info("\n===Price Analysis by Distance from CBD")
-
-        query = """
-        select
-            distance_category,
-            count(*) as num_properties,
-            avg(price)::NUMERIC(10, 2) as avg_price,
-            avg(price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm,
-            avg(num_bed)::NUMERIC(3,1) as avg_bedrooms
-        from properties_processed
-        where distance_category is not NULL
-        group by distance_category
-        order by
-            case distance_category
-                when 'Inner City' then 1
-                when 'Inner Suburbs' then 2
-                when 'Middle Suburbs' then 3
-                when 'Outer Suburbs' then 4
-            end;
-        """
-
-        df = pd.read_sql(query, self.db.conn)
+        df = self.queries.read('price_by_distance')
         print(df.to_string(index = False))
         return df
 
     def house_vs_apt(self):
         logger.info("\n=== House v.s. Apt")
-
-        query = """
-        select 
-            case when is_house then 'House' else 'Apt' end as property_category,
-            count(*) as count,
-            avg(price)::NUMERIC(10, 2) as avg_price,
-            avg(price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm,
-            avg(num_bed)::NUMERIC(3, 1) as avg_bedrooms,
-            avg(num_bath)::NUMERIC(3, 1) as avg_bathrooms
-        from properties_processed
-        group by is_house
-        order by is_house desc;
-        """
-
-        df = pd.read_sql(query, self.db.conn)
+        df = self.queries.read('house_vs_apt')
         print(df.to_string(index=False))
         return df
     
-    def top_suburbs_by_value(self):
+    def top_suburbs_by_value(self, min_sales = 10, limit = 10):
         #Find suburbs with best value (lower price per sqm)
-        logger.info("\n=== Top 10 Suburbs by Value (Price/SqM) ===")
-        query = """
-            select suburb, count(*) as num_properties, avg(price)::NUMERIC(10, 2) as avg_price, avg(price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm, avg(km_from_cbd)::NUMERIC(4,1) as avg_distance_cbd
-            from properties_processed
-            where price_per_sqm is not NULL
-            group by suburb
-            having count(*) >= 10 
-            order by avg_price_per_sqm asc
-            limit 10;
-        """
-
-        df = pd.read_sql(query, self.db.conn)
+        logger.info(f"\n=== Top {limit} Suburbs by Value (Price/SqM) ===")
+        df = self.queries.read('top_suburbs_by_value', (min_sales, limit))
+        print(df.to_string(index=False))
+        return df
+
+    def most_expensive_suburbs(self, min_sales = 5, limit = 10):
+        logger.info(f"\n === Top {limit} most expensive suburbs===")
+        df = self.queries.read('most_expensive_suburbs', (min_sales, limit))
+        print(df.to_string(index=False))
+        return df
+
+    def load_valuation_model(self):
+        if self.valuation_model is None:
+            if self.db is None:
+                #snapshot engine: no stored model, fit on the snapshot itself
+                self.valuation_model = ValuationModel(config = self.config).fit(self.queries.read('valuation_features'))
+            else:
+                self.valuation_model = ValuationModel.from_records(self.queries.fetchall('valuation_model'), config = self.config)
+        return self.valuation_model
+
+    def valuation_residuals(self, limit = 10, undervalued = True):
+        """Sales furthest below (or above) their modelled fair value"""
+        logger.info(f"\n=== Top {limit} sales {'below' if undervalued else 'above'} fair value ===")
+        df = self.load_valuation_model().residuals(self.queries.read('valuation_features'))
+        df = df.sort_values('residual_pct', ascending = undervalued).head(limit)
+        df = df[['suburb', 'type', 'num_bed', 'num_bath', 'price', 'fair_value', 'residual_pct']]
         print(df.to_string(index=False))
         return df
 
-    def most_expensive_suburbs(self):
-        logger.info("\n === Top 10 most expensive suburbs===")
-        query = """
-        SELECT 
-            suburb,
-            COUNT(*) as num_properties,
-            AVG(price)::NUMERIC(10,2) as avg_price,
-            MAX(price)::NUMERIC(10,2) as max_price,
-            AVG(km_from_cbd)::NUMERIC(4,1) as avg_distance_cbd
-        FROM properties_processed
-        GROUP BY suburb
-        HAVING COUNT(*) >= 5
-        ORDER BY avg_price DESC
-        LIMIT 10;
-        """
-        
-        df = pd.read_sql(query, self.db.conn)
+    def load_comparables_index(self):
+        if self.comparables_index is None:
+            if self.db is None or not os.path.exists(self.config.COMPARABLES_PATH):
+                #no index saved by the ETL: build one from the processed rows
+                self.comparables_index = comparables.ComparablesIndex.from_dataframe(
+                    self.queries.read('valuation_features'), self.config)
+            else:
+                self.comparables_index = comparables.ComparablesIndex.load(self.config.COMPARABLES_PATH, self.config)
+        return self.comparables_index
+
+    def comparable_sales(self, suburb, num_bed, is_house, property_size, tolerance = None, months = None):
+        """Recent sales in the same suburb with the same beds and a similar size"""
+        logger.info(f"\n=== Comparable sales: {num_bed} bed {'house' if is_house else 'apartment'} "
+                    f"in {suburb}, ~{property_size} sqm ===")
+        df = self.load_comparables_index().comparables(
+            suburb, num_bed, is_house, property_size, tolerance = tolerance, months = months)
         print(df.to_string(index=False))
         return df
 
+    def build_spatial_index(self):
+        #suburb centroids from raw data joined with processed price stats
+        df = self.queries.read('suburb_centroids')
+        self.spatial_index = SuburbSpatialIndex(df, cell_km = self.config.SPATIAL_CELL_KM)
+        return self.spatial_index
+
+    def suburbs_within(self, location, radius_km):
+        """Suburbs within radius_km of a suburb name or (lat, lng)"""
+        if self.spatial_index is None:
+            self.build_spatial_index()
+        logger.info(f"\n=== Suburbs within {radius_km}km of {location} ===")
+        df = self.spatial_index.within_radius(location, radius_km)
+        print(df.to_string(index=False))
+        return df
+
+    def comparable_suburbs(self, suburb, k = 5, radius_km = None):
+        """Suburbs with the closest average price/sqm, optionally within radius_km"""
+        if self.spatial_index is None:
+            self.build_spatial_index()
+        logger.info(f"\n=== {k} suburbs comparable to {suburb} by price/sqm ===")
+        df = self.spatial_index.comparable_by_price_per_sqm(suburb, k = k, radius_km = radius_km)
+        print(df.to_string(index=False))
+        return df
+
+    def export_suburb_centroids(self, filepath = None):
+        """Write suburb centroids for the dashboard's location filter"""
+        if self.spatial_index is None:
+            self.build_spatial_index()
+        filepath = filepath or self.config.SUBURB_CENTROIDS_PATH
+        os.makedirs(os.path.dirname(filepath), exist_ok = True)
+        return self.spatial_index.to_csv(filepath)
+
     def close(self):
-        self.db.close()
+        if self.db is None:
+            self.queries.close()
+        else:
+            self.db.close()
 
 def main():
-    analytics = PropertyAnalytics()
+    parser = add_config_arguments(argparse.ArgumentParser(description = "Run the analytics reports"))
+    analytics = PropertyAnalytics(config = configure(parser.parse_args()))
 
     try: 
         analytics.price_by_distance()
         analytics.house_vs_apt()
         analytics.top_suburbs_by_value()
         analytics.most_expensive_suburbs()
+        analytics.valuation_residuals()
+        analytics.export_suburb_centroids()
         logger.info("\n Analytics Complete")
     except Exception as e:
         logger.error(f"Analytics failed: {e}")
@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+import pandas as pd
+from psycopg2 import sql
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow ships with requirements-full.txt only
+    pa = None
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Postgres type OID -> Arrow type for COPY CSV columns; NUMERIC arrives as
+# float64 and integers as int64, matching what the row path produces
+ARROW_TYPES = {
+    16: 'bool_',
+    20: 'int64', 21: 'int64', 23: 'int64',
+    700: 'float64', 701: 'float64', 1700: 'float64',
+    1082: 'date32',
+    1114: 'timestamp[us]',
+    1184: 'timestamp[us, tz=UTC]',
+}
+BLOCK_SIZE = 1 << 22
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("READ_FORMAT = 'arrow' needs pyarrow: pip install pyarrow")
+
+
+def _arrow_type(oid):
+    name = ARROW_TYPES.get(oid, 'string')
+    if name.startswith('timestamp'):
+        return pa.timestamp('us', tz='UTC' if 'UTC' in name else None)
+    return getattr(pa, name)()
+
+
+def result_schema(cursor, query):
+    """Column names and Arrow types of a query, without running it"""
+    cursor.execute(sql.SQL("SELECT * FROM ({}) q LIMIT 0").format(sql.SQL(query)))
+    return pa.schema([(d.name, _arrow_type(d.type_code)) for d in cursor.description])
+
+
+def iter_batches(conn, query, params = None):
+    """Stream a query's result as Arrow record batches.
+
+    The result is sent with COPY ... TO STDOUT (FORMAT csv) through a pipe
+    and parsed by Arrow's multithreaded CSV reader block by block, so no
+    Python object is built per cell and only one block is held in memory.
+    """
+    _require_pyarrow()
+    cursor = conn.cursor()
+    if params:
+        query = cursor.mogrify(query, params).decode()
+    schema = result_schema(cursor, query)
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, 'wb') as sink:
+                cursor.copy_expert(
+                    sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv)").format(sql.SQL(query)).as_string(conn),
+                    sink
+                )
+        except Exception as e:
+            errors.append(e)
+
+    producer = threading.Thread(target = produce, daemon = True)
+    producer.start()
+    try:
+        with os.fdopen(read_fd, 'rb') as source:
+            # an empty result has no CSV block for the reader to open; a
+            # conversion error anywhere in the stream is raised
+            if not source.peek(1):
+                producer.join()
+                if errors:
+                    raise errors[0]
+                return
+            reader = pa_csv.open_csv(
+                source,
+                read_options = pa_csv.ReadOptions(column_names = schema.names, block_size = BLOCK_SIZE),
+                convert_options = pa_csv.ConvertOptions(
+                    column_types = schema,
+                    # COPY writes NULL unquoted and '' quoted
+                    strings_can_be_null = True,
+                    quoted_strings_can_be_null = False,
+                    true_values = ['t'],
+                    false_values = ['f'],
+                )
+            )
+            for batch in reader:
+                yield batch
+    finally:
+        producer.join()
+        cursor.close()
+    if errors:
+        raise errors[0]
+
+
+def read_arrow(conn, query, params = None):
+    batches = list(iter_batches(conn, query, params))
+    if not batches:
+        cursor = conn.cursor()
+        if params:
+            query = cursor.mogrify(query, params).decode()
+        schema = result_schema(cursor, query)
+        cursor.close()
+        return schema.empty_table()
+    return pa.Table.from_batches(batches)
+
+
+def read_frame(conn, query, params = None, arrow_dtypes = False):
+    """Query into a DataFrame via Arrow; arrow_dtypes keeps Arrow-backed columns"""
+    table = read_arrow(conn, query, params)
+    if arrow_dtypes:
+        return table.to_pandas(types_mapper = pd.ArrowDtype)
+    return table.to_pandas()
@@ -0,0 +1,174 @@
+import contextlib
+import fcntl
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from src.config import Config
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+
+
+def fingerprint_file(path, chunk_size = 1 << 20):
+    """sha256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_code(*objects):
+    """sha256 of the source of the modules/functions a stage runs"""
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Content-addressed store of stage outputs with LRU eviction.
+
+    A stage's key hashes everything its output depends on: input fingerprints,
+    the source of the code it runs and the config values it reads. An entry
+    holds an optional file (the artifact itself, stored under its key) and a
+    small JSON `meta` dict. index.json tracks size and last use; once the store
+    exceeds ARTIFACT_CACHE_MAX_MB or ARTIFACT_CACHE_MAX_ENTRIES, the least
+    recently used entries are removed. Entries older than
+    ARTIFACT_CACHE_TTL_HOURS (if set) are misses.
+
+    Every read-modify-write of index.json holds an exclusive lock on
+    index.lock, so Airflow workers and local runner processes sharing the
+    cache directory do not lose each other's entries.
+    """
+
+    def __init__(self, root = None, max_bytes = None, max_entries = None, config = None):
+        self.config = config or Config()
+        self.root = root or self.config.ARTIFACT_CACHE_PATH
+        self.max_bytes = max_bytes or self.config.ARTIFACT_CACHE_MAX_MB * 1024 * 1024
+        self.max_entries = max_entries or self.config.ARTIFACT_CACHE_MAX_ENTRIES
+        self.ttl_seconds = self.config.ARTIFACT_CACHE_TTL_HOURS * 3600
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok = True)
+
+    def key(self, stage, inputs = None, code = (), params = None):
+        payload = {
+            'stage': stage,
+            'inputs': inputs or {},
+            'code': fingerprint_code(*code) if code else None,
+            'params': params or {},
+        }
+        encoded = json.dumps(payload, sort_keys = True, default = str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def object_path(self, key, suffix = ''):
+        return os.path.join(self.root, 'objects', key[:2], key + suffix)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the index lock: threads of this process, then other processes"""
+        with self._lock, open(os.path.join(self.root, LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_index(self, index):
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent = 2)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        """The entry for key (marking it recently used), or None"""
+        with self._locked():
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is None:
+                return None
+            if self.ttl_seconds and time.time() - entry['created'] > self.ttl_seconds:
+                # expired: drop it so the stage reruns and stores a fresh entry
+                entry = index.pop(key)
+                if entry.get('path') and os.path.exists(entry['path']):
+                    os.remove(entry['path'])
+                self._save_index(index)
+                return None
+            if entry.get('path') and not os.path.exists(entry['path']):
+                # artifact removed behind our back; treat as a miss
+                del index[key]
+                self._save_index(index)
+                return None
+            entry['last_used'] = time.time()
+            self._save_index(index)
+            return entry
+
+    def put(self, key, stage, source_path = None, meta = None, suffix = ''):
+        """Store a stage output; source_path (if any) is moved into the cache"""
+        with self._locked():
+            index = self._load_index()
+            path, size = None, 0
+            if source_path is not None:
+                path = self.object_path(key, suffix)
+                os.makedirs(os.path.dirname(path), exist_ok = True)
+                shutil.move(source_path, path)
+                size = os.path.getsize(path)
+
+            now = time.time()
+            index[key] = {
+                'stage': stage,
+                'path': path,
+                'size': size,
+                'meta': meta or {},
+                'created': now,
+                'last_used': now,
+            }
+            self._evict(index, keep = key)
+            self._save_index(index)
+            logger.info(f"Cached {stage} artifact {key[:12]} ({size:,} bytes)")
+            return index[key]
+
+    def latest(self, stage):
+        """Most recently stored entry for a stage, or None"""
+        with self._locked():
+            entries = [e for e in self._load_index().values() if e['stage'] == stage]
+        if not entries:
+            return None
+        return max(entries, key = lambda e: e['created'])
+
+    def _evict(self, index, keep = None):
+        total = sum(e['size'] for e in index.values())
+        by_age = sorted(index, key = lambda k: index[k]['last_used'])
+        for key in by_age:
+            if total <= self.max_bytes and len(index) <= self.max_entries:
+                break
+            if key == keep:
+                continue
+            entry = index.pop(key)
+            total -= entry['size']
+            if entry.get('path') and os.path.exists(entry['path']):
+                os.remove(entry['path'])
+            logger.info(f"Evicted {entry['stage']} artifact {key[:12]} ({entry['size']:,} bytes)")
+
+    def total_bytes(self):
+        with self._locked():
+            return sum(e['size'] for e in self._load_index().values())
@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import pandas as pd
+from psycopg2 import sql
+from src import psycopg3_backend
+from src.config import Config, add_config_arguments, configure
+from src.db_loader import DatabaseLoader
+from src.db_setup import DatabaseSetup
+from src.queries import QueryCatalog
+from src.snapshots import SnapshotManager
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BENCH_TABLE = 'bench_properties_raw'
+BENCH_LOAD_TABLE = 'bench_properties_load'
+ANALYTICS_QUERIES = [
+    ('price_by_distance', ()),
+    ('house_vs_apt', ()),
+    ('top_suburbs_by_value', (10, 10)),
+    ('most_expensive_suburbs', (5, 10)),
+]
+DQ_QUERIES = ['dq_null_critical', 'dq_invalid_price', 'dq_invalid_distance', 'dq_missing_price_per_sqm']
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def create_bench_table(db, scale):
+    """properties_raw repeated `scale` times, to measure extract at volume"""
+    table = sql.Identifier(BENCH_TABLE)
+    db.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(table))
+    db.cursor.execute(sql.SQL(
+        "CREATE TABLE {} AS SELECT r.* FROM properties_raw r, generate_series(1, %s);"
+    ).format(table), (scale,))
+    db.conn.commit()
+    db.cursor.execute(sql.SQL("SELECT count(*) FROM {};").format(table))
+    return db.cursor.fetchone()[0]
+
+
+def create_load_table(db):
+    """Empty copy of properties_raw (with the row_hash index) for the load workload"""
+    table = sql.Identifier(BENCH_LOAD_TABLE)
+    db.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(table))
+    db.cursor.execute(sql.SQL("CREATE TABLE {} (LIKE properties_raw INCLUDING INDEXES);").format(table))
+    db.cursor.execute(sql.SQL("ALTER TABLE {} DROP COLUMN id;").format(table))
+    db.conn.commit()
+
+
+def write_load_csv(path, scale, config):
+    """The latest snapshot repeated `scale` times, each copy a distinct sale"""
+    latest = SnapshotManager(config = config).latest()
+    if latest is None:
+        raise FileNotFoundError("No processed snapshots to build the load workload from")
+    df = pd.read_csv(latest[1]['path'])
+    pd.concat([df.assign(price = df['price'] + i) for i in range(scale)]).to_csv(path, index = False)
+
+
+def run_backend(backend, repeat, read_format = 'rows', binary = False):
+    """Timings (seconds) for the catalog workloads on one backend"""
+    db = DatabaseSetup(config = Config(DB_BACKEND = backend, READ_FORMAT = read_format, PSYCOPG3_BINARY = binary))
+    db.connect()
+    catalog = QueryCatalog(db)
+    try:
+        results = {}
+        results['extract'] = best_of(lambda: catalog.read('extract_raw', raw = BENCH_TABLE), repeat)
+        results['analytics'] = best_of(
+            lambda: [catalog.read(name, params) for name, params in ANALYTICS_QUERIES], repeat)
+        results['dq_batch'] = best_of(lambda: catalog.scalars(DQ_QUERIES), repeat)
+        return results
+    finally:
+        db.close()
+
+
+def run_load(csv_path, repeat, binary = False):
+    """Streaming CSV load into an empty table: text COPY (psycopg2) or binary COPY (psycopg 3)"""
+    config = Config(DB_BACKEND = 'psycopg3' if binary else 'psycopg2', PSYCOPG3_BINARY = binary)
+    db = DatabaseSetup(config = config)
+    db.connect()
+    loader = DatabaseLoader(db = db, config = config)
+
+    def load():
+        db.cursor.execute(sql.SQL("TRUNCATE TABLE {};").format(sql.Identifier(BENCH_LOAD_TABLE)))
+        db.conn.commit()
+        loader.load_csv_streaming(csv_path, BENCH_LOAD_TABLE)
+
+    try:
+        return best_of(load, repeat)
+    finally:
+        db.close()
+
+
+def run_async_analytics(repeat, binary = False):
+    """Analytics queries concurrently on async psycopg 3 connections"""
+    config = Config(DB_BACKEND = 'psycopg3', READ_FORMAT = 'rows', PSYCOPG3_BINARY = binary)
+    db = DatabaseSetup(config = config)
+    db.connect()
+    catalog = QueryCatalog(db)
+    queries = {
+        name: (catalog._compose(name, {}), params or None) for name, params in ANALYTICS_QUERIES
+    }
+    db.close()
+    return best_of(lambda: asyncio.run(psycopg3_backend.read_frames_async(queries, config)), repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compare the psycopg2, psycopg3 (text and binary) and Arrow data paths")
+    parser.add_argument('--scale', type = int, default = 20, help = "copies of properties_raw to extract and load")
+    parser.add_argument('--repeat', type = int, default = 3, help = "runs per workload (best is reported)")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = configure(args)
+
+    # keep the timings readable
+    logging.getLogger('src').setLevel(logging.WARNING)
+
+    db = DatabaseSetup(config = config)
+    db.connect()
+    try:
+        rows = create_bench_table(db, args.scale)
+        create_load_table(db)
+        logger.info(f"Benchmarking on {rows:,} rows ({BENCH_TABLE}, {BENCH_LOAD_TABLE})")
+
+        timings = {
+            'psycopg2': run_backend('psycopg2', args.repeat),
+            'psycopg3': run_backend('psycopg3', args.repeat),
+            'psycopg3_binary': run_backend('psycopg3', args.repeat, binary = True),
+        }
+        # concurrent async reads, against sequential psycopg2
+        timings['psycopg2']['analytics_async'] = timings['psycopg2']['analytics']
+        timings['psycopg3']['analytics_async'] = run_async_analytics(args.repeat)
+        timings['psycopg3_binary']['analytics_async'] = run_async_analytics(args.repeat, binary = True)
+        # text COPY from CSV, against binary COPY; psycopg3 without binary
+        # loads through psycopg2
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'bench_load.csv')
+            write_load_csv(csv_path, args.scale, config)
+            timings['psycopg2']['load'] = timings['psycopg3']['load'] = run_load(csv_path, args.repeat)
+            timings['psycopg3_binary']['load'] = run_load(csv_path, args.repeat, binary = True)
+        # COPY -> Arrow frames on psycopg2; scalars are unchanged by READ_FORMAT
+        timings['arrow'] = run_backend('psycopg2', args.repeat, 'arrow')
+        timings['arrow']['analytics_async'] = timings['arrow']['analytics']
+
+        report = pd.DataFrame(timings)
+        for column in ['psycopg3', 'psycopg3_binary', 'arrow']:
+            report[f'speedup_{column}'] = report['psycopg2'] / report[column]
+        logger.info(f"\n=== Backend timings (seconds, best of {args.repeat}) ===\n{report.round(4).to_string()}")
+        return report
+    finally:
+        for table in [BENCH_TABLE, BENCH_LOAD_TABLE]:
+            db.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(table)))
+        db.cursor.execute("DELETE FROM properties_table_loads WHERE table_name = %s;", (BENCH_LOAD_TABLE,))
+        db.conn.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
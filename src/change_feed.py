@@ -0,0 +1,216 @@
+import argparse
+import json
+import logging
+import select
+import threading
+from psycopg2 import sql
+from src.config import Config, add_config_arguments, configure
+from src.db_setup import DatabaseSetup
+from src.queries import QueryCatalog
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel; the payload is a small JSON summary with the changelog id
+CHANNEL = 'properties_changed'
+CHANGE_COLUMNS = [
+    'id', 'table_name', 'etl_mode', 'num_rows', 'table_min_id', 'table_max_id', 'partitions_inserted',
+    'partitions_updated', 'partitions_deleted', 'suburbs', 'months', 'created_at'
+]
+
+
+def partition_changes(before, after):
+    """(inserted, updated, deleted) partition keys between two {(suburb, month): (num_rows, digest)} snapshots"""
+    inserted = set(after) - set(before)
+    deleted = set(before) - set(after)
+    updated = {key for key in set(after) & set(before) if after[key] != before[key]}
+    return inserted, updated, deleted
+
+
+def changed_suburbs(changes):
+    return sorted({suburb for change in changes for suburb in change['suburbs']})
+
+
+def earliest_month(changes):
+    months = [month for change in changes for month in change['months']]
+    return min(months) if months else None
+
+
+class ChangeFeed:
+    """Read side of the properties_processed change feed.
+
+    The ETL appends a properties_changelog row for each load that changed
+    properties_processed and sends a NOTIFY on CHANNEL in the same
+    transaction. wait() blocks on that notification instead of polling the
+    table; changes_since() reads the log itself, so a consumer that was not
+    listening catches up from the last id it applied. Consumers that must
+    survive restarts keep that id in properties_change_offsets.
+
+    A feed that listens needs its own connection: listen() switches it to
+    autocommit, since notifications are only delivered between transactions.
+    Calls are serialised, so one feed can be shared across threads.
+    """
+
+    def __init__(self, db = None, config = None):
+        self.config = config or Config()
+        if db is None:
+            db = DatabaseSetup(config = self.config)
+            db.connect()
+        self.db = db
+        self.queries = QueryCatalog(db)
+        self.listening = False
+        self._lock = threading.RLock()
+        self.db.create_changelog_tables()
+
+    def latest_id(self):
+        with self._lock:
+            return self.queries.scalar('changelog_latest')
+
+    def changes_since(self, change_id):
+        """Changelog rows after change_id, oldest first, as dicts"""
+        with self._lock:
+            rows = self.queries.fetchall('changelog_since', (change_id,))
+        return [dict(zip(CHANGE_COLUMNS, row)) for row in rows]
+
+    def rows_for_suburbs(self, suburbs):
+        """The current properties_processed rows of the given suburbs"""
+        with self._lock:
+            return self.queries.read('processed_for_suburbs', (list(suburbs),))
+
+    def offset(self, consumer):
+        """The last change id consumer has applied (0 if none)"""
+        with self._lock:
+            return self.queries.scalar('change_offset', (consumer,))
+
+    def commit_offset(self, consumer, change_id):
+        query = """
+        INSERT INTO properties_change_offsets (consumer, change_id)
+        VALUES (%s, %s)
+        ON CONFLICT (consumer) DO UPDATE
+        SET change_id = EXCLUDED.change_id, updated_at = CURRENT_TIMESTAMP;
+        """
+        with self._lock:
+            try:
+                self.db.cursor.execute(query, (consumer, change_id))
+                self.db.conn.commit()
+            except Exception as e:
+                logger.error(f"error storing change offset for {consumer}: {e}")
+                self.db.conn.rollback()
+                raise
+
+    def listen(self):
+        with self._lock:
+            # end the transaction earlier reads opened before switching
+            self.db.conn.commit()
+            self.db.conn.autocommit = True
+            self.db.cursor.execute(sql.SQL("LISTEN {};").format(sql.Identifier(CHANNEL)))
+            self.listening = True
+        logger.info(f"Listening for changes on {CHANNEL}")
+
+    def _drain(self):
+        with self._lock:
+            self.db.conn.poll()
+            notifies = list(self.db.conn.notifies)
+            del self.db.conn.notifies[:]
+        return [json.loads(n.payload)['id'] for n in notifies if n.channel == CHANNEL]
+
+    def wait(self, timeout = None):
+        """Block until a change is notified or timeout seconds pass; returns the notified change ids"""
+        if not self.listening:
+            self.listen()
+        notified = self._drain()
+        if notified:
+            return notified
+        # sleep on the socket, not the lock, so other threads can query meanwhile
+        select.select([self.db.conn], [], [], timeout)
+        return self._drain()
+
+    def close(self):
+        self.db.close()
+
+
+class ChangeListener:
+    """Collects the changes a feed is notified about, on a background thread.
+
+    Consumers sharing one listener (dashboard sessions, an API's caches)
+    each remember the id they last applied and ask for changes_after(it),
+    then refresh only the suburbs and months those changes list.
+    """
+
+    def __init__(self, feed = None, config = None, timeout = None):
+        self.config = config or Config()
+        self.feed = feed or ChangeFeed(config = self.config)
+        self.timeout = timeout or self.config.CHANGE_FEED_WAIT_SECONDS
+        # changes before the listener started are already in the consumers' data
+        self.start_id = self.feed.latest_id()
+        self.changes = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target = self._run, name = 'change-listener', daemon = True)
+
+    def start(self):
+        self.feed.listen()
+        self._thread.start()
+        return self
+
+    def latest_id(self):
+        with self._lock:
+            return self.changes[-1]['id'] if self.changes else self.start_id
+
+    def changes_after(self, change_id):
+        with self._lock:
+            return [change for change in self.changes if change['id'] > change_id]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if not self.feed.wait(self.timeout):
+                    continue
+                new = self.feed.changes_since(self.latest_id())
+            except Exception as e:
+                logger.error(f"change listener stopped: {e}")
+                return
+            with self._lock:
+                self.changes.extend(new)
+            for change in new:
+                logger.info(f"Change {change['id']}: {len(change['suburbs'])} suburbs, "
+                            f"{len(change['months'])} months in {change['table_name']}")
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.feed.close()
+
+
+def main():
+    from src.timeseries import TimeSeriesRollup
+
+    parser = argparse.ArgumentParser(description = "Refresh the rollup tables whenever the ETL changes properties_processed")
+    parser.add_argument('--once', action = 'store_true', help = "apply pending changes and exit")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = configure(args)
+
+    feed = ChangeFeed(config = config)
+    rollup = TimeSeriesRollup(config = config)
+    # offsets are read and stored on the rollup's connection, not the listening one
+    rollup_feed = ChangeFeed(rollup.db, config)
+    try:
+        # catch up on anything logged while nobody was listening
+        if rollup.refresh_changes(rollup_feed) is not None:
+            rollup.export_csv()
+        while not args.once:
+            if feed.wait(config.CHANGE_FEED_WAIT_SECONDS) and rollup.refresh_changes(rollup_feed) is not None:
+                rollup.export_csv()
+    except KeyboardInterrupt:
+        logger.info("Change listener stopped")
+    finally:
+        feed.close()
+        rollup.close()
+
+
+if __name__ == "__main__":
+    main()
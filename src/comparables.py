@@ -0,0 +1,215 @@
+import argparse
+import functools
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from src.config import Config
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# a comparable sale matches on all of these exactly
+GROUP_COLUMNS = ['suburb', 'num_bed', 'is_house']
+# per-sale arrays kept for each group, sorted by property_size then date_sold
+ARRAY_COLUMNS = ['property_size', 'date_sold', 'price', 'num_bath']
+RESULT_COLUMNS = ['property_size', 'date_sold', 'price', 'price_per_sqm', 'num_bath']
+INPUT_COLUMNS = GROUP_COLUMNS + ARRAY_COLUMNS
+
+
+def _prepare(df):
+    """Rows usable as comparables, with typed group and array columns"""
+    frame = pd.DataFrame({
+        'suburb': df['suburb'].astype(str),
+        'num_bed': pd.to_numeric(df['num_bed'], errors='coerce'),
+        'is_house': df['is_house'].fillna(False).astype(bool),
+        'property_size': pd.to_numeric(df['property_size'], errors='coerce'),
+        'date_sold': pd.to_datetime(df['date_sold'], errors='coerce').values.astype('datetime64[D]'),
+        'price': pd.to_numeric(df['price'], errors='coerce'),
+        'num_bath': pd.to_numeric(df['num_bath'], errors='coerce'),
+    })
+    frame = frame[(frame['property_size'] > 0) & frame['num_bed'].notna() & frame['date_sold'].notna()]
+    frame['num_bed'] = frame['num_bed'].astype(np.int64)
+    return frame
+
+
+@functools.lru_cache(maxsize = 64)
+def _window_start(as_of, months):
+    return np.datetime64((pd.Timestamp(as_of) - pd.DateOffset(months = months)).date(), 'D')
+
+
+class ComparablesIndex:
+    """Comparable-sales lookup over properties_processed.
+
+    Sales are grouped by (suburb, num_bed, is_house); each group holds
+    parallel arrays sorted by property_size (then date_sold), so a comps
+    query is a dict lookup, two binary searches for the size window and a
+    date mask over just that window. Each group also keeps a content hash,
+    and refresh() re-sorts only the groups whose sales changed.
+    """
+
+    def __init__(self, config = None):
+        self.config = config or Config()
+        # (suburb, num_bed, is_house) -> {column: array}
+        self.groups = {}
+        self.hashes = {}
+        self.latest_sale = None
+
+    def __len__(self):
+        return sum(len(g['price']) for g in self.groups.values())
+
+    @staticmethod
+    def _group_hashes(frame):
+        # order-independent: sum of row hashes per group
+        row_hashes = pd.util.hash_pandas_object(frame[GROUP_COLUMNS + ARRAY_COLUMNS], index=False)
+        sums = row_hashes.groupby([frame[c] for c in GROUP_COLUMNS]).sum()
+        return {key: int(value) for key, value in sums.items()}
+
+    @staticmethod
+    def _build_group(rows):
+        order = np.lexsort((rows['date_sold'].to_numpy(), rows['property_size'].to_numpy()))
+        return {col: rows[col].to_numpy()[order] for col in ARRAY_COLUMNS}
+
+    @classmethod
+    def from_dataframe(cls, df, config = None):
+        index = cls(config)
+        index.refresh(df)
+        return index
+
+    def refresh(self, df):
+        """Bring the index in line with df, re-sorting only changed groups; returns the number rebuilt"""
+        frame = _prepare(df)
+        hashes = self._group_hashes(frame)
+        changed = {key for key, value in hashes.items() if self.hashes.get(key) != value}
+        removed = set(self.groups) - set(hashes)
+        for key in removed:
+            del self.groups[key]
+            del self.hashes[key]
+
+        if changed:
+            keys = pd.MultiIndex.from_frame(frame[GROUP_COLUMNS])
+            rows = frame[keys.isin(list(changed))]
+            for key, group in rows.groupby(GROUP_COLUMNS, sort = False):
+                self.groups[key] = self._build_group(group)
+                self.hashes[key] = hashes[key]
+        self.latest_sale = np.datetime64(frame['date_sold'].max(), 'D') if len(frame) else None
+        logger.info(f"Comparables index: {len(self.groups)} groups, "
+                    f"{len(changed)} rebuilt, {len(removed)} removed")
+        return len(changed)
+
+    def query(self, suburb, num_bed, is_house, property_size, tolerance = None, months = None, as_of = None):
+        """Arrays of the comparable sales (RESULT_COLUMNS), size-ordered.
+
+        Comparable: same suburb, bed count and house/apartment, property_size
+        within +-tolerance, sold in the `months` before as_of (default: the
+        latest sale in the index).
+        """
+        tolerance = self.config.COMPARABLES_SIZE_TOLERANCE if tolerance is None else tolerance
+        months = self.config.COMPARABLES_MONTHS if months is None else months
+        group = self.groups.get((suburb, int(num_bed), bool(is_house)))
+        if group is None:
+            return {col: np.empty(0) for col in RESULT_COLUMNS}
+
+        sizes = group['property_size']
+        lo = np.searchsorted(sizes, property_size * (1 - tolerance), side = 'left')
+        hi = np.searchsorted(sizes, property_size * (1 + tolerance), side = 'right')
+        as_of = np.datetime64(as_of, 'D') if as_of is not None else self.latest_sale
+        dates = group['date_sold'][lo:hi]
+        mask = (dates > _window_start(as_of, months)) & (dates <= as_of)
+
+        result = {col: group[col][lo:hi][mask] for col in ARRAY_COLUMNS}
+        result['price_per_sqm'] = result['price'] / result['property_size']
+        return result
+
+    def comparables(self, suburb, num_bed, is_house, property_size, **kwargs):
+        """query() as a DataFrame, most recent sale first"""
+        df = pd.DataFrame(self.query(suburb, num_bed, is_house, property_size, **kwargs))[RESULT_COLUMNS]
+        return df.sort_values('date_sold', ascending = False).reset_index(drop = True)
+
+    def save(self, filepath):
+        """Write the index as one .npz of concatenated group arrays"""
+        os.makedirs(os.path.dirname(filepath), exist_ok = True)
+        keys = list(self.groups)
+        lengths = np.array([len(self.groups[k]['price']) for k in keys], dtype = np.int64)
+        arrays = {
+            col: np.concatenate([self.groups[k][col] for k in keys]) if keys else np.empty(0)
+            for col in ARRAY_COLUMNS
+        }
+        tmp_path = f"{filepath}.tmp.npz"
+        np.savez(
+            tmp_path,
+            suburbs = np.array([k[0] for k in keys], dtype = str),
+            num_beds = np.array([k[1] for k in keys], dtype = np.int64),
+            is_house = np.array([k[2] for k in keys], dtype = bool),
+            hashes = np.array([self.hashes[k] for k in keys], dtype = np.uint64),
+            lengths = lengths,
+            latest_sale = np.array([self.latest_sale], dtype = 'datetime64[D]'),
+            **arrays
+        )
+        os.replace(tmp_path, filepath)
+        logger.info(f"Saved comparables index ({len(keys)} groups) to {filepath}")
+        return filepath
+
+    @classmethod
+    def load(cls, filepath, config = None):
+        index = cls(config)
+        with np.load(filepath) as data:
+            ends = np.cumsum(data['lengths'])
+            starts = ends - data['lengths']
+            arrays = {col: data[col] for col in ARRAY_COLUMNS}
+            keys = zip(data['suburbs'].tolist(), data['num_beds'].tolist(), data['is_house'].tolist())
+            for key, start, end, value in zip(keys, starts, ends, data['hashes'].tolist()):
+                index.groups[key] = {col: arrays[col][start:end] for col in ARRAY_COLUMNS}
+                index.hashes[key] = value
+            index.latest_sale = data['latest_sale'][0]
+        return index
+
+
+def load_or_build(df = None, filepath = None, config = None):
+    """The saved index refreshed against df, or a new one if there is none"""
+    config = config or Config()
+    filepath = filepath or config.COMPARABLES_PATH
+    if not os.path.exists(filepath):
+        return ComparablesIndex.from_dataframe(df, config)
+    index = ComparablesIndex.load(filepath, config)
+    if df is not None:
+        index.refresh(df)
+    return index
+
+
+def main():
+    from src.db_setup import DatabaseSetup
+    from src.queries import QueryCatalog
+
+    parser = argparse.ArgumentParser(description = "Build the comparables index and time comps queries")
+    parser.add_argument('--queries', type = int, default = 10000, help = "random comps queries to time")
+    args = parser.parse_args()
+
+    db = DatabaseSetup()
+    db.connect()
+    try:
+        df = QueryCatalog(db).read('valuation_features')
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    index = load_or_build(df)
+    logger.info(f"Index ready in {time.perf_counter() - started:.3f}s ({len(index):,} sales)")
+    index.save(Config().COMPARABLES_PATH)
+
+    sample = _prepare(df).sample(args.queries, replace = True, random_state = 0)
+    started = time.perf_counter()
+    found = 0
+    for row in sample.itertuples(index = False):
+        found += len(index.query(row.suburb, row.num_bed, row.is_house, row.property_size)['price'])
+    elapsed = time.perf_counter() - started
+    logger.info(f"{args.queries:,} comps queries in {elapsed:.3f}s "
+                f"({elapsed / args.queries * 1e6:.1f}us each, {found / args.queries:.1f} comps on average)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,359 @@
+import json
 import os
-from dotenv import load_dotenv
+from dotenv import dotenv_values, load_dotenv
 import getpass
 
 # Load environment variables
 load_dotenv()
 
+# environment variable naming a settings file (.json, or KEY=VALUE lines)
+CONFIG_FILE_ENV = 'PIPELINE_CONFIG_FILE'
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'off'}
+
+
+class ConfigError(ValueError):
+    """One or more settings are unknown or invalid"""
+
+
 class Config:
-    """Configuration for the pipeline"""
+    """Configuration for the pipeline.
+
+    The class attributes below are the defaults; each setting's type is its
+    default's type. load_config() layers a settings file, the environment
+    (variables named like the setting) and CLI overrides on top, validates
+    them and installs the result here, so Config() everywhere sees it.
+    Config(NAME=value, ...) is a validated copy with per-instance overrides;
+    the pipeline classes take one as their `config` argument.
+
+    An instance pickles with every resolved setting, so a config handed to
+    a worker process means the same there even if the worker was spawned
+    and only re-imported the defaults.
+    """
     
     # Database config
     DB_HOST = "localhost"
     DB_PORT = 5432
     DB_NAME = "property_data"
     DB_USER = "postgres"
-    DB_PASSWORD = os.getenv('DB_PASSWORD', '202304')
+    DB_PASSWORD = '202304'
+    DB_POOL_SIZE = 4
+
+    # Driver for catalog reads and DQ batches: 'psycopg2' or 'psycopg3'
+    # (NUMERIC decoded straight to float, pipelined batches, async reads)
+    DB_BACKEND = 'psycopg2'
+    # DataFrame reads (extract, analytics): 'rows' or 'arrow' (COPY streamed
+    # into Arrow record batches; needs pyarrow)
+    READ_FORMAT = 'rows'
+    # psycopg3 only: binary protocol for results and for the raw load's COPY.
+    # Off by default: NUMERIC has no C binary-to-float loader, so binary
+    # extracts decode prices in Python and run slower than text (see
+    # src/benchmark_backends.py)
+    PSYCOPG3_BINARY = False
+
+    # Where PropertyAnalytics runs its reports: 'postgres' or 'duckdb' (the
+    # latest processed snapshot, no server; spills to disk past the limit)
+    ANALYTICS_ENGINE = 'postgres'
+    DUCKDB_MEMORY_LIMIT = '1GB'
+    DUCKDB_TEMP_PATH = "data/duckdb_tmp"
     
     # Data paths
     RAW_DATA_PATH = "data/raw"
     PROCESSED_DATA_PATH = "data/processed"
+    SUBURB_CENTROIDS_PATH = "data/spatial/suburb_centroids.csv"
+    TIMESERIES_PATH = "data/timeseries/properties_timeseries.csv"
+    COMPARABLES_PATH = "data/comparables/comparables.npz"
+
+    # Processed snapshots (data/processed/manifest.json): the newest
+    # SNAPSHOT_KEEP_UNCOMPRESSED stay CSV, older ones are compressed, and
+    # snapshots beyond the count or age limit are deleted
+    SNAPSHOT_KEEP_UNCOMPRESSED = 2
+    SNAPSHOT_RETENTION_COUNT = 10
+    SNAPSHOT_RETENTION_DAYS = 90
+    # format compacted snapshots are stored in: 'auto' (parquet when pyarrow
+    # is installed, else csv.gz), 'parquet' or 'csv.gz'
+    SNAPSHOT_ARCHIVE_FORMAT = 'auto'
     
     # Data processing config
     REQUIRED_COLUMNS = ['price', 'suburb']
+
+    # Outlier stage: 'fixed' drops sales outside OUTLIER_MIN/MAX_PRICE;
+    # 'robust' flags sales more than OUTLIER_MAD_THRESHOLD robust deviations
+    # of log price from their suburb/type median (type-wide statistics for
+    # groups under OUTLIER_MIN_GROUP_ROWS sales). OUTLIER_ACTION 'quarantine'
+    # moves flagged sales to properties_outliers; 'flag' records them there
+    # and keeps them in properties_processed
+    OUTLIER_METHOD = 'robust'
+    OUTLIER_MIN_PRICE = 100000
+    OUTLIER_MAX_PRICE = 10000000
+    OUTLIER_MAD_THRESHOLD = 3.5
+    OUTLIER_MIN_GROUP_ROWS = 20
+    OUTLIER_ACTION = 'quarantine'
+
+    # Rows per chunk for the streaming CSV -> properties_raw load
+    RAW_LOAD_CHUNK_SIZE = 50000
+
+    # Transform processes (0 = one per core); frames smaller than
+    # PARALLEL_TRANSFORM_MIN_ROWS are always transformed in-process
+    TRANSFORM_WORKERS = 1
+    PARALLEL_TRANSFORM_MIN_ROWS = 100000
+
+    # Where the ETL transforms run: 'pandas' (extract -> transform -> load)
+    # or 'in_database' (one INSERT ... SELECT generated from the same steps)
+    ETL_MODE = 'pandas'
+
+    # How ETLPipeline.load_to_processed replaces properties_processed:
+    # 'swap' (staging table + atomic rename) or 'truncate' (in place), and
+    # how the pandas ETL writes the rows: 'copy' or 'execute_values' (in
+    # pages of EXECUTE_VALUES_PAGE_SIZE rows)
+    PROCESSED_LOAD_STRATEGY = 'swap'
+    PROCESSED_LOAD_METHOD = 'copy'
+    EXECUTE_VALUES_PAGE_SIZE = 1000
+
+    # 'flat' (properties_processed only) or 'star' (the ETL also loads
+    # fact_sales with dim_suburb/dim_property_type keys, and analytics read it).
+    # Star is additive: properties_processed is still loaded, since the
+    # sketches, valuation, comparables, rollups, change feed and checks read it
+    SCHEMA_MODE = 'flat'
+
+    # Spatial index config
+    SPATIAL_CELL_KM = 5.0
+
+    # Time-series config
+    ROLLING_WINDOW_MONTHS = 12
+
+    # Valuation model: segments with fewer sales use the pooled fit; suburb
+    # adjustments are shrunk by this many pseudo-sales
+    VALUATION_MIN_SEGMENT_ROWS = 50
+    VALUATION_SUBURB_SHRINKAGE = 10
+
+    # Comparable sales: +-size tolerance and look-back window
+    COMPARABLES_SIZE_TOLERANCE = 0.10
+    COMPARABLES_MONTHS = 12
+
+    # Sketch config (quantile relative error, HyperLogLog register bits)
+    SKETCH_RELATIVE_ACCURACY = 0.01
+    SKETCH_HLL_PRECISION = 12
     
+    # Local (non-Airflow) runner
+    PIPELINE_STATE_PATH = "data/pipeline_state.json"
+    LOCAL_RUNNER_PROCESSES = 1
+
+    # Stage-output cache; stages whose inputs, code and settings are unchanged
+    # are skipped
+    ARTIFACT_CACHE_ENABLED = True
+    ARTIFACT_CACHE_PATH = "data/cache"
+    ARTIFACT_CACHE_MAX_MB = 500
+    ARTIFACT_CACHE_MAX_ENTRIES = 256
+    # entries older than this are misses (0 = no expiry)
+    ARTIFACT_CACHE_TTL_HOURS = 0
+
+    # Dashboard data and index caches are rebuilt after this long (0 = never)
+    DASHBOARD_CACHE_TTL_SECONDS = 0
+
+    # Change feed: each ETL load that changes properties_processed is logged
+    # in properties_changelog (changed suburbs and months) and NOTIFYs
+    # listeners, which refresh only those; a listener also wakes every
+    # CHANGE_FEED_WAIT_SECONDS to check it should keep running
+    CHANGE_FEED_ENABLED = True
+    CHANGE_FEED_WAIT_SECONDS = 5
+
+    # Catalog queries are PREPAREd on a connection after this many plain
+    # executions (0 = prepare on first use)
+    QUERY_PREPARE_THRESHOLD = 1
+
     # Logging
-    LOG_LEVEL = "INFO"
\ No newline at end of file
+    LOG_LEVEL = "INFO"
+
+    def __init__(self, **overrides):
+        if not overrides:
+            return
+        values = self.to_dict()
+        values.update(_coerce_all(overrides))
+        validate(values)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    @classmethod
+    def names(cls):
+        return [name for name in vars(cls) if name.isupper()]
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.names()}
+
+
+# the built-in defaults, before any file/environment/CLI layer
+DEFAULTS = {name: getattr(Config, name) for name in Config.names()}
+
+# allowed values of the enumerated settings
+CHOICES = {
+    'DB_BACKEND': ['psycopg2', 'psycopg3'],
+    'READ_FORMAT': ['rows', 'arrow'],
+    'ANALYTICS_ENGINE': ['postgres', 'duckdb'],
+    'SNAPSHOT_ARCHIVE_FORMAT': ['auto', 'parquet', 'csv.gz'],
+    'OUTLIER_METHOD': ['fixed', 'robust'],
+    'OUTLIER_ACTION': ['quarantine', 'flag'],
+    'ETL_MODE': ['pandas', 'in_database'],
+    'PROCESSED_LOAD_STRATEGY': ['swap', 'truncate'],
+    'PROCESSED_LOAD_METHOD': ['copy', 'execute_values'],
+    'SCHEMA_MODE': ['flat', 'star'],
+    'LOG_LEVEL': ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+}
+
+# lower bounds of the numeric settings
+MINIMUMS = {
+    'DB_PORT': 1,
+    'DB_POOL_SIZE': 1,
+    'SNAPSHOT_KEEP_UNCOMPRESSED': 0,
+    'SNAPSHOT_RETENTION_COUNT': 1,
+    'SNAPSHOT_RETENTION_DAYS': 1,
+    'OUTLIER_MIN_PRICE': 0,
+    'OUTLIER_MAD_THRESHOLD': 0,
+    'OUTLIER_MIN_GROUP_ROWS': 1,
+    'RAW_LOAD_CHUNK_SIZE': 1,
+    'TRANSFORM_WORKERS': 0,
+    'PARALLEL_TRANSFORM_MIN_ROWS': 0,
+    'EXECUTE_VALUES_PAGE_SIZE': 1,
+    'SPATIAL_CELL_KM': 0.1,
+    'ROLLING_WINDOW_MONTHS': 1,
+    'VALUATION_MIN_SEGMENT_ROWS': 1,
+    'VALUATION_SUBURB_SHRINKAGE': 0,
+    'COMPARABLES_SIZE_TOLERANCE': 0,
+    'COMPARABLES_MONTHS': 1,
+    'SKETCH_RELATIVE_ACCURACY': 0.0001,
+    'SKETCH_HLL_PRECISION': 4,
+    'LOCAL_RUNNER_PROCESSES': 1,
+    'ARTIFACT_CACHE_MAX_MB': 1,
+    'ARTIFACT_CACHE_MAX_ENTRIES': 1,
+    'ARTIFACT_CACHE_TTL_HOURS': 0,
+    'DASHBOARD_CACHE_TTL_SECONDS': 0,
+    'CHANGE_FEED_WAIT_SECONDS': 1,
+    'QUERY_PREPARE_THRESHOLD': 0,
+}
+
+
+def _coerce(name, value):
+    """value as the type of the setting's default; strings (env, CLI, KEY=VALUE files) are parsed"""
+    if name not in DEFAULTS:
+        raise ConfigError(f"Unknown setting: {name}")
+    default = DEFAULTS[name]
+    if not isinstance(value, str) or isinstance(default, str):
+        return value
+    text = value.strip()
+    try:
+        if isinstance(default, bool):
+            if text.lower() in TRUE_VALUES:
+                return True
+            if text.lower() in FALSE_VALUES:
+                return False
+            raise ValueError(text)
+        if isinstance(default, int):
+            return int(text)
+        if isinstance(default, float):
+            return float(text)
+        if isinstance(default, list):
+            return [item.strip() for item in text.split(',') if item.strip()]
+    except ValueError:
+        raise ConfigError(f"{name}: expected {type(default).__name__}, got {value!r}") from None
+    return value
+
+
+def _coerce_all(values):
+    errors = []
+    coerced = {}
+    for name, value in values.items():
+        try:
+            coerced[name] = _coerce(name, value)
+        except ConfigError as e:
+            errors.append(str(e))
+    if errors:
+        raise ConfigError("Invalid configuration:\n  " + "\n  ".join(errors))
+    return coerced
+
+
+def validate(values):
+    """Check types, choices and bounds of a full {name: value} settings dict; raises ConfigError"""
+    errors = []
+    for name, value in values.items():
+        expected = type(DEFAULTS[name])
+        # ints are fine where a float is expected, bools never stand in for numbers
+        ok = isinstance(value, expected) and not (expected is not bool and isinstance(value, bool))
+        if expected is float and isinstance(value, int) and not isinstance(value, bool):
+            ok = True
+        if not ok:
+            errors.append(f"{name}: expected {expected.__name__}, got {value!r}")
+            continue
+        if name in CHOICES and value not in CHOICES[name]:
+            errors.append(f"{name}: {value!r} is not one of {CHOICES[name]}")
+        if name in MINIMUMS and value < MINIMUMS[name]:
+            errors.append(f"{name}: {value!r} is below the minimum of {MINIMUMS[name]}")
+    if not errors and values['OUTLIER_MIN_PRICE'] >= values['OUTLIER_MAX_PRICE']:
+        errors.append("OUTLIER_MIN_PRICE must be below OUTLIER_MAX_PRICE")
+    if errors:
+        raise ConfigError("Invalid configuration:\n  " + "\n  ".join(errors))
+
+
+def read_config_file(path):
+    """{name: value} from a .json object or a KEY=VALUE (dotenv-style) file"""
+    if path.endswith('.json'):
+        with open(path) as f:
+            values = json.load(f)
+        if not isinstance(values, dict):
+            raise ConfigError(f"{path}: expected a JSON object of settings")
+        return values
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    return dict(dotenv_values(path))
+
+
+def load_config(path = None, overrides = None, environ = None):
+    """Install defaults < settings file < environment < overrides on Config and validate.
+
+    path defaults to $PIPELINE_CONFIG_FILE; overrides are {name: value} or
+    'NAME=VALUE' strings (the CLI --set form). Returns a Config holding the
+    result.
+    """
+    environ = os.environ if environ is None else environ
+    path = path or environ.get(CONFIG_FILE_ENV)
+    values = dict(DEFAULTS)
+    if path:
+        values.update(_coerce_all(read_config_file(path)))
+    values.update(_coerce_all({name: environ[name] for name in DEFAULTS if name in environ}))
+    if overrides and not isinstance(overrides, dict):
+        overrides = dict(_split_override(item) for item in overrides)
+    values.update(_coerce_all(overrides or {}))
+    validate(values)
+    for name, value in values.items():
+        setattr(Config, name, value)
+    # the settings also live on the returned instance, for worker processes
+    return Config(**values)
+
+
+def _split_override(item):
+    name, sep, value = item.partition('=')
+    if not sep:
+        raise ConfigError(f"Expected NAME=VALUE, got {item!r}")
+    return name.strip(), value
+
+
+def add_config_arguments(parser):
+    """--config/--set options for a module's command line; pass the parsed args to configure()"""
+    parser.add_argument('--config', dest = 'config_file', help = "settings file (.json or KEY=VALUE lines)")
+    parser.add_argument('--set', dest = 'overrides', action = 'append', default = [], metavar = 'NAME=VALUE',
+                        help = "override one setting (repeatable)")
+    return parser
+
+
+def configure(args):
+    """Apply a parsed command line's --config/--set on top of the environment"""
+    return load_config(args.config_file, args.overrides)
+
+
+# validated at startup: a bad setting fails here rather than mid-run
+load_config()
\ No newline at end of file
@@ -0,0 +1,216 @@
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from src.config import add_config_arguments, configure
+from src.dashboard_views import (
+    DashboardFilters, DashboardResources, build_views, filter_options, prepare_data, price_bounds
+)
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# the file app/dashboard.py reads, under PROCESSED_DATA_PATH
+DATA_FILE = 'properties_processed_latest.csv'
+# a concurrency level saturates the CPU when it adds less throughput than this
+SATURATION_GAIN = 1.10
+
+
+def scale_frame(df, scale):
+    """df repeated `scale` times, for the 10x/100x data volumes"""
+    if scale == 1:
+        return df
+    return pd.concat([df] * scale, ignore_index = True)
+
+
+class SessionSimulator:
+    """One browser session: a random walk over the sidebar and comps widgets.
+
+    Each rerun changes one widget, as a user clicking around does, then runs
+    everything the dashboard script computes for that selection and
+    serialises the figures the way st.plotly_chart does before sending them.
+    """
+
+    def __init__(self, resources, options, seed = None):
+        self.resources = resources
+        self.options = options
+        self.rng = random.Random(seed)
+        self.bounds = price_bounds(resources.df)
+        self.filters = DashboardFilters()
+        self.comps = (self.rng.choice(options['suburb']), 3, True, 500)
+
+    def step(self):
+        """Change one filter at random"""
+        widget = self.rng.choice(['price_range', 'property_type', 'distance', 'near_suburb', 'use_sketches', 'comps'])
+        if widget == 'price_range':
+            low, high = sorted(self.rng.uniform(*self.bounds) for _ in range(2))
+            self.filters.price_range = self.rng.choice([None, (int(low), int(high))])
+        elif widget == 'near_suburb':
+            self.filters.near_suburb = self.rng.choice(self.options['near_suburb'])
+            self.filters.radius_km = self.rng.randint(1, 50)
+        elif widget == 'use_sketches':
+            self.filters.use_sketches = not self.filters.use_sketches
+        elif widget == 'comps':
+            self.comps = (
+                self.rng.choice(self.options['suburb']),
+                self.rng.randint(1, 5),
+                self.rng.random() < 0.5,
+                self.rng.choice([80, 150, 300, 500, 800])
+            )
+        else:
+            setattr(self.filters, widget, self.rng.choice(self.options[widget]))
+
+    def rerun(self):
+        """One script rerun; returns its latency in seconds"""
+        started = time.perf_counter()
+        views = build_views(self.resources, self.filters, self.comps)
+        for view in views.values():
+            if hasattr(view, 'to_json'):
+                view.to_json()
+        return time.perf_counter() - started
+
+    def run(self, reruns):
+        latencies = []
+        for _ in range(reruns):
+            self.step()
+            latencies.append(self.rerun())
+        return latencies
+
+
+def load_resources(df, config = None, prebuild = True):
+    """Shared resources; with prebuild, every lazily built index is already in place"""
+    resources = DashboardResources(df, config)
+    if not prebuild:
+        # cold start: the first reruns build the indexes, as after an app restart
+        return resources
+    started = time.perf_counter()
+    for name in ['sketch_store', 'valuation_model', 'comparables_index', 'timeseries']:
+        getattr(resources, name)
+    logger.info(f"Built dashboard resources for {len(df):,} rows in {time.perf_counter() - started:.2f}s")
+    return resources
+
+
+def session_memory(resources, options, reruns, seed):
+    """Peak MB a single session allocates over its reruns (tracemalloc, no other sessions running)"""
+    simulator = SessionSimulator(resources, options, seed)
+    tracemalloc.start()
+    try:
+        simulator.run(reruns)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 ** 2
+
+
+def run_sessions(resources, options, sessions, reruns, seed):
+    """`sessions` concurrent sessions on one process, as streamlit runs them (one thread each).
+
+    first_rerun_ms is the slowest session's first rerun: on cold resources it
+    includes waiting for the shared indexes to be built.
+    """
+    simulators = [SessionSimulator(resources, options, seed + i) for i in range(sessions)]
+    barrier = threading.Barrier(sessions)
+
+    def run(simulator):
+        barrier.wait()
+        return simulator.run(reruns)
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = sessions) as pool:
+        per_session = list(pool.map(run, simulators))
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    latencies = np.concatenate(per_session)
+    return {
+        'sessions': sessions,
+        'reruns': len(latencies),
+        'first_rerun_ms': max(session[0] for session in per_session) * 1000,
+        'p50_ms': np.percentile(latencies, 50) * 1000,
+        'p95_ms': np.percentile(latencies, 95) * 1000,
+        'p99_ms': np.percentile(latencies, 99) * 1000,
+        'reruns_per_s': len(latencies) / wall,
+        'cpu_pct': 100 * cpu / wall / (os.cpu_count() or 1),
+    }
+
+
+def saturation_point(report):
+    """Fewest sessions past which adding sessions stops adding throughput"""
+    throughput = report['reruns_per_s'].tolist()
+    for i in range(1, len(throughput)):
+        if throughput[i] < throughput[i - 1] * SATURATION_GAIN:
+            return int(report['sessions'].iloc[i - 1])
+    return None
+
+
+def run_scale(df, scale, session_levels, reruns, seed, config = None, cold_start = True):
+    """Latency/CPU per concurrency level and per-session memory at one data scale.
+
+    'warm' rows share prebuilt resources; 'cold' rows start each level on
+    fresh resources, so the sessions' first reruns build (and wait on) the
+    indexes. Saturation is judged on the warm rows.
+    """
+    frame = scale_frame(df, scale)
+    resources = load_resources(frame, config)
+    options = filter_options(resources.df, resources.spatial_index)
+    options['suburb'] = sorted(resources.df['suburb'].dropna().unique().tolist())
+
+    memory_mb = session_memory(resources, options, reruns, seed)
+    report = pd.DataFrame([
+        run_sessions(resources, options, sessions, reruns, seed) for sessions in session_levels
+    ])
+    report.insert(0, 'start', 'warm')
+    saturated = saturation_point(report)
+    if cold_start:
+        cold = pd.DataFrame([
+            run_sessions(load_resources(frame, config, prebuild = False), options, sessions, reruns, seed)
+            for sessions in session_levels
+        ])
+        cold.insert(0, 'start', 'cold')
+        report = pd.concat([report, cold], ignore_index = True)
+    report.insert(0, 'scale', f"{scale}x")
+    report['session_peak_mb'] = memory_mb
+    logger.info(f"{scale}x ({len(resources.df):,} rows): CPU saturates at "
+                f"{saturated if saturated else f'more than {max(session_levels)}'} concurrent sessions")
+    return report, saturated
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Load test the dashboard's data and figure code without a browser")
+    parser.add_argument('--scales', type = int, nargs = '+', default = [1, 10, 100], help = "data volumes (copies of the dataset)")
+    parser.add_argument('--sessions', type = int, nargs = '+', default = [1, 2, 4, 8, 16], help = "concurrent session counts")
+    parser.add_argument('--reruns', type = int, default = 20, help = "reruns per session")
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--no-cold-start', action = 'store_true', help = "skip the runs on fresh (unbuilt) resources")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = configure(args)
+
+    # keep the report readable
+    logging.getLogger('src').setLevel(logging.WARNING)
+    df = prepare_data(pd.read_csv(os.path.join(config.PROCESSED_DATA_PATH, DATA_FILE)))
+
+    reports = []
+    saturation = {}
+    for scale in args.scales:
+        report, saturation[f"{scale}x"] = run_scale(
+            df, scale, sorted(args.sessions), args.reruns, args.seed, config, not args.no_cold_start)
+        reports.append(report)
+    report = pd.concat(reports, ignore_index = True)
+    logger.info(f"\n=== Dashboard rerun load test ({args.reruns} reruns per session, "
+                f"{os.cpu_count()} cores) ===\n{report.round(1).to_string(index = False)}")
+    logger.info(f"Saturation (sessions): {saturation}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
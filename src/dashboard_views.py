@@ -0,0 +1,387 @@
+import logging
+import os
+import threading
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from src.change_feed import changed_suburbs
+from src.comparables import ComparablesIndex
+from src.config import Config
+from src.sketches import SketchStore
+from src.spatial import SuburbSpatialIndex
+from src.timeseries import ALL_SEGMENT, build_rollups
+from src.valuation import ValuationModel
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# everything below is streamlit-free, so app/dashboard.py and the load test
+# (src/dashboard_load_test.py) run exactly the same data and figure code
+
+HOUSE_COLORS = {True: '#FF6B6B', False: '#4ECDC4'}
+
+
+def prepare_data(df):
+    """The dashboard frame from the processed CSV"""
+    if 'date_sold' in df.columns:
+        df['date_sold'] = pd.to_datetime(df['date_sold'], errors='coerce')
+    return df
+
+
+class DashboardResources:
+    """Indexes and models built once per data load and shared by every session"""
+
+    def __init__(self, df, config = None):
+        self.config = config or Config()
+        self.df = df
+        self.spatial_index = None
+        if os.path.exists(self.config.SUBURB_CENTROIDS_PATH):
+            self.spatial_index = SuburbSpatialIndex.from_csv(
+                self.config.SUBURB_CENTROIDS_PATH, cell_km = self.config.SPATIAL_CELL_KM)
+        self._sketch_store = None
+        self._valuation_model = None
+        self._comparables_index = None
+        self._timeseries = None
+        # last change feed entry applied to df (None until the first sync)
+        self.change_id = None
+        # guards df and the lazy members: sessions read them while sync() swaps them
+        self._lock = threading.RLock()
+
+    def sync(self, listener):
+        """Apply the changes a ChangeListener has seen since the last sync; returns the suburbs refreshed"""
+        with self._lock:
+            if self.change_id is None:
+                self.change_id = listener.start_id
+            changes = listener.changes_after(self.change_id)
+            if not changes:
+                return []
+            suburbs = changed_suburbs(changes)
+            self.apply_changes(listener.feed.rows_for_suburbs(suburbs), suburbs)
+            self.change_id = changes[-1]['id']
+            logger.info(f"Applied changes up to {self.change_id}: {len(suburbs)} suburbs reloaded")
+            return suburbs
+
+    def apply_changes(self, rows, suburbs):
+        """Replace the sales of the given suburbs with rows, rebuilding only what depends on them"""
+        with self._lock:
+            keep = ~self.df['suburb'].isin(suburbs)
+            self.df = pd.concat([self.df[keep], prepare_data(rows)], ignore_index = True)
+            if self._comparables_index is not None:
+                # re-sorts only the changed suburbs' groups
+                self._comparables_index.refresh(self.df)
+            # the rest are rebuilt (or the rollup CSV re-read) on next use
+            self._sketch_store = None
+            self._valuation_model = None
+            self._timeseries = None
+
+    @property
+    def sketch_store(self):
+        with self._lock:
+            if self._sketch_store is None:
+                self._sketch_store = SketchStore.from_dataframe(
+                    self.df,
+                    relative_accuracy = self.config.SKETCH_RELATIVE_ACCURACY,
+                    precision = self.config.SKETCH_HLL_PRECISION
+                )
+            return self._sketch_store
+
+    @property
+    def valuation_model(self):
+        with self._lock:
+            if self._valuation_model is None:
+                self._valuation_model = ValuationModel(config = self.config).fit(self.df)
+            return self._valuation_model
+
+    @property
+    def comparables_index(self):
+        with self._lock:
+            if self._comparables_index is None:
+                self._comparables_index = ComparablesIndex.from_dataframe(self.df, self.config)
+            return self._comparables_index
+
+    @property
+    def timeseries(self):
+        """The exported rollup table, or one built from the loaded data"""
+        with self._lock:
+            if self._timeseries is None:
+                if os.path.exists(self.config.TIMESERIES_PATH):
+                    timeseries = pd.read_csv(self.config.TIMESERIES_PATH)
+                else:
+                    timeseries = build_rollups(self.df, window_months = self.config.ROLLING_WINDOW_MONTHS)
+                timeseries['period_start'] = pd.to_datetime(timeseries['period_start'])
+                self._timeseries = timeseries
+            return self._timeseries
+
+
+class DashboardFilters:
+    """One session's sidebar selection"""
+
+    def __init__(self, price_range = None, property_type = 'All', distance = 'All',
+                 near_suburb = 'All', radius_km = 10, use_sketches = False):
+        self.price_range = price_range
+        self.property_type = property_type
+        self.distance = distance
+        self.near_suburb = near_suburb
+        self.radius_km = radius_km
+        self.use_sketches = use_sketches
+
+    def __repr__(self):
+        return f"DashboardFilters({self.__dict__})"
+
+
+def price_bounds(df):
+    return int(df['price'].min()), int(df['price'].max())
+
+
+def filter_options(df, spatial_index = None):
+    """Choices for the sidebar selectboxes"""
+    return {
+        'property_type': ['All'] + sorted(df['type'].unique().tolist()),
+        'distance': ['All'] + sorted(df['distance_category'].dropna().unique().tolist()),
+        'near_suburb': ['All'] + sorted(spatial_index.suburbs.tolist()) if spatial_index is not None else ['All'],
+    }
+
+
+def apply_filters(df, filters, spatial_index = None):
+    price_range = filters.price_range or price_bounds(df)
+    filtered_df = df[(df['price'] >= price_range[0]) & (df['price'] <= price_range[1])]
+
+    if filters.property_type != 'All':
+        filtered_df = filtered_df[filtered_df['type'] == filters.property_type]
+
+    if filters.distance != 'All':
+        filtered_df = filtered_df[filtered_df['distance_category'] == filters.distance]
+
+    if spatial_index is not None and filters.near_suburb != 'All':
+        nearby = spatial_index.within_radius(filters.near_suburb, filters.radius_km)
+        filtered_df = filtered_df[filtered_df['suburb'].isin(nearby['suburb'])]
+    return filtered_df
+
+
+def select_sketch(resources, filters):
+    """Merged sketch for the selection, or None when the filters need exact rows.
+
+    Sketches are kept per (type, distance_category), so they can only answer
+    filters on those columns.
+    """
+    full_range = filters.price_range is None or tuple(filters.price_range) == price_bounds(resources.df)
+    if not (filters.use_sketches and full_range and filters.near_suburb == 'All'):
+        return None
+    return resources.sketch_store.merged(
+        types = None if filters.property_type == 'All' else {filters.property_type},
+        distance_categories = None if filters.distance == 'All' else {filters.distance}
+    )
+
+
+def key_metrics(df, filtered_df, sketch = None):
+    """(label, value, delta) of each KPI metric"""
+    avg_price = filtered_df['price'].mean()
+    avg_sqm = filtered_df['price_per_sqm'].mean()
+    if sketch is not None:
+        num_suburbs = sketch.suburbs.estimate()
+    else:
+        num_suburbs = filtered_df['suburb'].nunique()
+    return [
+        ("Total Properties", f"{len(filtered_df):,}", f"{len(filtered_df) - len(df):,} filtered"),
+        ("Average Price", f"${avg_price:,.0f}", None),
+        ("Avg Price/Sqm", f"${avg_sqm:,.0f}" if pd.notnull(avg_sqm) else "N/A", None),
+        ("Suburbs", f"{'~' if sketch is not None else ''}{num_suburbs:,}", None),
+    ]
+
+
+def price_histogram(filtered_df, sketch = None):
+    if sketch is not None:
+        price_hist = sketch.price.histogram(bins = 50)
+        fig_hist = px.bar(
+            x=(price_hist['bin_start'] + price_hist['bin_end']) / 2,
+            y=price_hist['count'],
+            title='Property Price Distribution (approximate)',
+            labels = {'x': 'Price($)', 'y': 'Number of Properties'}
+        )
+        fig_hist.update_traces(width=(price_hist['bin_end'] - price_hist['bin_start']).iloc[0] if len(price_hist) else None)
+    else:
+        fig_hist = px.histogram(
+            filtered_df,
+            x='price',
+            nbins=50,
+            title='Property Price Distribution',
+            labels = {'price': 'Price($)', 'count': 'Number of Properties'}
+        )
+    fig_hist.update_layout(showlegend = False)
+    return fig_hist
+
+
+def distance_pie(filtered_df):
+    distance_counts = filtered_df['distance_category'].value_counts()
+    return px.pie(
+        values = distance_counts.values,
+        names=distance_counts.index,
+        title = 'Distribution by Distance from CBD'
+    )
+
+
+def price_vs_distance(filtered_df):
+    return px.scatter(
+        filtered_df,
+        x='km_from_cbd',
+        y='price',
+        color='is_house',
+        size='num_bed',
+        hover_data=['suburb', 'type', 'num_bed', 'num_bath'],
+        title='Property Price vs Distance from CBD',
+        labels={
+            'km_from_cbd':'Distance from CBD(km)',
+            'price': 'Price($)',
+            'is_House': 'Property Type'
+        },
+        color_discrete_map=HOUSE_COLORS
+    )
+
+
+def price_trend(timeseries, filters):
+    if filters.distance != 'All':
+        segment_type, segment = 'distance_category', filters.distance
+    else:
+        segment_type, segment = 'all', ALL_SEGMENT
+    series = timeseries[
+        (timeseries['period_type'] == 'month')
+        & (timeseries['segment_type'] == segment_type)
+        & (timeseries['segment'] == segment)
+    ]
+    window = series['rolling_window_months'].dropna()
+    rolling_label = f"{int(window.iloc[0])}-month rolling median" if len(window) else 'rolling median'
+    return px.line(
+        series.rename(columns={'rolling_median_price': rolling_label}),
+        x='period_start',
+        y=['median_price', rolling_label],
+        title=f'Monthly Median Price: {segment}',
+        labels={'period_start': 'Month', 'value': 'Price($)', 'variable': 'Series'}
+    )
+
+
+def suburb_table(filtered_df):
+    suburb_stats = filtered_df.groupby('suburb').agg({
+        'price':['count', 'mean', 'max'],
+        'km_from_cbd': 'mean'
+    }).round(2)
+
+    suburb_stats.columns=['Count', 'Avg Price', 'Max Price', 'Avg Distance (km)']
+    suburb_stats = suburb_stats.sort_values('Avg Price', ascending=False)
+    suburb_stats['Avg Price']=suburb_stats['Avg Price'].apply(lambda x: f"${x:,.0f}")
+    suburb_stats['Max Price']=suburb_stats['Max Price'].apply(lambda x: f"${x:,.0f}")
+    return suburb_stats
+
+
+def _house_apt_bar(values, title, yaxis_title, text):
+    """Apartment/House bar chart from a Series indexed by is_house, or None if empty"""
+    categories = []
+    heights = []
+    colors = []
+    for is_house, label in [(False, 'Apartment'), (True, 'House')]:
+        if is_house in values.index:
+            categories.append(label)
+            heights.append(values[is_house])
+            colors.append(HOUSE_COLORS[is_house])
+    if len(categories) == 0:
+        return None
+
+    fig = go.Figure(data=[
+        go.Bar(
+            x=categories,
+            y=heights,
+            marker_color=colors,
+            text=text(heights),
+            textposition='outside'
+        )
+    ])
+    fig.update_layout(
+        title=title,
+        yaxis_title=yaxis_title,
+        showlegend=False
+    )
+    return fig
+
+
+def house_vs_apt(filtered_df):
+    """(average price figure, count figure); None for either with no data"""
+    if len(filtered_df) == 0 or 'is_house' not in filtered_df.columns:
+        return None, None
+    fig_bar = _house_apt_bar(
+        filtered_df.groupby('is_house')['price'].mean(),
+        'Average Price: House vs Apartment', 'Average Price ($)',
+        lambda values: [f'${v:,.0f}' for v in values]
+    )
+    fig_count = _house_apt_bar(
+        filtered_df['is_house'].value_counts(),
+        'Property Count: House vs Apartment', 'Number of Properties',
+        lambda values: values
+    )
+    return fig_bar, fig_count
+
+
+def fair_value(model, filtered_df):
+    """(fair value scatter, most undervalued sales table), or (None, None) with no rows"""
+    if len(filtered_df) == 0:
+        return None, None
+    valued = model.residuals(filtered_df)
+    fig_value = px.scatter(
+        valued,
+        x='fair_value',
+        y='price',
+        color='is_house',
+        hover_data=['suburb', 'type', 'num_bed', 'num_bath', 'residual_pct'],
+        title='Sale Price vs Modelled Fair Value',
+        labels={'fair_value': 'Fair Value($)', 'price': 'Price($)'},
+        color_discrete_map=HOUSE_COLORS
+    )
+
+    undervalued = valued.sort_values('residual_pct').head(10)[
+        ['suburb', 'type', 'num_bed', 'num_bath', 'price', 'fair_value', 'residual_pct']
+    ]
+    undervalued.columns = ['Suburb', 'Type', 'Beds', 'Baths', 'Price', 'Fair Value', 'vs Fair Value (%)']
+    undervalued['Price'] = undervalued['Price'].apply(lambda x: f"${x:,.0f}")
+    undervalued['Fair Value'] = undervalued['Fair Value'].apply(lambda x: f"${x:,.0f}")
+    return fig_value, undervalued
+
+
+def comparable_sales(index, suburb, num_bed, is_house, property_size):
+    """(comps table, median comparable price) for the comps panel; (None, None) if no comps"""
+    comps = index.comparables(suburb, num_bed, is_house, property_size)
+    if len(comps) == 0:
+        return None, None
+    comps_display = comps.copy()
+    comps_display.columns = ['Size (sqm)', 'Date Sold', 'Price', 'Price/Sqm', 'Baths']
+    comps_display['Price'] = comps_display['Price'].apply(lambda x: f"${x:,.0f}")
+    comps_display['Price/Sqm'] = comps_display['Price/Sqm'].apply(lambda x: f"${x:,.0f}")
+    return comps_display, comps['price'].median()
+
+
+def build_views(resources, filters, comps = None):
+    """Everything one dashboard rerun computes, by panel name.
+
+    comps: (suburb, num_bed, is_house, property_size) for the comps panel.
+    """
+    df = resources.df
+    filtered_df = apply_filters(df, filters, resources.spatial_index)
+    sketch = select_sketch(resources, filters)
+    fig_bar, fig_count = house_vs_apt(filtered_df)
+    fig_value, undervalued = fair_value(resources.valuation_model, filtered_df)
+    views = {
+        'filtered_df': filtered_df,
+        'metrics': key_metrics(df, filtered_df, sketch),
+        'price_histogram': price_histogram(filtered_df, sketch),
+        'distance_pie': distance_pie(filtered_df),
+        'price_vs_distance': price_vs_distance(filtered_df),
+        'price_trend': price_trend(resources.timeseries, filters),
+        'suburb_table': suburb_table(filtered_df),
+        'house_vs_apt_price': fig_bar,
+        'house_vs_apt_count': fig_count,
+        'fair_value': fig_value,
+        'undervalued': undervalued,
+    }
+    if comps is not None:
+        views['comparables'], views['comparables_median'] = comparable_sales(resources.comparables_index, *comps)
+    return views
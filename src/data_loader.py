@@ -1,7 +1,10 @@
+import argparse
 import pandas as pd
 import logging
-from datetime import datetime
-from src.config import Config
+import sys
+from src.config import Config, add_config_arguments, configure
+from src.artifact_cache import fingerprint_file
+from src.snapshots import SnapshotManager
 
 logging.basicConfig(
     level = logging.INFO,
@@ -12,8 +15,8 @@ logger = logging.getLogger(__name__)
 class DataLoader:
     # Load and process property data from CSV
 
-    def __init__(self):
-        self.config = Config()
+    def __init__(self, config = None):
+        self.config = config or Config()
 
     def load_raw_data(self, filename = 'housing_data.csv'):
         filepath = f"{self.config.RAW_DATA_PATH}/{filename}"
@@ -77,16 +80,50 @@ class DataLoader:
 
     def save_processed_data(self, df, filename = None):
         if filename is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"properties_processed_{timestamp}.csv"
+            # versioned snapshot; old ones are compacted and expired
+            _, filepath = SnapshotManager(self.config.PROCESSED_DATA_PATH, config = self.config).save(df)
+            return filepath
         
         filepath = f"{self.config.PROCESSED_DATA_PATH}/{filename}"
         df.to_csv(filepath, index = False)
         logger.info(f"Saved processed data to {filepath}")
         return filepath
 
+    def prepare_processed_data(self, cache = None, filename = 'housing_data.csv'):
+        """Load, clean and snapshot the raw CSV, or reuse the cached snapshot.
+
+        The clean_data cache entry is keyed by the raw file's contents and
+        this module's source and points at the snapshot it produced; it is
+        reused while that snapshot is still an uncompacted CSV.
+        """
+        if cache is None:
+            df_clean = self.clean_data(self.load_raw_data(filename))
+            return self.save_processed_data(df_clean)
+
+        snapshots = SnapshotManager(self.config.PROCESSED_DATA_PATH, config = self.config)
+        raw_path = f"{self.config.RAW_DATA_PATH}/{filename}"
+        key = cache.key(
+            'clean_data',
+            inputs = {'raw': fingerprint_file(raw_path)},
+            code = [sys.modules[__name__]]
+        )
+        entry = cache.get(key)
+        if entry is not None:
+            snapshot = snapshots.get(entry['meta'].get('snapshot'))
+            if snapshot is not None and snapshot['format'] == 'csv':
+                logger.info(f"Raw data unchanged, reusing snapshot {snapshot['path']}")
+                return snapshot['path']
+
+        df = self.load_raw_data(filename)
+        self.explore_data(df)
+        df_clean = self.clean_data(df)
+        version, filepath = snapshots.save(df_clean)
+        cache.put(key, 'clean_data', meta = {'snapshot': version, 'records': len(df_clean)})
+        return filepath
+
 def main():
-    loader = DataLoader()
+    parser = add_config_arguments(argparse.ArgumentParser(description = "Load, clean and snapshot the raw CSV"))
+    loader = DataLoader(configure(parser.parse_args()))
     logger.info("Loading raw data...")
     df = loader.load_raw_data()
 
@@ -1,9 +1,18 @@
+import argparse
+import io
 import pandas as pd
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import execute_values
 import logging
-from src.config import Config
+import sys
+from src import psycopg3_backend
+from src.artifact_cache import ArtifactCache, fingerprint_file
+from src.config import Config, add_config_arguments, configure
 from src.db_setup import DatabaseSetup
+from src.queries import QueryCatalog
+from src.snapshots import SnapshotManager
+from src.dedup import compute_row_hash
 
 logging.basicConfig(
     level = logging.INFO,
@@ -11,14 +20,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# INTEGER columns in properties_raw; pandas reads them as float when a chunk
+# has missing values, and COPY rejects '2.0'
+RAW_INTEGER_COLUMNS = ['num_bath', 'num_bed', 'num_parking', 'suburb_population']
+
 class DatabaseLoader:
     """load data from csv into postgresql"""
-    def __init__(self):
-        self.config = Config()
-        self.db = DatabaseSetup()
-        self.db.connect()
+    def __init__(self, db = None, config = None):
+        self.config = config or Config()
+        if db is None:
+            db = DatabaseSetup(config = self.config)
+            db.connect()
+        self.db = db
+        self.queries = QueryCatalog(db)
+        self.db.create_table_loads_table()
 
-    def load_csv_to_db(self, csv_path, table_name = 'properties_raw'):
+    def load_csv_to_db(self, csv_path, table_name = 'properties_raw', deduplicate = True):
+        if deduplicate:
+            self.backfill_row_hashes(table_name)
         try:
             logger.info(f"Reading CSV from {csv_path}...")
             df = pd.read_csv(csv_path)
@@ -27,55 +46,209 @@ class DatabaseLoader:
             if 'date_sold' in df.columns:
                 df['date_sold'] = pd.to_datetime(df['date_sold'], errors='coerce', format='%d/%m/%Y')
 
+            # rows whose natural-key hash is already in the table are skipped
+            # by the unique index, so re-running a load is idempotent
+            conflict = ""
+            if deduplicate:
+                df['row_hash'] = compute_row_hash(df)
+                conflict = " ON CONFLICT (row_hash) DO NOTHING RETURNING 1"
+
             columns = df.columns.tolist()
             values = [tuple(x) for x in df.values]
 
             cols_str = ', '.join(columns)
-            query = f"INSERT INTO {table_name}({cols_str}) VALUES %s"
+            query = f"INSERT INTO {table_name}({cols_str}) VALUES %s{conflict}"
 
             # Execute batch insert
             logger.info(f"Inserting data into {table_name}...")
-            execute_values(self.db.cursor, query, values, page_size=1000)
+            inserted = execute_values(self.db.cursor, query, values, page_size=self.config.EXECUTE_VALUES_PAGE_SIZE, fetch=deduplicate)
+            if not deduplicate or inserted:
+                self.db.mark_loaded(table_name)
             self.db.conn.commit()
 
-            logger.info(f"Successfully inserted {len(df)} rows into {table_name}")
+            if deduplicate:
+                logger.info(f"Successfully inserted {len(inserted)} rows into {table_name} "
+                            f"({len(df) - len(inserted)} already present)")
+            else:
+                logger.info(f"Successfully inserted {len(df)} rows into {table_name}")
 
         except Exception as e:
             logger.error(f"Error loading data: {e}")
             self.db.conn.rollback()
             raise
     
+    def load_csv_streaming(self, csv_path, table_name = 'properties_raw', chunksize = None):
+        """Stream a CSV into table_name chunk by chunk with COPY.
+
+        Only one chunk is held in memory at a time. Each chunk is copied into
+        a temp table and merged with ON CONFLICT (row_hash) DO NOTHING, so the
+        load is idempotent and can simply be re-run after a failure. Rows
+        loaded before dedup are hashed first (backfill_row_hashes).
+
+        With DB_BACKEND = 'psycopg3' and PSYCOPG3_BINARY the chunks are sent
+        with binary COPY on a psycopg 3 connection, NUMERIC columns as
+        double precision, and the merge casts them server-side.
+        """
+        chunksize = chunksize or self.config.RAW_LOAD_CHUNK_SIZE
+        target = sql.Identifier(table_name)
+        staging_name = f"{table_name}_load"
+        staging = sql.Identifier(staging_name)
+        total_read = total_inserted = 0
+        # rows from before dedup need their hashes, or this load duplicates them
+        self.backfill_row_hashes(table_name)
+
+        conn, cursor, binary = self.db.conn, self.db.cursor, False
+        if self.config.DB_BACKEND == 'psycopg3' and self.config.PSYCOPG3_BINARY:
+            # the temp table is per session, so the merge runs there too
+            conn = psycopg3_backend.connect(self.config, autocommit = False)
+            cursor, binary = conn.cursor(), True
+
+        try:
+            cursor.execute(
+                "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s;",
+                (table_name,)
+            )
+            table_columns = dict(cursor.fetchall())
+
+            logger.info(f"Streaming {csv_path} into {table_name} in chunks of {chunksize:,} rows"
+                        f"{' (binary COPY)' if binary else ''}...")
+            for chunk in pd.read_csv(csv_path, chunksize = chunksize):
+                if 'date_sold' in chunk.columns:
+                    chunk['date_sold'] = pd.to_datetime(chunk['date_sold'], errors='coerce', format='%d/%m/%Y')
+                chunk['row_hash'] = compute_row_hash(chunk)
+                for col in RAW_INTEGER_COLUMNS:
+                    if col in chunk.columns:
+                        chunk[col] = pd.to_numeric(chunk[col], errors='coerce').round().astype('Int64')
+
+                columns = [c for c in chunk.columns if c in table_columns]
+                cols = sql.SQL(', ').join(map(sql.Identifier, columns))
+                if total_read == 0:
+                    # binary COPY sends NUMERIC as double precision, cast back on merge
+                    select = sql.SQL(', ').join(
+                        sql.SQL("{}::double precision AS {}").format(sql.Identifier(c), sql.Identifier(c))
+                        if binary and table_columns[c] == 'numeric' else sql.Identifier(c)
+                        for c in columns
+                    )
+                    # temp table is emptied on every commit, i.e. after each chunk
+                    cursor.execute(sql.SQL("DROP TABLE IF EXISTS pg_temp.{};").format(staging).as_string(self.db.conn))
+                    cursor.execute(sql.SQL(
+                        "CREATE TEMP TABLE {} ON COMMIT DELETE ROWS AS SELECT {} FROM {} WITH NO DATA;"
+                    ).format(staging, select, target).as_string(self.db.conn))
+
+                if binary:
+                    psycopg3_backend.copy_rows_binary(cursor, staging_name, chunk, columns)
+                else:
+                    buffer = io.StringIO()
+                    chunk[columns].to_csv(buffer, index = False, header = False, date_format = '%Y-%m-%d')
+                    buffer.seek(0)
+                    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(staging, cols)
+                    cursor.copy_expert(copy_query.as_string(self.db.conn), buffer)
+
+                cursor.execute(sql.SQL(
+                    "INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT (row_hash) DO NOTHING;"
+                ).format(target, cols, cols, staging).as_string(self.db.conn))
+                inserted = cursor.rowcount
+                if inserted:
+                    self.db.mark_loaded(table_name, cursor)
+                conn.commit()
+
+                total_read += len(chunk)
+                total_inserted += inserted
+                logger.info(f"Chunk: {len(chunk):,} rows read, {inserted:,} inserted ({total_read:,} so far)")
+
+            logger.info(f"Successfully streamed {total_read:,} rows into {table_name}: "
+                        f"{total_inserted:,} inserted, {total_read - total_inserted:,} already present")
+            return total_inserted
+
+        except Exception as e:
+            logger.error(f"Error streaming data: {e}")
+            conn.rollback()
+            raise
+        finally:
+            if binary:
+                conn.close()
+
+    def load_csv_cached(self, csv_path, cache, table_name = 'properties_raw'):
+        """Streaming load, skipped if this CSV was already loaded into the table.
+
+        The cache entry records the transaction that last loaded the table;
+        if no load has touched it since, the load would insert nothing.
+        """
+        key = cache.key(
+            'load_raw_to_db',
+            inputs = {'csv': fingerprint_file(csv_path), 'table': table_name},
+            code = [sys.modules[__name__]],
+            params = {'chunk_size': self.config.RAW_LOAD_CHUNK_SIZE}
+        )
+        entry = cache.get(key)
+        if entry is not None and entry['meta'].get('table_load_txid') == self.queries.scalar('table_load_txid', (table_name,)):
+            logger.info(f"{csv_path} already loaded into unchanged {table_name}, skipping")
+            return 0
+
+        inserted = self.load_csv_streaming(csv_path, table_name)
+        cache.put(key, 'load_raw_to_db', meta = {
+            'inserted': inserted,
+            'table_load_txid': self.queries.scalar('table_load_txid', (table_name,))
+        })
+        return inserted
+
+    def backfill_row_hashes(self, table_name = 'properties_raw'):
+        """Hash rows loaded before dedup existed and delete their duplicates.
+
+        Rows with a NULL row_hash never conflict with a re-ingested copy, so
+        the loads call this first; once every row is hashed it is one index probe.
+        """
+        if not self.queries.scalar('raw_unhashed_exists', raw = table_name):
+            return 0
+        target = sql.Identifier(table_name)
+        try:
+            df = self.queries.read('raw_unhashed_rows', raw = table_name)
+            df['row_hash'] = compute_row_hash(df)
+            hashes = [int(h) for h in df['row_hash'].unique()]
+            existing = {r[0] for r in self.queries.fetchall('raw_existing_hashes', (hashes,), raw = table_name)}
+
+            # keep the earliest copy of each hash unless it is already stored
+            duplicate = df['row_hash'].duplicated() | df['row_hash'].isin(existing)
+            delete_ids = [(int(i),) for i in df.loc[duplicate, 'id']]
+            keep = df.loc[~duplicate, ['id', 'row_hash']]
+
+            if delete_ids:
+                execute_values(
+                    self.db.cursor,
+                    sql.SQL("DELETE FROM {} WHERE id IN (SELECT v.id FROM (VALUES %s) AS v(id))").format(target).as_string(self.db.conn),
+                    delete_ids, page_size=self.config.EXECUTE_VALUES_PAGE_SIZE
+                )
+            execute_values(
+                self.db.cursor,
+                sql.SQL("UPDATE {} AS r SET row_hash = v.row_hash FROM (VALUES %s) AS v(id, row_hash) WHERE r.id = v.id").format(target).as_string(self.db.conn),
+                [(int(i), int(h)) for i, h in keep.itertuples(index=False)],
+                page_size=self.config.EXECUTE_VALUES_PAGE_SIZE
+            )
+            self.db.mark_loaded(table_name)
+            self.db.conn.commit()
+            logger.info(f"Backfilled {len(keep)} row hashes in {table_name}, removed {len(delete_ids)} duplicate rows")
+            return len(delete_ids)
+        except Exception as e:
+            logger.error(f"Error backfilling row hashes: {e}")
+            self.db.conn.rollback()
+            raise
+
     def verify_data(self, table_name='properties_raw'):
         """Verify data was loaded correctly"""
         try:
             # Count rows
-            query = f"SELECT COUNT(*) FROM {table_name};"  # 确保这里是 {table_name}
-            self.db.cursor.execute(query)
-            count = self.db.cursor.fetchone()[0]
+            count = self.queries.scalar('verify_count', raw = table_name)
             logger.info(f"Total rows in {table_name}: {count}")
             
             # Show sample
-            query = f"SELECT * FROM {table_name} LIMIT 5;"
-            self.db.cursor.execute(query)
-            rows = self.db.cursor.fetchall()
+            rows = self.queries.fetchall('verify_sample', (5,), raw = table_name)
             
             logger.info(f"\nSample data from {table_name}:")
             for row in rows:
                 logger.info(row)
             
             # Show basic stats
-            query = f"""
-            SELECT 
-                COUNT(*) as total_properties,
-                AVG(price) as avg_price,
-                MIN(price) as min_price,
-                MAX(price) as max_price,
-                COUNT(DISTINCT suburb) as num_suburbs
-            FROM {table_name}
-            WHERE price IS NOT NULL;
-            """
-            self.db.cursor.execute(query)
-            stats = self.db.cursor.fetchone()
+            stats = self.queries.fetchone('verify_stats', raw = table_name)
             
             logger.info(f"\nBasic statistics:")
             logger.info(f"Total properties: {stats[0]}")
@@ -93,21 +266,23 @@ class DatabaseLoader:
 
 
 def main():
-    loader = DatabaseLoader()
+    parser = add_config_arguments(argparse.ArgumentParser(description = "Load the latest processed snapshot into properties_raw"))
+    loader = DatabaseLoader(config = configure(parser.parse_args()))
 
     try:
-        import os
-        import glob
-        processed_files = glob.glob('data/processed/*csv')
-        if not processed_files:
-            logger.error("No processed CSV files found in data/processed")
+        latest = SnapshotManager(config = loader.config).latest()
+        if latest is None:
+            logger.error("No processed snapshots found in data/processed")
             logger.info("Please run data_loader.py first")
             return
-        #use most recent file
-        latest_file = max(processed_files, key=os.path.getctime)
+        #use most recent snapshot, straight from the manifest
+        latest_file = latest[1]['path']
         logger.info(f"Using file: {latest_file}")
 
-        loader.load_csv_to_db(latest_file)
+        if loader.config.ARTIFACT_CACHE_ENABLED:
+            loader.load_csv_cached(latest_file, ArtifactCache(config = loader.config))
+        else:
+            loader.load_csv_streaming(latest_file)
         loader.verify_data()
         logger.info("\nData loading complete!")
     except Exception as e:
@@ -1,6 +1,8 @@
 import psycopg2
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 import logging
+from src import psycopg3_backend
 from src.config import Config
 
 logging.basicConfig(
@@ -10,12 +12,37 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# secondary indexes on properties_processed, shared with the staging-table load
+PROCESSED_INDEXES = [
+    ('idx_suburb', 'suburb'),
+    ('idx_type', 'type'),
+    ('idx_price', 'price'),
+    ('idx_date', 'date_sold'),
+]
+
+def create_connection_pool(maxconn = None, minconn = 1, config = None):
+    """Thread-safe pool for callers that share connections across tasks"""
+    config = config or Config()
+    return ThreadedConnectionPool(
+        minconn,
+        maxconn or config.DB_POOL_SIZE,
+        host = config.DB_HOST,
+        port = config.DB_PORT,
+        database = config.DB_NAME,
+        user = config.DB_USER,
+        password = config.DB_PASSWORD
+    )
+
 class DatabaseSetup:
 
-    def __init__(self):
-        self.config = Config()
-        self.conn = None
-        self.cursor = None
+    def __init__(self, conn = None, config = None):
+        # an existing connection (e.g. from a pool) is borrowed, not owned
+        self.config = config or Config()
+        self.conn = conn
+        self.cursor = conn.cursor() if conn is not None else None
+        self.owns_connection = conn is None
+        # psycopg 3 connection for catalog reads when DB_BACKEND = 'psycopg3'
+        self.read_conn = None
 
     def connect(self):
         try: 
@@ -33,9 +60,22 @@ class DatabaseSetup:
             raise
     
 
+    def get_read_conn(self):
+        """Connection catalog reads run on for the configured DB_BACKEND"""
+        if self.config.DB_BACKEND != 'psycopg3':
+            return self.conn
+        if self.read_conn is None:
+            self.read_conn = psycopg3_backend.connect(self.config)
+        return self.read_conn
+
     def close(self):
+        if self.read_conn is not None:
+            self.read_conn.close()
+            self.read_conn = None
         if self.cursor:
             self.cursor.close()
+        if not self.owns_connection:
+            return
         if self.conn:
             self.conn.close()
         logger.info("Database connection closed")
@@ -62,8 +102,13 @@ class DatabaseSetup:
             cash_rate DECIMAL(5, 4),
             property_inflation_index DECIMAL(10, 4),
             km_from_cbd DECIMAL(10, 2),
+            row_hash BIGINT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
+
+        -- Dedup index on the natural-key hash (added for tables created before it)
+        ALTER TABLE properties_raw ADD COLUMN IF NOT EXISTS row_hash BIGINT;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_row_hash ON properties_raw(row_hash);
         """
 
         try:
@@ -97,22 +142,238 @@ class DatabaseSetup:
             CONSTRAINT valid_price CHECK(price > 0),
             CONSTRAINT valid_distance CHECK(km_from_cbd >= 0)
         );
+        """
+        # Create indexes
+        create_table_query += "\n".join(
+            f"CREATE INDEX IF NOT EXISTS {name} ON properties_processed({column});"
+            for name, column in PROCESSED_INDEXES
+        )
 
+        try:
+            self.cursor.execute(create_table_query)
+            self.conn.commit()
+            logger.info("Table 'properties_processed' created successfully with indexes")
+        except Exception as e:
+            logger.error(f"Error creating processed data: {e}")
+            self.conn.rollback()
+            raise
 
-        -- Create indexes
-        CREATE INDEX IF NOT EXISTS idx_suburb ON properties_processed(suburb);
-        CREATE INDEX IF NOT EXISTS idx_type ON properties_processed(type);
-        CREATE INDEX IF NOT EXISTS idx_price ON properties_processed(price);
-        CREATE INDEX IF NOT EXISTS idx_date ON properties_processed(date_sold);
+    def create_timeseries_table(self):
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS properties_timeseries(
+            period_type VARCHAR(10) NOT NULL,
+            period_start DATE NOT NULL,
+            segment_type VARCHAR(20) NOT NULL,
+            segment VARCHAR(100) NOT NULL,
+            num_sales INTEGER NOT NULL,
+            median_price DECIMAL(12, 2),
+            median_price_per_sqm DECIMAL(10, 2),
+            -- over the rolling_window_months months ending at period_start
+            -- (monthly rows only)
+            rolling_median_price DECIMAL(12, 2),
+            rolling_num_sales INTEGER,
+            rolling_window_months SMALLINT,
 
+            PRIMARY KEY (period_type, segment_type, segment, period_start)
+        );
         """
 
         try:
             self.cursor.execute(create_table_query)
             self.conn.commit()
-            logger.info("Table 'properties_processed' created successfully with indexes")
+            logger.info("Table 'properties_timeseries' created successfully")
         except Exception as e:
-            logger.error(f"Error creating processed data: {e}")
+            logger.error(f"Error creating timeseries table: {e}")
+            self.conn.rollback()
+            raise
+
+    def create_sketch_table(self):
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS properties_sketches(
+            type VARCHAR(50) NOT NULL,
+            distance_category VARCHAR(20) NOT NULL,
+            num_rows INTEGER NOT NULL,
+            price_sketch BYTEA NOT NULL,
+            price_per_sqm_sketch BYTEA NOT NULL,
+            suburb_hll BYTEA NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+            PRIMARY KEY (type, distance_category)
+        );
+        """
+
+        try:
+            self.cursor.execute(create_table_query)
+            self.conn.commit()
+            logger.info("Table 'properties_sketches' created successfully")
+        except Exception as e:
+            logger.error(f"Error creating sketch table: {e}")
+            self.conn.rollback()
+            raise
+
+    def create_valuation_table(self):
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS properties_valuation(
+            kind VARCHAR(10) NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            num_rows INTEGER NOT NULL,
+            coefficients BYTEA NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+            PRIMARY KEY (kind, name)
+        );
+        """
+
+        try:
+            self.cursor.execute(create_table_query)
+            self.conn.commit()
+            logger.info("Table 'properties_valuation' created successfully")
+        except Exception as e:
+            logger.error(f"Error creating valuation table: {e}")
+            self.conn.rollback()
+            raise
+
+    def create_outlier_tables(self):
+        """Cached outlier statistics and the sales the outlier stage flagged (OUTLIER_METHOD = 'robust')"""
+        create_table_query = """
+        -- one row per suburb/type group, plus a suburb '*' row per type
+        CREATE TABLE IF NOT EXISTS properties_outlier_stats(
+            suburb VARCHAR(100) NOT NULL,
+            type VARCHAR(50) NOT NULL,
+            num_rows INTEGER NOT NULL,
+            median_log_price DOUBLE PRECISION,
+            mad_log_price DOUBLE PRECISION,
+            low_price DOUBLE PRECISION,
+            high_price DOUBLE PRECISION,
+            group_hash BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+            PRIMARY KEY (suburb, type)
+        );
+
+        CREATE TABLE IF NOT EXISTS properties_outliers(
+            id SERIAL PRIMARY KEY,
+            price DECIMAL(12, 2),
+            date_sold DATE,
+            suburb VARCHAR(100) NOT NULL,
+            num_bath INTEGER,
+            num_bed INTEGER,
+            num_parking INTEGER,
+            property_size DECIMAL(10, 2),
+            type VARCHAR(50) NOT NULL,
+            km_from_cbd DECIMAL(10, 2),
+            price_per_sqm DECIMAL(10, 2),
+            is_house BOOLEAN,
+            distance_category VARCHAR(20),
+            low_price DOUBLE PRECISION,
+            high_price DOUBLE PRECISION,
+            quarantined BOOLEAN NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+
+        try:
+            self.cursor.execute(create_table_query)
+            self.conn.commit()
+            logger.info("Outlier tables created successfully")
+        except Exception as e:
+            logger.error(f"Error creating outlier tables: {e}")
+            self.conn.rollback()
+            raise
+
+    def create_changelog_tables(self):
+        """properties_processed change feed: one row per ETL load that changed it, and consumer offsets"""
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS properties_changelog(
+            id SERIAL PRIMARY KEY,
+            table_name VARCHAR(100) NOT NULL,
+            etl_mode VARCHAR(20),
+            num_rows INTEGER NOT NULL,
+            -- id range of the whole table after the load, not of the changed
+            -- rows (loads rewrite every row); suburbs/months locate the changes
+            table_min_id INTEGER,
+            table_max_id INTEGER,
+            -- (suburb, month sold) partitions with inserted, updated or deleted sales
+            partitions_inserted INTEGER NOT NULL,
+            partitions_updated INTEGER NOT NULL,
+            partitions_deleted INTEGER NOT NULL,
+            suburbs TEXT[] NOT NULL,
+            months DATE[] NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        -- (suburb, month sold) row counts and digests as of the last recorded change
+        CREATE TABLE IF NOT EXISTS properties_change_partitions(
+            suburb VARCHAR(100),
+            month DATE,
+            num_rows INTEGER NOT NULL,
+            digest NUMERIC NOT NULL
+        );
+
+        -- the last changelog id each consumer has applied
+        CREATE TABLE IF NOT EXISTS properties_change_offsets(
+            consumer VARCHAR(100) PRIMARY KEY,
+            change_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+
+        try:
+            self.cursor.execute(create_table_query)
+            self.conn.commit()
+            logger.info("Changelog tables created successfully")
+        except Exception as e:
+            logger.error(f"Error creating changelog tables: {e}")
+            self.conn.rollback()
+            raise
+
+    def create_star_tables(self):
+        """Suburb and property-type dimensions and the sales fact table (SCHEMA_MODE = 'star')"""
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS dim_suburb(
+            suburb_key SERIAL PRIMARY KEY,
+            suburb VARCHAR(100) NOT NULL UNIQUE,
+            population INTEGER,
+            median_income DECIMAL(10, 2),
+            sqkm DECIMAL(10, 2),
+            lat DECIMAL(10, 6),
+            lng DECIMAL(10, 6),
+            elevation DECIMAL(10, 2),
+            km_from_cbd DECIMAL(10, 2)
+        );
+
+        CREATE TABLE IF NOT EXISTS dim_property_type(
+            type_key SMALLSERIAL PRIMARY KEY,
+            type VARCHAR(50) NOT NULL UNIQUE,
+            is_house BOOLEAN
+        );
+
+        -- properties_processed with suburb/type as integer keys
+        CREATE TABLE IF NOT EXISTS fact_sales(
+            id SERIAL PRIMARY KEY,
+            suburb_key INTEGER NOT NULL REFERENCES dim_suburb(suburb_key),
+            type_key SMALLINT NOT NULL REFERENCES dim_property_type(type_key),
+            price DECIMAL(12, 2) NOT NULL,
+            date_sold DATE,
+            num_bath INTEGER,
+            num_bed INTEGER,
+            num_parking INTEGER,
+            property_size DECIMAL(10, 2),
+            km_from_cbd DECIMAL(10, 2),
+            price_per_sqm DECIMAL(10, 2),
+            distance_category VARCHAR(20)
+        );
+        CREATE INDEX IF NOT EXISTS idx_fact_suburb ON fact_sales(suburb_key);
+        CREATE INDEX IF NOT EXISTS idx_fact_type ON fact_sales(type_key);
+        CREATE INDEX IF NOT EXISTS idx_fact_date ON fact_sales(date_sold);
+        """
+
+        try:
+            self.cursor.execute(create_table_query)
+            self.conn.commit()
+            logger.info("Star schema tables created successfully")
+        except Exception as e:
+            logger.error(f"Error creating star schema tables: {e}")
             self.conn.rollback()
             raise
 
@@ -132,13 +393,57 @@ class DatabaseSetup:
         except Exception as e:
             logger.error(f"Error checking tables: {e}")
             raise
-    
+
+    def create_table_loads_table(self):
+        """Which transaction last loaded each pipeline table, so caches can tell it changed without scanning it"""
+        create_table_query = """
+        CREATE TABLE IF NOT EXISTS properties_table_loads(
+            table_name VARCHAR(100) PRIMARY KEY,
+            -- txid_current() of the loading transaction; never reused, even
+            -- after the tables are dropped and reloaded
+            load_txid BIGINT NOT NULL,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+
+        try:
+            self.cursor.execute(create_table_query)
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error creating table loads table: {e}")
+            self.conn.rollback()
+            raise
+
+    def mark_loaded(self, table_name, cursor = None):
+        """Record that the current transaction loads table_name; the caller commits.
+
+        Only the pipeline's loaders call this, so writes made outside them
+        (manual SQL, restores) are not seen by the caches. cursor: the
+        loading transaction's, if it is not on this connection.
+        """
+        (cursor or self.cursor).execute("""
+            INSERT INTO properties_table_loads (table_name, load_txid) VALUES (%s, txid_current())
+            ON CONFLICT (table_name) DO UPDATE
+            SET load_txid = EXCLUDED.load_txid, loaded_at = CURRENT_TIMESTAMP;
+        """, (table_name,))
 
     def drop_all_tables(self):
         """Drop all tables (use carefully!)"""
         query = """
         DROP TABLE IF EXISTS properties_raw CASCADE;
         DROP TABLE IF EXISTS properties_processed CASCADE;
+        DROP TABLE IF EXISTS properties_timeseries CASCADE;
+        DROP TABLE IF EXISTS properties_sketches CASCADE;
+        DROP TABLE IF EXISTS properties_valuation CASCADE;
+        DROP TABLE IF EXISTS properties_outlier_stats CASCADE;
+        DROP TABLE IF EXISTS properties_outliers CASCADE;
+        DROP TABLE IF EXISTS properties_changelog CASCADE;
+        DROP TABLE IF EXISTS properties_change_offsets CASCADE;
+        DROP TABLE IF EXISTS properties_change_partitions CASCADE;
+        DROP TABLE IF EXISTS properties_table_loads CASCADE;
+        DROP TABLE IF EXISTS fact_sales CASCADE;
+        DROP TABLE IF EXISTS dim_suburb CASCADE;
+        DROP TABLE IF EXISTS dim_property_type CASCADE;
         """
         
         try:
@@ -168,6 +473,13 @@ def main():
         logger.info("\nCreating tables...")
         db.create_raw_table()
         db.create_processed_table()
+        db.create_timeseries_table()
+        db.create_sketch_table()
+        db.create_valuation_table()
+        db.create_outlier_tables()
+        db.create_changelog_tables()
+        db.create_star_tables()
+        db.create_table_loads_table()
 
         # Verify
         logger.info("\nVerifying tables created...")
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+# columns that identify one sale; suburb-level attributes are left out because
+# they are derived from the suburb and may be revised between dataset releases
+NATURAL_KEY_COLUMNS = [
+    'price', 'date_sold', 'suburb', 'num_bath', 'num_bed',
+    'num_parking', 'property_size', 'type'
+]
+NUMERIC_KEY_COLUMNS = ['price', 'num_bath', 'num_bed', 'num_parking', 'property_size']
+TEXT_KEY_COLUMNS = ['suburb', 'type']
+
+# fixed so hashes stay comparable across runs and pandas versions
+ROW_HASH_KEY = 'sydprop-rowhash1'
+
+
+def normalize_key_columns(df):
+    """Canonical form of the natural key, identical for CSV and database input"""
+    key = pd.DataFrame(index=df.index)
+    for col in NUMERIC_KEY_COLUMNS:
+        # DECIMAL(_, 2) in the database, so compare at cent precision
+        key[col] = pd.to_numeric(df[col], errors='coerce').astype(float).round(2).fillna(-1.0)
+    for col in TEXT_KEY_COLUMNS:
+        key[col] = df[col].astype('string').str.strip().fillna('')
+    key['date_sold'] = pd.to_datetime(df['date_sold'], errors='coerce').dt.strftime('%Y-%m-%d').fillna('')
+    return key[NATURAL_KEY_COLUMNS]
+
+
+def compute_row_hash(df):
+    """Vectorised 64-bit hash of each row's natural key, as signed int64 (BIGINT)"""
+    hashes = pd.util.hash_pandas_object(normalize_key_columns(df), index=False, hash_key=ROW_HASH_KEY)
+    return pd.Series(hashes.to_numpy(dtype=np.uint64).view(np.int64), index=df.index, name='row_hash')
@@ -0,0 +1,218 @@
+import argparse
+import logging
+import os
+import re
+from src.config import Config, add_config_arguments, configure
+from src.dedup import NATURAL_KEY_COLUMNS, TEXT_KEY_COLUMNS
+from src.etl_pipeline import (
+    PROCESSED_COLUMNS, RAW_EXTRACT_COLUMNS, RAW_EXTRACT_CONDITIONS, extract_conditions, transform_steps
+)
+from src.outliers import MAD_SCALE, MIN_LOG_SCALE
+from src.queries import DEFAULT_TABLES, QUERIES
+from src.snapshots import SnapshotManager
+from src.transforms import TransformExecutor
+
+try:
+    import duckdb
+except ImportError:  # duckdb ships with requirements-full.txt only
+    duckdb = None
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# column types of properties_raw / properties_processed (see db_setup), so
+# DECIMAL rounding and the report results match the Postgres path
+RAW_TYPES = {
+    'price': 'DECIMAL(12, 2)',
+    'date_sold': 'DATE',
+    'suburb': 'VARCHAR',
+    'num_bath': 'INTEGER',
+    'num_bed': 'INTEGER',
+    'num_parking': 'INTEGER',
+    'property_size': 'DECIMAL(10, 2)',
+    'type': 'VARCHAR',
+    'suburb_population': 'INTEGER',
+    'suburb_median_income': 'DECIMAL(10, 2)',
+    'suburb_sqkm': 'DECIMAL(10, 2)',
+    'suburb_lat': 'DECIMAL(10, 6)',
+    'suburb_lng': 'DECIMAL(10, 6)',
+    'suburb_elevation': 'DECIMAL(10, 2)',
+    'cash_rate': 'DECIMAL(5, 4)',
+    'property_inflation_index': 'DECIMAL(10, 4)',
+    'km_from_cbd': 'DECIMAL(10, 2)',
+}
+PROCESSED_TYPES = {
+    'price': 'DECIMAL(12, 2)',
+    'date_sold': 'DATE',
+    'suburb': 'VARCHAR',
+    'num_bath': 'INTEGER',
+    'num_bed': 'INTEGER',
+    'num_parking': 'INTEGER',
+    'property_size': 'DECIMAL(10, 2)',
+    'type': 'VARCHAR',
+    'km_from_cbd': 'DECIMAL(10, 2)',
+    'price_per_sqm': 'DECIMAL(10, 2)',
+    'is_house': 'BOOLEAN',
+    'distance_category': 'VARCHAR',
+}
+
+
+def _require_duckdb():
+    if duckdb is None:
+        raise ImportError("ANALYTICS_ENGINE = 'duckdb' needs duckdb: pip install duckdb")
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class SnapshotQueryEngine:
+    """Catalog queries on a processed snapshot with DuckDB, no database server.
+
+    The snapshot (csv, csv.gz or parquet) is scanned in place as the
+    properties_raw view; properties_processed is the ETL's own transform SQL
+    over it. DuckDB runs the queries vectorized on all cores and spills to
+    DUCKDB_TEMP_PATH past DUCKDB_MEMORY_LIMIT, so snapshots larger than RAM
+    work. read() takes the same names and parameters as QueryCatalog.read().
+    """
+
+    def __init__(self, version = None, snapshots = None, threads = None, config = None):
+        _require_duckdb()
+        self.config = config or Config()
+        snapshots = snapshots or SnapshotManager(self.config.PROCESSED_DATA_PATH, config = self.config)
+        if version is None:
+            latest = snapshots.latest()
+            if latest is None:
+                raise FileNotFoundError(f"No snapshots in {snapshots.manifest_path}")
+            version = latest[0]
+        entry = snapshots.get(version)
+        if entry is None:
+            raise KeyError(f"Unknown snapshot: {version}")
+        self.version = version
+
+        os.makedirs(self.config.DUCKDB_TEMP_PATH, exist_ok = True)
+        self.conn = duckdb.connect(config = {
+            'memory_limit': self.config.DUCKDB_MEMORY_LIMIT,
+            'temp_directory': self.config.DUCKDB_TEMP_PATH,
+        })
+        if threads:
+            self.conn.execute(f"SET threads = {int(threads)}")
+        self._create_views(entry['path'], entry['format'])
+        logger.info(f"Querying snapshot {version} ({entry['records']} records) with DuckDB")
+
+    def _scan(self, path, fmt):
+        if fmt == 'parquet':
+            return f"read_parquet({_quote(path)})"
+        # dates stay text so the snapshot's dd/mm/yyyy is parsed as db_loader does
+        return f"read_csv({_quote(path)}, header = true, types = {{'date_sold': 'VARCHAR'}})"
+
+    def _create_views(self, path, fmt):
+        columns = []
+        for col, col_type in RAW_TYPES.items():
+            if col == 'date_sold':
+                columns.append(f"try_strptime(CAST(date_sold AS VARCHAR), '%d/%m/%Y')::DATE AS date_sold")
+            else:
+                columns.append(f"CAST({col} AS {col_type}) AS {col}")
+        # first row per natural key wins, as the row_hash unique index does on load
+        key = [f"trim({col})" if col in TEXT_KEY_COLUMNS else col for col in NATURAL_KEY_COLUMNS]
+        self.conn.execute(f"""
+            CREATE VIEW properties_raw AS
+            SELECT * EXCLUDE (file_row) FROM (
+                SELECT {', '.join(columns)}, row_number() OVER () AS file_row
+                FROM {self._scan(path, fmt)}
+            )
+            QUALIFY row_number() OVER (PARTITION BY {', '.join(key)} ORDER BY file_row) = 1
+        """)
+
+        if self.config.OUTLIER_METHOD == 'robust':
+            self._create_outlier_view()
+        transform = TransformExecutor(steps = transform_steps(self.config), config = self.config).to_sql(
+            'properties_raw', RAW_EXTRACT_COLUMNS, PROCESSED_COLUMNS, extract_conditions(self.config)
+        )
+        columns = [f"CAST({col} AS {PROCESSED_TYPES[col]}) AS {col}" for col in PROCESSED_COLUMNS]
+        self.conn.execute(
+            f"CREATE VIEW properties_processed AS SELECT {', '.join(columns)} FROM ({transform}) t"
+        )
+
+    def _create_outlier_view(self):
+        # the ETL's outlier bounds (see src/outliers.py), computed over the
+        # snapshot with DuckDB's median and mad aggregates
+        min_rows = int(self.config.OUTLIER_MIN_GROUP_ROWS)
+        threshold = float(self.config.OUTLIER_MAD_THRESHOLD)
+        self.conn.execute(f"""
+            CREATE VIEW properties_outlier_stats AS
+            WITH sales AS (
+                SELECT suburb, type, ln(price::DOUBLE) AS log_price
+                FROM properties_raw
+                WHERE {' AND '.join(RAW_EXTRACT_CONDITIONS)} AND price > 0
+            ),
+            groups AS (
+                SELECT suburb, type, count(*) AS num_rows,
+                    median(log_price) AS center, mad(log_price) AS mad
+                FROM sales GROUP BY suburb, type
+            ),
+            types AS (
+                SELECT type, median(log_price) AS center, mad(log_price) AS mad
+                FROM sales GROUP BY type
+            ),
+            resolved AS (
+                SELECT g.suburb, g.type,
+                    CASE WHEN g.num_rows < {min_rows} THEN t.center ELSE g.center END AS center,
+                    greatest(CASE WHEN g.num_rows < {min_rows} THEN t.mad ELSE g.mad END * {MAD_SCALE},
+                        {MIN_LOG_SCALE}) AS scale
+                FROM groups g JOIN types t USING (type)
+            )
+            SELECT suburb, type,
+                exp(center - {threshold} * scale) AS low_price,
+                exp(center + {threshold} * scale) AS high_price
+            FROM resolved
+        """)
+
+    def _translate(self, name):
+        if name not in QUERIES:
+            raise KeyError(f"Unknown query: {name}")
+        tables = {k: f'"{v}"' for k, v in DEFAULT_TABLES.items()}
+        query = QUERIES[name].strip().format(**tables)
+        # float is double precision in Postgres but single in DuckDB
+        query = re.sub(r'::float\b', '::double', query)
+        return re.sub(r'%s', '?', query)
+
+    def read(self, name, params = ()):
+        """Run a catalog query into a DataFrame"""
+        return self.conn.execute(self._translate(name), list(params)).df()
+
+    def fetchone(self, name, params = ()):
+        return self.conn.execute(self._translate(name), list(params)).fetchone()
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    from src.analytics import PropertyAnalytics
+
+    parser = argparse.ArgumentParser(description = "Run the analytics reports on a processed snapshot with DuckDB")
+    parser.add_argument('--snapshot', help = "snapshot version (default: latest)")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = configure(args)
+
+    analytics = PropertyAnalytics(engine = SnapshotQueryEngine(args.snapshot, config = config), config = config)
+    try:
+        analytics.price_by_distance()
+        analytics.house_vs_apt()
+        analytics.top_suburbs_by_value()
+        analytics.most_expensive_suburbs()
+        logger.info("\n Snapshot analytics complete")
+    except Exception as e:
+        logger.error(f"Snapshot analytics failed: {e}")
+        raise
+    finally:
+        analytics.close()
+
+
+if __name__ == "__main__":
+    main()
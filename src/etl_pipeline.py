@@ -1,10 +1,26 @@
+import argparse
+import io
+import json
+import math
+import os
 import pandas as pd
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import execute_values
 import logging
+import sys
 from datetime import datetime
-from src.config import Config
-from src.db_setup import DatabaseSetup
+from src.config import Config, add_config_arguments, configure
+from src.db_setup import DatabaseSetup, PROCESSED_INDEXES
+from src.queries import QueryCatalog
+from src import change_feed, comparables, outliers, parallel_transform, sketches, star_schema, transforms, valuation
+from src.comparables import INPUT_COLUMNS as COMPARABLES_COLUMNS
+from src.outliers import OutlierStats
+from src.sketches import SketchStore
+from src.star_schema import FACT_TABLE, StarSchemaLoader
+from src.parallel_transform import transform_partitioned
+from src.transforms import TRANSFORM_STEPS, TransformExecutor
+from src.valuation import INPUT_COLUMNS as VALUATION_COLUMNS, ValuationModel
 
 logging.basicConfig(
     level = logging.INFO,
@@ -12,134 +28,602 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+PROCESSED_COLUMNS = [
+    'price', 'date_sold', 'suburb', 'num_bath', 'num_bed',
+    'num_parking', 'property_size', 'type', 'km_from_cbd',
+    'price_per_sqm', 'is_house', 'distance_category'
+]
+INTEGER_COLUMNS = ['num_bath', 'num_bed', 'num_parking']
+PROCESSED_TABLE = 'properties_processed'
+
+# what extract_from_raw reads, for the in-database ETL mode
+RAW_EXTRACT_COLUMNS = [
+    'price', 'date_sold', 'suburb', 'num_bath', 'num_bed',
+    'num_parking', 'property_size', 'type', 'km_from_cbd'
+]
+RAW_EXTRACT_CONDITIONS = ['price is not NULL', 'suburb is not NULL', 'type is not NULL']
+OUTLIER_COLUMNS = PROCESSED_COLUMNS + ['low_price', 'high_price', 'quarantined']
+# a raw row is inside its suburb/type's outlier bounds (OUTLIER_METHOD = 'robust')
+WITHIN_OUTLIER_BOUNDS = (
+    "EXISTS (SELECT 1 FROM {stats} s"
+    " WHERE s.suburb = properties_raw.suburb AND s.type = properties_raw.type"
+    " AND properties_raw.price BETWEEN s.low_price AND s.high_price)"
+)
+OUTLIER_STATS_TABLE = 'properties_outlier_stats'
+OUTLIERS_TABLE = 'properties_outliers'
+# the outlier stage writes these copies; they replace the live tables in the
+# same transaction as the properties_processed load, or are dropped if it fails
+OUTLIER_STAGING_TABLES = {
+    OUTLIER_STATS_TABLE: 'properties_outlier_stats_staging',
+    OUTLIERS_TABLE: 'properties_outliers_staging',
+}
+STAGING_TABLE = 'properties_processed_staging'
+OLD_TABLE = 'properties_processed_old'
+
+# settings that change what run_etl writes
+ETL_CACHE_SETTINGS = [
+    'ETL_MODE', 'SCHEMA_MODE', 'OUTLIER_METHOD', 'OUTLIER_MIN_PRICE', 'OUTLIER_MAX_PRICE',
+    'OUTLIER_MAD_THRESHOLD', 'OUTLIER_MIN_GROUP_ROWS', 'OUTLIER_ACTION',
+    'SKETCH_RELATIVE_ACCURACY', 'SKETCH_HLL_PRECISION',
+    'VALUATION_MIN_SEGMENT_ROWS', 'VALUATION_SUBURB_SHRINKAGE'
+]
+
+
+def transform_steps(config):
+    """Step names for config.OUTLIER_METHOD (None: all registered steps)"""
+    if config.OUTLIER_METHOD == 'robust':
+        # the outlier stage replaces the fixed price range
+        return [name for name in TRANSFORM_STEPS if name != 'remove_outliers']
+    if config.OUTLIER_METHOD != 'fixed':
+        raise ValueError(f"Unknown outlier method: {config.OUTLIER_METHOD}")
+    return None
+
+
+def extract_conditions(config, outlier_condition = True, stats_table = OUTLIER_STATS_TABLE):
+    """WHERE conditions on properties_raw for the in-database transform"""
+    conditions = list(RAW_EXTRACT_CONDITIONS)
+    if config.OUTLIER_METHOD == 'robust' and outlier_condition:
+        if config.OUTLIER_ACTION == 'quarantine':
+            conditions.append(WITHIN_OUTLIER_BOUNDS.format(stats = stats_table))
+        else:
+            conditions.append('price > 0')
+    return conditions
+
+
 class ETLPipeline:
-    def __init__(self):
-        self.config = Config()
-        self.db = DatabaseSetup()
-        self.db.connect()
+    def __init__(self, db = None, config = None):
+        self.config = config or Config()
+        if db is None:
+            db = DatabaseSetup(config = self.config)
+            db.connect()
+        self.db = db
+        self.queries = QueryCatalog(db)
+        self.db.create_table_loads_table()
+        self.star_loader = None
+        self.outlier_stats = None
+        # True while this run's outlier tables wait in OUTLIER_STAGING_TABLES
+        self.outliers_staged = False
     
     def extract_from_raw(self):
-        query = """
-        select 
-            price,
-            date_sold,
-            suburb,
-            num_bath,
-            num_bed,
-            num_parking,
-            property_size,
-            type,
-            km_from_cbd
-        from properties_raw
-        where price is not NULL
-            and suburb is not NULL
-            and type is not NULL;
-        """ 
         try:
             logger.info("extracting data from properties_raw")
-            df = pd.read_sql(query, self.db.conn)
+            df = self.queries.read('extract_raw')
             logger.info(f"Extracted {len(df)} records")
             return df
         except Exception as e:
             logger.error(f"Eroor extracting data: {e}")
             raise
     
-    def transform_data(self, df):
+    def transform_data(self, df, steps = None, workers = None):
+        """Run the registered transform steps (see src/transforms.py).
+
+        With more than one worker the frame is split by suburb and transformed
+        in a process pool. With OUTLIER_METHOD = 'robust' the outlier stage
+        replaces the fixed price range filter and, like it, runs on the raw
+        rows, so no columns are derived for quarantined sales.
+        """
         logger.info("Starting data transformations")
-        initial_count = len(df)
-        df['price_per_sqm'] = df.apply(
-            lambda row: row['price']/ row['property_size']
-            if pd.notnull(row['property_size']) and row['property_size'] > 0
-            else None,
-            axis = 1
-        )
-        logger.info("Calculated price per square meter")
+        steps = steps or transform_steps(self.config)
+        if self.config.OUTLIER_METHOD == 'robust':
+            df = self.outlier_stage(df, steps)
+        df = transform_partitioned(df, steps = steps, config = self.config, workers = workers)
+        logger.info(f"Transformation complete: {len(df)} records ready for loading")
+        return df
+
+    def refresh_outlier_stats(self, df):
+        """Update the cached per-suburb/type outlier statistics against df and stage them.
+
+        The statistics go to the staging copy of properties_outlier_stats;
+        the load publishes them (see _publish_outlier_tables).
+        """
+        try:
+            self.db.create_outlier_tables()
+            if self.outlier_stats is None:
+                # the previous run's statistics; only groups whose sales changed are recomputed
+                self.outlier_stats = OutlierStats.from_records(self.queries.fetchall('outlier_stats'), config = self.config)
+            self.outlier_stats.refresh(df)
+            records = self.outlier_stats.to_records()
+            cursor = self.db.cursor
+            for live, staging in OUTLIER_STAGING_TABLES.items():
+                cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(staging)))
+                cursor.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS);").format(
+                    sql.Identifier(staging), sql.Identifier(live)))
+            query = sql.SQL("""
+            INSERT INTO {}
+                (suburb, type, num_rows, median_log_price, mad_log_price, low_price, high_price, group_hash)
+            VALUES %s
+            """).format(sql.Identifier(OUTLIER_STAGING_TABLES[OUTLIER_STATS_TABLE]))
+            execute_values(cursor, query.as_string(self.db.conn), records, page_size=self.config.EXECUTE_VALUES_PAGE_SIZE)
+            self.db.conn.commit()
+            self.outliers_staged = True
+            return self.outlier_stats
+        except Exception as e:
+            logger.error(f"error updating outlier stats: {e}")
+            self.db.conn.rollback()
+            raise
+
+    def outlier_stage(self, df, steps = None):
+        """Flag raw sales outside their suburb/type's robust price bounds and stage them for properties_outliers.
+
+        With OUTLIER_ACTION = 'quarantine' flagged sales are dropped from the
+        returned frame; with 'flag' only non-positive prices are. Only the
+        flagged rows are transformed here, for the properties_outliers columns.
+        """
+        if self.config.OUTLIER_ACTION not in ('quarantine', 'flag'):
+            raise ValueError(f"Unknown outlier action: {self.config.OUTLIER_ACTION}")
+        stats = self.refresh_outlier_stats(df)
+        low, high = stats.price_bounds(df)
+        inside = stats.mask(df).to_numpy()
+        # properties_processed only takes positive prices
+        quarantined = ~inside & ((self.config.OUTLIER_ACTION == 'quarantine') | ~(df['price'] > 0).to_numpy())
+        flagged = df[~inside].assign(low_price = low[~inside], high_price = high[~inside], quarantined = quarantined[~inside])
+        self.store_outliers(TransformExecutor(steps = steps or transform_steps(self.config), config = self.config).run(flagged))
+        logger.info(f"Outlier stage: {len(flagged)} sales flagged, {int(quarantined.sum())} quarantined")
+        return df[~quarantined]
+
+    def store_outliers(self, flagged):
+        try:
+            self._copy_rows(self.db.cursor, sql.Identifier(OUTLIER_STAGING_TABLES[OUTLIERS_TABLE]), flagged, OUTLIER_COLUMNS)
+            self.db.conn.commit()
+        except Exception as e:
+            logger.error(f"error storing outliers: {e}")
+            self.db.conn.rollback()
+            raise
 
-        df['is_house'] = df['type'].apply(
-            lambda x: True if 'house' in str(x).lower() else False
+    def _publish_outlier_tables(self, cursor):
+        """Replace the live outlier tables with this run's staged copies; the caller commits"""
+        if not self.outliers_staged:
+            return
+        for live, staging in OUTLIER_STAGING_TABLES.items():
+            cursor.execute(sql.SQL("TRUNCATE TABLE {};").format(sql.Identifier(live)))
+            cursor.execute(sql.SQL("INSERT INTO {} SELECT * FROM {};").format(sql.Identifier(live), sql.Identifier(staging)))
+            cursor.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(staging)))
+            self.db.mark_loaded(live)
+        self.outliers_staged = False
+
+    def _drop_outlier_staging(self):
+        """After a failed load: the live outlier tables keep describing the previous run"""
+        if not self.outliers_staged:
+            return
+        for staging in OUTLIER_STAGING_TABLES.values():
+            self.db.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(staging)))
+        self.db.conn.commit()
+        self.outliers_staged = False
+
+    def _copy_rows(self, cursor, table, df, columns, freeze = False):
+        buffer = io.StringIO()
+        copy_frame = df[columns].copy()
+        for col in INTEGER_COLUMNS:
+            # COPY rejects '2.0' for INTEGER columns
+            copy_frame[col] = pd.to_numeric(copy_frame[col], errors='coerce').round().astype('Int64')
+        copy_frame.to_csv(buffer, index = False, header = False)
+        buffer.seek(0)
+        copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv{})").format(
+            table, sql.SQL(', ').join(map(sql.Identifier, columns)), sql.SQL(', FREEZE' if freeze else '')
         )
-        logger.info("created is_house flag")
-
-        def categorize_distance(km):
-            if pd.isnull(km):
-                return None
-            elif km < 5:
-                return 'Inner City'
-            elif km < 10:
-                return 'Inner Suburbs'
-            elif km < 20:
-                return 'Middle Suburbs'
-            else:
-                return 'Outer Suburbs'
-        
-        df['distance_category'] = df['km_from_cbd'].apply(categorize_distance)
-        logger.info("Categorized distance from CBD")
-        #remove outliers (properties > $10m or < $100k)
-        df = df[(df['price'] >= 100000) & (df['price'] <= 10000000)]
-        logger.info(f"Removed outliers: {initial_count - len(df)} records")
+        cursor.copy_expert(copy_query.as_string(self.db.conn), buffer)
 
-        df['num_parking'] = df['num_parking'].fillna(0)
-        logger.info("Filled missing parking spaces")
+    def _insert_rows(self, cursor, table, df, columns, freeze = False):
+        """Bulk insert df's rows with COPY or execute_values, per PROCESSED_LOAD_METHOD.
 
-        if 'data_sold' in df.columns:
-            df['date_sold'] = pd.to_datetime(df['date_sold'], errors='coerce')
-        
-        logger.info(f"Transformation complete: {len(df)} records ready for loading")
-        return df
+        freeze: COPY the rows already frozen; only valid into a table created
+        or truncated in the current transaction.
+        """
+        if self.config.PROCESSED_LOAD_METHOD == 'copy':
+            return self._copy_rows(cursor, table, df, columns, freeze)
+        #convert dataframe to list of tuples
+        values = []
+        for _, row in df.iterrows():
+            values.append(tuple(row[col] if pd.notnull(row[col])else None for col in columns))
+        query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+            table, sql.SQL(', ').join(map(sql.Identifier, columns))
+        )
+        execute_values(cursor, query.as_string(self.db.conn), values, page_size=self.config.EXECUTE_VALUES_PAGE_SIZE)
+
+    def load_to_processed(self, df, strategy = None):
+        strategy = strategy or self.config.PROCESSED_LOAD_STRATEGY
+        if strategy == 'swap':
+            return self.load_to_processed_swap(df)
+        if strategy != 'truncate':
+            raise ValueError(f"Unknown load strategy: {strategy}")
 
-    def load_to_processed(self, df):
         try:
+            # TRUNCATE, INSERT and the outlier tables commit together
             logger.info("Clearing properties_processed table")
             self.db.cursor.execute("TRUNCATE TABLE properties_processed;")
+
+            logger.info(f"Loading {len(df)} records to properties_processed ({self.config.PROCESSED_LOAD_METHOD})")
+            self._insert_rows(self.db.cursor, sql.Identifier(PROCESSED_TABLE), df, PROCESSED_COLUMNS)
+            self.db.mark_loaded(PROCESSED_TABLE)
+            self._publish_outlier_tables(self.db.cursor)
             self.db.conn.commit()
 
-            columns = [
-                'price', 'date_sold', 'suburb', 'num_bath', 'num_bed',
-                'num_parking', 'property_size', 'type', 'km_from_cbd',
-                'price_per_sqm', 'is_house', 'distance_category'
+            logger.info(f"Successfully loaded {len(df)} records to properties_processed")
+
+        except Exception as e:
+            logger.error(f"error loading data: {e}")
+            self.db.conn.rollback()
+            self._drop_outlier_staging()
+            raise
+
+    def load_to_processed_swap(self, df):
+        """Load into a staging table and rename it into place.
+
+        properties_processed keeps serving the previous load until the final
+        rename transaction, so readers never see a truncated or partial table.
+        """
+        def copy_rows(cursor, staging):
+            # bulk load while the table has no indexes to maintain
+            logger.info(f"Loading {len(df)} records to {STAGING_TABLE} ({self.config.PROCESSED_LOAD_METHOD})")
+            # the staging table is created in this transaction, so COPY can write
+            # the rows frozen and no later vacuum has to rewrite them
+            self._insert_rows(cursor, staging, df, PROCESSED_COLUMNS, freeze = True)
+            return len(df)
+
+        return self._load_via_staging(copy_rows)
+
+    def _load_via_staging(self, fill):
+        """Create the staging table, fill(cursor, staging) it, index, validate, swap"""
+        cursor = self.db.cursor
+        staging = sql.Identifier(STAGING_TABLE)
+        try:
+            logger.info(f"Creating staging table {STAGING_TABLE}")
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(staging))
+            cursor.execute(sql.SQL(
+                "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);"
+            ).format(staging, sql.Identifier(PROCESSED_TABLE)))
+
+            # logged from the start: an UNLOGGED table's SET LOGGED rewrites it
+            # and WAL-logs every page again (~45% more WAL than loading it logged)
+            expected = fill(cursor, staging)
+
+            # index after the bulk load
+            cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY (id);").format(
+                staging, sql.Identifier(f"{STAGING_TABLE}_pkey")))
+            for name, column in PROCESSED_INDEXES:
+                cursor.execute(sql.SQL("CREATE INDEX {} ON {} ({});").format(
+                    sql.Identifier(f"{name}_staging"), staging, sql.Identifier(column)))
+            cursor.execute(sql.SQL("ANALYZE {};").format(staging))
+            self.db.conn.commit()
+
+            cursor.execute(sql.SQL("SELECT count(*) FROM {};").format(staging))
+            staged = cursor.fetchone()[0]
+            if staged != expected:
+                raise ValueError(f"Staging table has {staged} rows, expected {expected}")
+            if not self.run_data_quality_checks(table_name = STAGING_TABLE):
+                raise ValueError("Data quality checks failed on staging table")
+
+            self._swap_staging_table()
+            logger.info(f"Successfully swapped {staged} records into {PROCESSED_TABLE}")
+            return staged
+
+        except Exception as e:
+            logger.error(f"error loading data via staging table: {e}")
+            self.db.conn.rollback()
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(staging))
+            self.db.conn.commit()
+            self._drop_outlier_staging()
+            raise
+
+    def build_in_database_query(self, outlier_condition = True):
+        """SELECT over properties_raw equivalent to extract_from_raw + transform_data.
+
+        With OUTLIER_METHOD = 'robust' rows are matched against this run's
+        staged outlier statistics, so refresh_outlier_stats must run first.
+        """
+        return TransformExecutor(steps = transform_steps(self.config), config = self.config).to_sql(
+            'properties_raw', RAW_EXTRACT_COLUMNS, PROCESSED_COLUMNS,
+            extract_conditions(self.config, outlier_condition, OUTLIER_STAGING_TABLES[OUTLIER_STATS_TABLE])
+        )
+
+    def outlier_stage_in_database(self):
+        """The outlier stage for in-database ETL: statistics from properties_raw, flagged rows copied in SQL"""
+        # only the columns the statistics need leave the database
+        self.refresh_outlier_stats(self.queries.read('outlier_inputs'))
+        select = self.build_in_database_query(outlier_condition = False)
+        query = f"""
+        INSERT INTO {OUTLIER_STAGING_TABLES[OUTLIERS_TABLE]} ({', '.join(OUTLIER_COLUMNS)})
+        SELECT {', '.join(f't.{col}' for col in PROCESSED_COLUMNS)}, s.low_price, s.high_price,
+            {'true' if self.config.OUTLIER_ACTION == 'quarantine' else 't.price <= 0'}
+        FROM ({select}) t
+        JOIN {OUTLIER_STAGING_TABLES[OUTLIER_STATS_TABLE]} s ON s.suburb = t.suburb AND s.type = t.type
+        WHERE NOT (t.price::float BETWEEN s.low_price AND s.high_price)
+        """
+        try:
+            self.db.cursor.execute(query)
+            logger.info(f"Outlier stage: {self.db.cursor.rowcount} sales flagged in-database")
+            self.db.conn.commit()
+        except Exception as e:
+            logger.error(f"error flagging outliers in-database: {e}")
+            self.db.conn.rollback()
+            raise
+
+    def run_in_database(self, strategy = None):
+        """In-database ETL: one INSERT ... SELECT, no rows pass through Python"""
+        strategy = strategy or self.config.PROCESSED_LOAD_STRATEGY
+        if self.config.OUTLIER_METHOD == 'robust':
+            self.outlier_stage_in_database()
+        select = self.build_in_database_query()
+        cols_str = ', '.join(PROCESSED_COLUMNS)
+        logger.info("Running in-database transform from properties_raw")
+
+        if strategy == 'swap':
+            def insert_rows(cursor, staging):
+                cursor.execute(sql.SQL("INSERT INTO {} ({}) ").format(staging, sql.SQL(cols_str)).as_string(self.db.conn) + select)
+                return cursor.rowcount
+            return self._load_via_staging(insert_rows)
+        if strategy != 'truncate':
+            raise ValueError(f"Unknown load strategy: {strategy}")
+
+        try:
+            # TRUNCATE, INSERT and the outlier tables commit together, so readers
+            # wait rather than seeing an empty table
+            self.db.cursor.execute("TRUNCATE TABLE properties_processed;")
+            self.db.cursor.execute(f"INSERT INTO properties_processed ({cols_str}) " + select)
+            loaded = self.db.cursor.rowcount
+            self.db.mark_loaded(PROCESSED_TABLE)
+            self._publish_outlier_tables(self.db.cursor)
+            self.db.conn.commit()
+            logger.info(f"Successfully loaded {loaded} records to properties_processed in-database")
+            return loaded
+        except Exception as e:
+            logger.error(f"error running in-database transform: {e}")
+            self.db.conn.rollback()
+            self._drop_outlier_staging()
+            raise
+
+    def _swap_staging_table(self):
+        cursor = self.db.cursor
+        live = sql.Identifier(PROCESSED_TABLE)
+        old = sql.Identifier(OLD_TABLE)
+
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id');", (PROCESSED_TABLE,))
+        sequence = cursor.fetchone()[0]
+
+        # one transaction: readers block briefly on the rename and then see the
+        # complete new table
+        cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(live, old))
+        cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(sql.Identifier(STAGING_TABLE), live))
+        if sequence:
+            # the id sequence belongs to the old table; move it before the drop
+            cursor.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.id;").format(sql.SQL(sequence), live))
+        cursor.execute(sql.SQL("DROP TABLE {};").format(old))
+        cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {};").format(
+            sql.Identifier(f"{STAGING_TABLE}_pkey"), sql.Identifier(f"{PROCESSED_TABLE}_pkey")))
+        for name, _ in PROCESSED_INDEXES:
+            cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {};").format(
+                sql.Identifier(f"{name}_staging"), sql.Identifier(name)))
+        self.db.mark_loaded(PROCESSED_TABLE)
+        self._publish_outlier_tables(cursor)
+        self.db.conn.commit()
+
+    def _sketch_store(self, df):
+        """Sketches of the loaded frame, or (in-database ETL) of per-segment aggregates of properties_processed"""
+        accuracy, precision = self.config.SKETCH_RELATIVE_ACCURACY, self.config.SKETCH_HLL_PRECISION
+        if df is not None:
+            return SketchStore.from_dataframe(df, relative_accuracy = accuracy, precision = precision)
+        # bucket counts and distinct suburbs per segment, not the rows themselves
+        log_gamma = math.log((1 + accuracy) / (1 - accuracy))
+        buckets = self.queries.read('sketch_buckets', (log_gamma,))
+        suburbs = self.queries.read('sketch_suburbs')
+        return SketchStore.from_aggregates(buckets, suburbs, relative_accuracy = accuracy, precision = precision)
+
+    def update_sketches(self, df = None):
+        """Rebuild per-segment price/suburb sketches from the loaded frame (or from properties_processed)"""
+        try:
+            store = self._sketch_store(df)
+            records = [
+                (t, d, n, psycopg2.Binary(p), psycopg2.Binary(ps), psycopg2.Binary(h))
+                for t, d, n, p, ps, h in store.to_records()
+            ]
+            self.db.cursor.execute("TRUNCATE TABLE properties_sketches;")
+            query = """
+            INSERT INTO properties_sketches
+                (type, distance_category, num_rows, price_sketch, price_per_sqm_sketch, suburb_hll)
+            VALUES %s
+            """
+            execute_values(self.db.cursor, query, records)
+            self.db.mark_loaded('properties_sketches')
+            self.db.conn.commit()
+            logger.info(f"Stored sketches for {len(records)} segments")
+            return store
+        except Exception as e:
+            logger.error(f"error updating sketches: {e}")
+            self.db.conn.rollback()
+            raise
+
+    def _processed_frame(self, df, columns):
+        """df if it has the columns (pandas ETL), else the model columns of properties_processed"""
+        if df is not None and set(columns).issubset(df.columns):
+            return df
+        # in-database ETL: only the columns the models need leave the database
+        return self.queries.read('valuation_features')
+
+    def update_valuation(self, df = None):
+        """Refit the valuation model on the processed rows and store its coefficients"""
+        try:
+            df = self._processed_frame(df, VALUATION_COLUMNS + ['price'])
+            model = ValuationModel(config = self.config).fit(df)
+            records = [
+                (kind, name, num_rows, psycopg2.Binary(data))
+                for kind, name, num_rows, data in model.to_records()
             ]
-            #convert dataframe to list of tuples
-            values = []
-            for _, row in df.iterrows():
-                values.append(tuple(row[col] if pd.notnull(row[col])else None for col in columns))
-
-            cols_str = ', '.join(columns)
-            query = f"INSERT INTO properties_processed ({cols_str}) VALUES %s"
-            logger.info(f"Loading {len(values)} records to properties_processed")
-            execute_values(self.db.cursor, query, values, page_size=1000)
+            self.db.create_valuation_table()
+            self.db.cursor.execute("TRUNCATE TABLE properties_valuation;")
+            query = "INSERT INTO properties_valuation (kind, name, num_rows, coefficients) VALUES %s"
+            execute_values(self.db.cursor, query, records)
+            self.db.mark_loaded('properties_valuation')
             self.db.conn.commit()
+            logger.info(f"Stored valuation model ({len(records)} coefficient rows)")
+            return model
+        except Exception as e:
+            logger.error(f"error updating valuation model: {e}")
+            self.db.conn.rollback()
+            raise
+
+    def update_comparables(self, df = None):
+        """Refresh the saved comparables index; only changed groups are re-sorted"""
+        df = self._processed_frame(df, COMPARABLES_COLUMNS)
+        index = comparables.load_or_build(df, self.config.COMPARABLES_PATH, self.config)
+        index.save(self.config.COMPARABLES_PATH)
+        return index
 
-            logger.info(f"Successfully loaded {len(values)} records to properties_processed")
+    def load_sketches(self):
+        return SketchStore.from_records(self.queries.fetchall('sketch_segments'))
 
+    def run_etl(self, cache = None):
+        """Extract/transform/load per ETL_MODE and refresh the derived sketches, valuation and comparables.
+
+        With a cache, the run is keyed by the transaction that last loaded
+        properties_raw, the transform code and ETL_CACHE_SETTINGS; it is
+        skipped when that key was already run and no load has written the
+        output tables since. Returns the
+        number of processed records.
+        """
+        if cache is not None:
+            key = cache.key(
+                'run_etl',
+                inputs = {'raw': self.queries.scalar('table_load_txid', ('properties_raw',))},
+                code = [sys.modules[__name__], transforms, parallel_transform, outliers, sketches, star_schema, valuation, comparables],
+                params = {name: getattr(self.config, name) for name in ETL_CACHE_SETTINGS}
+            )
+            entry = cache.get(key)
+            if (entry is not None and entry['meta'].get('outputs') == self._etl_output_loads()
+                    and os.path.exists(self.config.COMPARABLES_PATH)):
+                logger.info("properties_raw and transforms unchanged, skipping ETL")
+                return entry['meta']['records']
+
+        if self.config.ETL_MODE == 'in_database':
+            self.run_in_database()
+            # the derived tables read what they need from properties_processed
+            df_transformed = None
+        else:
+            df_transformed = self.transform_data(self.extract_from_raw())
+            self.load_to_processed(df_transformed)
+        if self.config.SCHEMA_MODE == 'star':
+            self.load_star_schema(df_transformed)
+        self.update_sketches(df_transformed)
+        self.update_valuation(df_transformed)
+        self.update_comparables(df_transformed)
+        if self.config.CHANGE_FEED_ENABLED:
+            # after the derived tables, so listeners never see a half-finished run
+            self.record_changes()
+        records = len(df_transformed) if df_transformed is not None else self.queries.scalar('processed_count')
+
+        if cache is not None:
+            cache.put(key, 'run_etl', meta = {
+                'records': records,
+                'outputs': self._etl_output_loads()
+            })
+        return records
+
+    def record_changes(self):
+        """Log the partitions this load changed in properties_changelog and NOTIFY listeners.
+
+        Each (suburb, month sold) partition of properties_processed is
+        summarised by its row count and md5 digest in one scan, and compared
+        with the summary stored at the last recorded change, so a load that
+        rewrites identical rows records nothing. Returns the changelog id, or
+        None if nothing changed.
+        """
+        self.db.create_changelog_tables()
+        before = {(suburb, month): (num_rows, digest)
+                  for suburb, month, num_rows, digest in self.queries.fetchall('change_partitions')}
+        partitions = self.queries.fetchall('processed_partitions')
+        after = {(suburb, month): (num_rows, digest) for suburb, month, num_rows, _, _, digest in partitions}
+        inserted, updated, deleted = change_feed.partition_changes(before, after)
+        changed = inserted | updated | deleted
+        if not changed:
+            logger.info("properties_processed unchanged, no change recorded")
+            return None
+        suburbs = sorted({suburb for suburb, _ in changed if suburb is not None})
+        months = sorted({month for _, month in changed if month is not None})
+        num_rows = sum(row[2] for row in partitions)
+        min_id = min((row[3] for row in partitions), default = None)
+        max_id = max((row[4] for row in partitions), default = None)
+        try:
+            cursor = self.db.cursor
+            cursor.execute("TRUNCATE TABLE properties_change_partitions;")
+            execute_values(
+                cursor,
+                "INSERT INTO properties_change_partitions (suburb, month, num_rows, digest) VALUES %s",
+                [(suburb, month, n, digest) for (suburb, month), (n, digest) in after.items()]
+            )
+            cursor.execute(
+                """
+                INSERT INTO properties_changelog
+                    (table_name, etl_mode, num_rows, table_min_id, table_max_id, partitions_inserted,
+                     partitions_updated, partitions_deleted, suburbs, months)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s::text[], %s::date[])
+                RETURNING id;
+                """,
+                (PROCESSED_TABLE, self.config.ETL_MODE, num_rows, min_id, max_id,
+                 len(inserted), len(updated), len(deleted), suburbs, months)
+            )
+            change_id = cursor.fetchone()[0]
+            # delivered on commit; listeners read the rest from the changelog
+            payload = json.dumps({'id': change_id, 'table': PROCESSED_TABLE, 'suburbs': len(suburbs), 'months': len(months)})
+            cursor.execute("SELECT pg_notify(%s, %s);", (change_feed.CHANNEL, payload))
+            self.db.conn.commit()
+            logger.info(f"Recorded change {change_id}: {len(inserted)} partitions inserted, {len(updated)} updated, "
+                        f"{len(deleted)} deleted across {len(suburbs)} suburbs")
+            return change_id
         except Exception as e:
-            logger.error(f"error loading data: {e}")
+            logger.error(f"error recording changes: {e}")
             self.db.conn.rollback()
             raise
 
-    def run_data_quality_checks(self):
+    def load_star_schema(self, df):
+        """Refresh fact_sales and its dimensions after properties_processed is loaded (in addition to it)"""
+        if self.star_loader is None:
+            # keeps the dimension key cache for the life of the pipeline
+            self.db.create_star_tables()
+            self.star_loader = StarSchemaLoader(self.db, config = self.config)
+        if self.config.ETL_MODE == 'in_database':
+            return self.star_loader.load_from_processed()
+        return self.star_loader.load(df)
+
+    def _etl_output_loads(self):
+        tables = [PROCESSED_TABLE, 'properties_sketches', 'properties_valuation']
+        if self.config.SCHEMA_MODE == 'star':
+            tables.append(FACT_TABLE)
+        if self.config.OUTLIER_METHOD == 'robust':
+            tables.append('properties_outliers')
+        return {t: self.queries.scalar('table_load_txid', (t,)) for t in tables}
+
+    def run_data_quality_checks(self, table_name = PROCESSED_TABLE):
         logger.info("\n===Running data quality checks ===")
 
+        # one batch (a single pipelined round trip on psycopg 3)
+        null_count, invalid_price, invalid_dist, missing_cal = self.queries.scalars(
+            ['dq_null_critical', 'dq_invalid_price', 'dq_invalid_distance', 'dq_missing_price_per_sqm'],
+            processed = table_name
+        )
+
         checks = []
-        query = """ select count(*) from properties_processed where price is NULL or suburb is NULL or type is NULL;"""
-        self.db.cursor.execute(query)
-        null_count = self.db.cursor.fetchone()[0]
         checks.append(("No nulls in critical columns", null_count == 0, f"{null_count} nulls found"))
-        query = "select count(*) from properties_processed where price <= 0;"
-        self.db.cursor.execute(query)
-        invalid_price = self.db.cursor.fetchone()[0]
         checks.append(("All prices positive", invalid_price == 0, f"{invalid_price} invalid prices"))
-
-        query = "select count(*) from properties_processed where km_from_cbd < 0;"
-        self.db.cursor.execute(query)
-        invalid_dist = self.db.cursor.fetchone()[0]
         checks.append(("all distances are valid", invalid_dist == 0, f"{invalid_dist} invalid distances"))
-
-                       
-        query = """
-        select count(*) from properties_processed where property_size > 0 and price_per_sqm is NULL;
-        """
-        self.db.cursor.execute(query)
-        missing_cal = self.db.cursor.fetchone()[0]
         checks.append(("price per sqm calculated", missing_cal == 0, f"{missing_cal} missing"))
 
         all_passed = True
@@ -155,22 +639,11 @@ class ETLPipeline:
             logger.warning("\n Some data quality checks failed")
         return all_passed
     
-    def get_summary_stats(self):
-        query = """
-        select 
-            count(*) as total_records,
-            count(distinct suburb) as unique_suburbs,
-            count(distinct type) as unique_types,
-            avg(price)::NUMERIC(10,2) as avg_price,
-            min(price)::NUMERIC(10,2) as min_price,
-            max(price)::NUMERIC(10,2) as max_price,
-            avg(num_bed)::NUMERIC(3,1) as avg_bedrooms,
-            avg(price_per_sqm)::NUMERIC(10,2) as avg_price_per_sqm
-        from properties_processed;
-        """
+    def get_summary_stats(self, use_sketches = False):
+        if use_sketches:
+            return self._get_sketch_summary_stats()
 
-        self.db.cursor.execute(query)
-        stats = self.db.cursor.fetchone()
+        stats = self.queries.fetchone('summary_stats')
 
         logger.info("\n===Summary Statistics===")
         logger.info(f"Total records: {stats[0]:,}")
@@ -181,22 +654,39 @@ class ETLPipeline:
         logger.info(f"Average bedrooms: {stats[6]}")
         logger.info(f"Average price/sqm: ${stats[7]:,.2f}" if stats[7] else "N/A")
 
+    def _get_sketch_summary_stats(self):
+        #distinct counts and percentiles come from the merged sketches, so only
+        #cheap single-pass aggregates hit the table
+        stats = self.queries.fetchone('summary_stats_single_pass')
+        store = self.load_sketches()
+        merged = store.merged()
+
+        logger.info("\n===Summary Statistics (approximate)===")
+        logger.info(f"Total records: {stats[0]:,}")
+        logger.info(f"Unique suburbs: ~{merged.suburbs.estimate()}")
+        logger.info(f"Property types: {len({t for t, _ in store.segments})}")
+        logger.info(f"Average price: ${stats[1]:,.2f}")
+        logger.info(f"Price range: ${stats[2]:,.2f} - ${stats[3]:,.2f}")
+        if merged.price.count:
+            logger.info(f"Median price: ~${merged.price.quantile(0.5):,.0f} "
+                        f"(p25 ~${merged.price.quantile(0.25):,.0f}, p90 ~${merged.price.quantile(0.9):,.0f})")
+        logger.info(f"Average bedrooms: {stats[4]}")
+        logger.info(f"Average price/sqm: ${stats[5]:,.2f}" if stats[5] else "N/A")
+
     def close(self):
         self.db.close()
     
 def main():
-    pipeline = ETLPipeline()
+    parser = add_config_arguments(argparse.ArgumentParser(description = "Run the ETL from properties_raw to properties_processed"))
+    pipeline = ETLPipeline(config = configure(parser.parse_args()))
     try:
         logger.info("=" * 60)
         logger.info("STARTING ETL PIPELINE")
         logger.info("=" * 60)
 
-        #extract 
-        df_raw = pipeline.extract_from_raw()
-        df_transformed = pipeline.transform_data(df_raw)
-
-        pipeline.load_to_processed(df_transformed)
-        pipeline.run_data_quality_checks()
+        pipeline.run_etl()
+        if not pipeline.run_data_quality_checks():
+            raise ValueError("Data quality checks failed!")
         pipeline.get_summary_stats()
         
         logger.info("\n" + "=" * 60)
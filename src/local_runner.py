@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from src.analytics import PropertyAnalytics
+from src.artifact_cache import ArtifactCache
+from src.change_feed import ChangeFeed
+from src.config import Config, add_config_arguments, configure
+from src.data_loader import DataLoader
+from src.db_loader import DatabaseLoader
+from src.db_setup import DatabaseSetup, create_connection_pool
+from src.etl_pipeline import ETLPipeline
+from src.timeseries import TimeSeriesRollup
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    """A pipeline task: what it runs, what it waits for and where it runs.
+
+    offload='thread' tasks get a pooled DatabaseSetup (carrying the run's
+    config) and the shared artifact dict; offload='process' tasks get the
+    run's Config, run without a connection and must return plain
+    (picklable) values.
+    """
+
+    def __init__(self, name, func, upstream = (), offload = 'thread'):
+        self.name = name
+        self.func = func
+        self.upstream = list(upstream)
+        self.offload = offload
+
+
+# --- task bodies; each returns a dict merged into the shared artifacts ---
+
+def get_cache(config = None):
+    config = config or Config()
+    return ArtifactCache(config = config) if config.ARTIFACT_CACHE_ENABLED else None
+
+
+def load_raw_data(config):
+    """Load, clean and save the raw CSV (CPU-bound, no database)"""
+    filepath = DataLoader(config = config).prepare_processed_data(cache = get_cache(config))
+    return {'processed_file': filepath}
+
+
+def load_raw_to_db(db, artifacts):
+    loader = DatabaseLoader(db = db, config = db.config)
+    cache = get_cache(db.config)
+    if cache:
+        inserted = loader.load_csv_cached(artifacts['processed_file'], cache)
+    else:
+        inserted = loader.load_csv_streaming(artifacts['processed_file'])
+    return {'raw_rows_inserted': inserted}
+
+
+def run_etl(db, artifacts):
+    pipeline = ETLPipeline(db = db, config = db.config)
+    records = pipeline.run_etl(cache = get_cache(db.config))
+
+    if not pipeline.run_data_quality_checks():
+        raise ValueError("Data quality checks failed!")
+    return {'etl_records': records}
+
+
+def generate_summary(db, artifacts):
+    ETLPipeline(db = db, config = db.config).get_summary_stats()
+    return {}
+
+
+def refresh_timeseries(db, artifacts):
+    rollup = TimeSeriesRollup(db = db, config = db.config)
+    if not db.config.CHANGE_FEED_ENABLED:
+        rollups = rollup.refresh()
+    else:
+        # from the earliest month the ETL changed
+        rollups = rollup.refresh_changes(ChangeFeed(db, config = db.config))
+        if rollups is None:
+            return {'timeseries_rows': 0}
+    rollup.export_csv()
+    return {'timeseries_rows': len(rollups)}
+
+
+def run_analytics(db, artifacts):
+    analytics = PropertyAnalytics(db = db, config = db.config)
+    analytics.price_by_distance()
+    analytics.house_vs_apt()
+    analytics.top_suburbs_by_value()
+    analytics.most_expensive_suburbs()
+    return {'suburb_centroids_file': analytics.export_suburb_centroids()}
+
+
+def notify_completion(db, artifacts):
+    logger.info(f"Pipeline completed successfully at {datetime.now():%Y-%m-%d %H:%M:%S}")
+    return {}
+
+
+# dags/property_pipeline_dag.py, plus the analytics report
+PIPELINE_TASKS = [
+    Task('load_raw_data', load_raw_data, offload = 'process'),
+    Task('load_raw_to_db', load_raw_to_db, ['load_raw_data']),
+    Task('run_etl_pipeline', run_etl, ['load_raw_to_db']),
+    Task('generate_summary', generate_summary, ['run_etl_pipeline']),
+    Task('refresh_timeseries', refresh_timeseries, ['run_etl_pipeline']),
+    Task('run_analytics', run_analytics, ['run_etl_pipeline']),
+    Task('notify_completion', notify_completion, ['generate_summary', 'refresh_timeseries', 'run_analytics']),
+]
+
+
+class LocalPipelineRunner:
+    """Run the pipeline DAG locally without Airflow.
+
+    Tasks start as soon as their upstream tasks succeed, so independent
+    branches run concurrently. Thread tasks share one connection pool and one
+    in-memory artifact dict. Progress is written to a state file after every
+    task; with resume=True, tasks that succeeded in the previous run are
+    skipped and their JSON-serialisable artifacts restored.
+    """
+
+    def __init__(self, tasks = None, state_path = None, config = None):
+        self.config = config or Config()
+        self.tasks = tasks or PIPELINE_TASKS
+        self.state_path = state_path or self.config.PIPELINE_STATE_PATH
+        self.artifacts = {}
+        self.state = {}
+
+        names = {t.name for t in self.tasks}
+        for task in self.tasks:
+            missing = set(task.upstream) - names
+            if missing:
+                raise ValueError(f"Task {task.name} depends on unknown tasks: {missing}")
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def _save_state(self):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent = 2, default = str)
+        os.replace(tmp_path, self.state_path)
+
+    def _record(self, task, status, artifacts = None, error = None):
+        entry = {'status': status, 'finished_at': datetime.now().isoformat()}
+        if artifacts:
+            # only plain values survive a restart; frames stay in memory
+            entry['artifacts'] = {
+                k: v for k, v in artifacts.items() if isinstance(v, (str, int, float, bool, type(None)))
+            }
+        if error:
+            entry['error'] = error
+        self.state['tasks'][task.name] = entry
+        self._save_state()
+
+    def _run_in_thread(self, task):
+        conn = self.pool.getconn()
+        db = DatabaseSetup(conn = conn, config = self.config)
+        try:
+            result = task.func(db, self.artifacts)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            db.close()
+            self.pool.putconn(conn)
+
+    async def _run_task(self, task, upstream_futures, previous):
+        outcomes = await asyncio.gather(*upstream_futures)
+        if not all(outcomes):
+            logger.warning(f"Skipping {task.name}: an upstream task failed")
+            self._record(task, 'upstream_failed')
+            return False
+
+        if previous.get(task.name, {}).get('status') == 'success':
+            logger.info(f"Resuming: {task.name} already succeeded, skipping")
+            self.artifacts.update(previous[task.name].get('artifacts', {}))
+            self.state['tasks'][task.name] = previous[task.name]
+            self._save_state()
+            return True
+
+        loop = asyncio.get_running_loop()
+        logger.info(f"Starting task {task.name}")
+        started = loop.time()
+        try:
+            if task.offload == 'process':
+                # the config pickles with its settings, so --set/--config reach spawned workers
+                result = await loop.run_in_executor(self.process_pool, task.func, self.config)
+            else:
+                result = await loop.run_in_executor(self.thread_pool, self._run_in_thread, task)
+        except Exception as e:
+            logger.error(f"Task {task.name} failed: {e}")
+            self._record(task, 'failed', error = str(e))
+            return False
+
+        result = result or {}
+        self.artifacts.update(result)
+        self._record(task, 'success', result)
+        logger.info(f"Task {task.name} finished in {loop.time() - started:.1f}s")
+        return True
+
+    async def _run(self, resume):
+        previous = {}
+        if resume:
+            last = self._load_state()
+            if last:
+                previous = last.get('tasks', {})
+                logger.info(f"Resuming run {last.get('run_id')}")
+        self.state = {'run_id': uuid.uuid4().hex[:12], 'started_at': datetime.now().isoformat(), 'tasks': {}}
+
+        futures = {}
+        for task in self.tasks:
+            upstream = [futures[name] for name in task.upstream]
+            futures[task.name] = asyncio.ensure_future(self._run_task(task, upstream, previous))
+        outcomes = await asyncio.gather(*futures.values())
+        return all(outcomes)
+
+    def run(self, resume = False):
+        """Run every task; returns True if all of them succeeded"""
+        self.pool = create_connection_pool(config = self.config)
+        self.thread_pool = ThreadPoolExecutor(max_workers = self.config.DB_POOL_SIZE)
+        self.process_pool = ProcessPoolExecutor(max_workers = self.config.LOCAL_RUNNER_PROCESSES)
+        try:
+            succeeded = asyncio.run(self._run(resume))
+        finally:
+            self.thread_pool.shutdown()
+            self.process_pool.shutdown()
+            self.pool.closeall()
+
+        if succeeded:
+            logger.info("Local pipeline run complete")
+        else:
+            logger.error(f"Local pipeline run failed; re-run with --resume to continue (state: {self.state_path})")
+        return succeeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Run the property pipeline locally without Airflow")
+    parser.add_argument('--resume', action = 'store_true', help = "skip tasks that succeeded in the last run")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    runner = LocalPipelineRunner(config = configure(args))
+    if not runner.run(resume = args.resume):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+from src.config import Config
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+GROUP_COLUMNS = ['suburb', 'type']
+# suburb of the per-type rows that small (suburb, type) groups fall back to
+TYPE_WIDE = '*'
+# MAD * MAD_SCALE estimates the standard deviation for normal data
+MAD_SCALE = 1.4826
+# floor on the log-price scale, so a group of near-identical prices does not
+# flag every other sale in it
+MIN_LOG_SCALE = 0.05
+STAT_COLUMNS = ['num_rows', 'median_log_price', 'mad_log_price', 'group_hash']
+
+
+def _prepare(df):
+    frame = pd.DataFrame({
+        'suburb': df['suburb'].astype(str).to_numpy(),
+        'type': df['type'].astype(str).to_numpy(),
+        'price': pd.to_numeric(df['price'], errors='coerce').to_numpy(dtype = float),
+    })
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        # non-positive prices get no log and are always outliers
+        frame['log_price'] = np.where(frame['price'] > 0, np.log(frame['price']), np.nan)
+    return frame
+
+
+def _group_codes(frame):
+    """Per-row (suburb, type) group codes and type codes, with the groups and types they index.
+
+    Columns are factorized one at a time and combined as integers, which is
+    much cheaper than hashing (suburb, type) tuples.
+    """
+    suburb_codes, suburbs = pd.factorize(frame['suburb'])
+    type_codes, types = pd.factorize(frame['type'])
+    codes, pairs = pd.factorize(suburb_codes.astype(np.int64) * len(types) + type_codes)
+    groups = pd.MultiIndex.from_arrays(
+        [np.asarray(suburbs)[pairs // len(types)], np.asarray(types)[pairs % len(types)]], names = GROUP_COLUMNS)
+    type_groups = pd.MultiIndex.from_arrays(
+        [np.full(len(types), TYPE_WIDE, dtype = object), np.asarray(types)], names = GROUP_COLUMNS)
+    return codes, groups, type_codes, type_groups
+
+
+def _empty_stats():
+    index = pd.MultiIndex.from_arrays([[], []], names = GROUP_COLUMNS)
+    return pd.DataFrame({col: pd.Series(dtype = np.int64 if col in ('num_rows', 'group_hash') else float)
+                         for col in STAT_COLUMNS}, index = index)
+
+
+def robust_stats(log_price, codes):
+    """(num_rows, median, MAD) of log_price per group code, in one groupby-transform pass"""
+    grouped = pd.Series(log_price).groupby(codes, sort = True)
+    median = grouped.median()
+    # broadcast each group's median back to its rows by code, then the MAD
+    deviation = np.abs(log_price - median.to_numpy()[codes])
+    mad = pd.Series(deviation).groupby(codes, sort = True).median()
+    return grouped.count().to_numpy(), median.to_numpy(), mad.to_numpy()
+
+
+class OutlierStats:
+    """Robust per-(suburb, type) log-price statistics for the outlier stage.
+
+    A sale is an outlier when its log price is more than
+    OUTLIER_MAD_THRESHOLD robust standard deviations (MAD * 1.4826) from its
+    group median, so the accepted range follows each segment's own market.
+    Groups with fewer than OUTLIER_MIN_GROUP_ROWS sales use the type-wide
+    statistics instead. Statistics are one small row per group, each with an
+    order-independent hash of its prices, and refresh() recomputes only the
+    groups whose hash changed.
+    """
+
+    def __init__(self, threshold = None, min_group_rows = None, config = None):
+        config = config or Config()
+        self.threshold = threshold or config.OUTLIER_MAD_THRESHOLD
+        self.min_group_rows = min_group_rows or config.OUTLIER_MIN_GROUP_ROWS
+        # (suburb, type) -> STAT_COLUMNS; suburb TYPE_WIDE holds the per-type rows
+        self.stats = _empty_stats()
+
+    def __len__(self):
+        return len(self.stats)
+
+    def _refresh_level(self, codes, groups, log_price, row_hashes):
+        """Stats for each group: recomputed if its hash changed, else cached"""
+        hashes = pd.Series(row_hashes).groupby(codes, sort = True).sum().to_numpy().view(np.int64)
+
+        position = self.stats.index.get_indexer(groups)
+        cached_hashes = self.stats['group_hash'].to_numpy()
+        changed = position < 0
+        if len(cached_hashes):
+            changed |= cached_hashes[position] != hashes
+
+        rows = changed[codes]
+        # compact the changed groups' codes to 0..k-1
+        changed_codes = np.flatnonzero(changed)
+        remap = np.full(len(groups), -1, dtype = np.int64)
+        remap[changed_codes] = np.arange(len(changed_codes))
+        num_rows, median, mad = robust_stats(log_price[rows], remap[codes[rows]])
+        recomputed = pd.DataFrame({
+            'num_rows': num_rows,
+            'median_log_price': median,
+            'mad_log_price': mad,
+            'group_hash': hashes[changed_codes],
+        }, index = groups[changed_codes])
+        kept = self.stats.iloc[position[~changed]]
+        return pd.concat([kept, recomputed]), len(changed_codes)
+
+    def refresh(self, df):
+        """Bring the statistics in line with df's sales; returns the number of groups recomputed"""
+        frame = _prepare(df)
+        row_hashes = pd.util.hash_array(frame['price'].to_numpy())
+        log_price = frame['log_price'].to_numpy()
+        codes, groups, type_codes, type_groups = _group_codes(frame)
+        groups, changed_groups = self._refresh_level(codes, groups, log_price, row_hashes)
+        types, changed_types = self._refresh_level(type_codes, type_groups, log_price, row_hashes)
+        self.stats = pd.concat([groups, types])
+        self.stats.index.names = GROUP_COLUMNS
+        logger.info(f"Outlier stats: {len(groups)} suburb/type groups ({changed_groups} recomputed), "
+                    f"{len(types)} types ({changed_types} recomputed)")
+        return changed_groups + changed_types
+
+    def bounds(self):
+        """low_price/high_price per (suburb, type), small groups resolved to their type-wide row"""
+        stats = self.stats
+        suburbs = stats.index.get_level_values('suburb')
+        types = stats.index.get_level_values('type')
+        scale = np.maximum(stats['mad_log_price'].to_numpy() * MAD_SCALE, MIN_LOG_SCALE)
+        center = stats['median_log_price'].to_numpy()
+
+        type_wide = pd.Index(types[suburbs == TYPE_WIDE])
+        fallback = stats['num_rows'].to_numpy() < self.min_group_rows
+        fallback &= (suburbs != TYPE_WIDE)
+        source = np.arange(len(stats))
+        type_rows = np.flatnonzero(suburbs == TYPE_WIDE)
+        source[fallback] = type_rows[type_wide.get_indexer(types[fallback])]
+
+        return pd.DataFrame({
+            'low_price': np.exp(center[source] - self.threshold * scale[source]),
+            'high_price': np.exp(center[source] + self.threshold * scale[source]),
+        }, index = stats.index)
+
+    def price_bounds(self, df):
+        """(low_price, high_price) arrays for each row of df; NaN for groups the stats have not seen"""
+        bounds = self.bounds()
+        codes, groups, _, _ = _group_codes(_prepare(df))
+        # look up each distinct group once, then gather per row
+        position = bounds.index.get_indexer(groups)[codes]
+        low = np.append(bounds['low_price'].to_numpy(), np.nan)[position]
+        high = np.append(bounds['high_price'].to_numpy(), np.nan)[position]
+        return low, high
+
+    def mask(self, df):
+        """True for the rows of df that are not outliers.
+
+        A missing or non-positive price is always an outlier, including in
+        groups with no positive prices (and so no bounds).
+        """
+        low, high = self.price_bounds(df)
+        price = pd.to_numeric(df['price'], errors='coerce').to_numpy(dtype = float)
+        unseen = np.isnan(low)
+        with np.errstate(invalid = 'ignore'):
+            return pd.Series((price > 0) & (unseen | ((price >= low) & (price <= high))), index = df.index)
+
+    def to_records(self):
+        """(suburb, type, num_rows, median, mad, low_price, high_price, group_hash) rows for properties_outlier_stats"""
+        bounds = self.bounds()
+        return [
+            (suburb, type_, int(num_rows), float(median), float(mad), float(low), float(high), int(group_hash))
+            for (suburb, type_), num_rows, median, mad, group_hash, low, high in zip(
+                self.stats.index, self.stats['num_rows'], self.stats['median_log_price'],
+                self.stats['mad_log_price'], self.stats['group_hash'],
+                bounds['low_price'], bounds['high_price']
+            )
+        ]
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        """From properties_outlier_stats rows (suburb, type, num_rows, median, mad, group_hash)"""
+        stats = cls(**kwargs)
+        if not records:
+            return stats
+        frame = pd.DataFrame(records, columns = GROUP_COLUMNS + ['num_rows', 'median_log_price', 'mad_log_price', 'group_hash'])
+        frame = frame.astype({'num_rows': np.int64, 'median_log_price': float, 'mad_log_price': float, 'group_hash': np.int64})
+        stats.stats = frame.set_index(GROUP_COLUMNS)[STAT_COLUMNS]
+        return stats
+
+
+def main():
+    from src.db_setup import DatabaseSetup
+    from src.queries import QueryCatalog
+
+    parser = argparse.ArgumentParser(description = "Time the outlier statistics over a scaled-up sales table")
+    parser.add_argument('--scale', type = int, default = 100, help = "copies of properties_raw to process")
+    args = parser.parse_args()
+
+    db = DatabaseSetup()
+    db.connect()
+    try:
+        df = QueryCatalog(db).read('outlier_inputs')
+    finally:
+        db.close()
+    # perturb the copies so every group's prices differ from the original
+    big = pd.concat([df] * args.scale, ignore_index = True)
+    big['price'] = big['price'] * np.random.default_rng(0).uniform(0.9, 1.1, len(big))
+
+    stats = OutlierStats()
+    started = time.perf_counter()
+    stats.refresh(big)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Full refresh of {len(big):,} sales in {elapsed:.3f}s ({len(big) / elapsed:,.0f} rows/s)")
+
+    started = time.perf_counter()
+    mask = stats.mask(big)
+    logger.info(f"Flagged {int((~mask).sum()):,} outliers in {time.perf_counter() - started:.3f}s")
+
+    # one suburb's sales change: only its groups and their types are recomputed
+    suburb = big['suburb'].iloc[0]
+    big.loc[big['suburb'] == suburb, 'price'] *= 1.05
+    started = time.perf_counter()
+    recomputed = stats.refresh(big)
+    logger.info(f"Incremental refresh ({recomputed} groups) in {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from src.config import Config
+from src.transforms import TransformExecutor
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow ships with requirements-full.txt only
+    pa = None
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+ROW_ORDER_COLUMN = '_row_order'
+
+
+def partition_by_suburb(df, num_partitions):
+    """Partition number per row; every sale of a suburb lands in the same one"""
+    hashes = pd.util.hash_array(df['suburb'].astype(str).to_numpy())
+    return (hashes % np.uint64(num_partitions)).astype(np.int64)
+
+
+def _write_ipc(table, sink):
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _to_ipc_buffer(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    _write_ipc(table, sink)
+    return sink.getvalue()
+
+
+def _to_shared_memory(df):
+    """Write df as an Arrow IPC stream directly into a new shared memory block"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    mock = pa.MockOutputStream()
+    _write_ipc(table, mock)
+    size = mock.size()
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    _write_ipc(table, pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)))
+    return shm, size
+
+
+def _transform_partition(shm_name, size, step_names, config):
+    # the input frame is read straight out of the parent's shared memory block;
+    # only the transformed result travels back, as one Arrow IPC buffer
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        df = pa.ipc.open_stream(pa.py_buffer(shm.buf[:size])).read_all().to_pandas()
+        out = TransformExecutor(steps = step_names, config = config).run(df)
+        result = _to_ipc_buffer(out).to_pybytes()
+        # drop every view into the block before closing it
+        del df, out
+        return result
+    finally:
+        shm.close()
+
+
+def transform_partitioned(df, steps = None, config = None, workers = None):
+    """Run the transform chain over suburb partitions in a process pool.
+
+    Partitions are handed to workers through shared memory as Arrow IPC
+    streams, so the input is never pickled. Steps may compute per-suburb
+    statistics, since a suburb never spans two partitions. Output rows come
+    back in the input order.
+    """
+    config = config or Config()
+    workers = workers or config.TRANSFORM_WORKERS or os.cpu_count()
+    executor = TransformExecutor(steps = steps, config = config)
+    step_names = [s.name for s in executor.steps]
+
+    if pa is None or workers <= 1 or len(df) < config.PARALLEL_TRANSFORM_MIN_ROWS:
+        if pa is None and workers > 1:
+            logger.warning("pyarrow is not installed; running transforms in a single process")
+        return executor.run(df)
+
+    original_index = df.index
+    df = df.reset_index(drop=True)
+    df[ROW_ORDER_COLUMN] = np.arange(len(df))
+    partitions = partition_by_suburb(df, workers)
+
+    blocks = []
+    try:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            futures = []
+            for p in range(workers):
+                part = df[partitions == p]
+                if part.empty:
+                    continue
+                shm, size = _to_shared_memory(part)
+                blocks.append(shm)
+                futures.append(pool.submit(_transform_partition, shm.name, size, step_names, config))
+
+            results = [
+                pa.ipc.open_stream(pa.py_buffer(f.result())).read_all().to_pandas()
+                for f in futures
+            ]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    out = pd.concat(results, ignore_index=True).sort_values(ROW_ORDER_COLUMN, kind='stable')
+    out.index = original_index[out[ROW_ORDER_COLUMN].to_numpy()]
+    logger.info(f"Transformed {len(out)} records across {len(futures)} worker partitions")
+    return out.drop(columns=[ROW_ORDER_COLUMN])
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import struct
+import pandas as pd
+from src.config import Config
+
+try:
+    import psycopg
+    from psycopg import sql
+    from psycopg.adapt import Loader
+    from psycopg.pq import Format
+    from psycopg.types.numeric import FloatLoader
+except ImportError:  # psycopg 3 ships with requirements-full.txt only
+    psycopg = None
+    Loader = object
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _require_psycopg():
+    if psycopg is None:
+        raise ImportError("DB_BACKEND = 'psycopg3' needs psycopg 3: pip install 'psycopg[binary]'")
+
+
+# binary NUMERIC: ndigits, weight (of the first base-10000 digit), sign, dscale
+NUMERIC_HEADER = struct.Struct('>hhHH')
+NUMERIC_NEG = 0x4000
+NUMERIC_NAN = 0xC000
+
+
+class FloatNumericBinaryLoader(Loader):
+    """Binary NUMERIC -> float, rounded exactly as the text FloatLoader rounds"""
+    format = Format.BINARY if psycopg else None
+
+    def load(self, data):
+        ndigits, weight, sign, _ = NUMERIC_HEADER.unpack_from(data)
+        if sign == NUMERIC_NAN:
+            return float('nan')
+        value = 0
+        for digit in struct.unpack_from(f'>{ndigits}h', data, NUMERIC_HEADER.size):
+            value = value * 10000 + digit
+        # int / int is correctly rounded, like parsing the decimal text
+        shift = ndigits - 1 - weight
+        value = value / 10000 ** shift if shift > 0 else float(value * 10000 ** -shift)
+        return -value if sign == NUMERIC_NEG else value
+
+
+def _connect_kwargs(config, autocommit = True):
+    return dict(
+        host = config.DB_HOST,
+        port = config.DB_PORT,
+        dbname = config.DB_NAME,
+        user = config.DB_USER,
+        password = config.DB_PASSWORD,
+        # decode text as str even on SQL_ASCII databases
+        client_encoding = 'utf8',
+        # reads are autocommit; an open transaction would hold locks that
+        # block the processed-table swap on the psycopg2 connection
+        autocommit = autocommit,
+        prepare_threshold = config.QUERY_PREPARE_THRESHOLD,
+    )
+
+
+def _configure(conn):
+    # NUMERIC -> float in C: no decimal.Decimal per cell
+    conn.adapters.register_loader('numeric', FloatLoader)
+    # binary results have no C loader to float; decode the digits directly
+    conn.adapters.register_loader('numeric', FloatNumericBinaryLoader)
+    return conn
+
+
+def connect(config = None, autocommit = True):
+    """psycopg 3 connection: autocommit (for reads), NUMERIC as float, auto-prepare"""
+    _require_psycopg()
+    config = config or Config()
+    return _configure(psycopg.connect(**_connect_kwargs(config, autocommit)))
+
+
+async def connect_async(config = None):
+    _require_psycopg()
+    config = config or Config()
+    return _configure(await psycopg.AsyncConnection.connect(**_connect_kwargs(config)))
+
+
+def _frame(cursor):
+    columns = [d.name for d in cursor.description]
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=columns, coerce_float=True)
+
+
+def read_frame(conn, query, params = None, binary = False):
+    with conn.cursor(binary = binary) as cursor:
+        cursor.execute(query, params)
+        return _frame(cursor)
+
+
+def fetch_scalars(conn, queries, binary = False):
+    """First value of each query, sent together in pipeline mode (one round trip)"""
+    cursors = []
+    with conn.pipeline():
+        for query, params in queries:
+            cursor = conn.cursor(binary = binary)
+            cursor.execute(query, params)
+            cursors.append(cursor)
+    values = []
+    for cursor in cursors:
+        values.append(cursor.fetchone()[0])
+        cursor.close()
+    return values
+
+
+def copy_rows_binary(cursor, table, df, columns):
+    """COPY df's columns into table with the binary protocol.
+
+    Values are encoded per the table's column types, so a staging table
+    with double precision columns takes floats without any decimal text.
+    """
+    table = sql.Identifier(table)
+    cols = sql.SQL(', ').join(map(sql.Identifier, columns))
+    cursor.execute(sql.SQL("SELECT {} FROM {} LIMIT 0").format(cols, table))
+    types = [d.type_code for d in cursor.description]
+    frame = df[columns].astype(object)
+    frame = frame.where(frame.notna(), None)
+    with cursor.copy(sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(table, cols)) as copy:
+        copy.set_types(types)
+        for row in frame.itertuples(index = False, name = None):
+            copy.write_row(row)
+
+
+async def read_frame_async(conn, query, params = None, binary = False):
+    async with conn.cursor(binary = binary) as cursor:
+        await cursor.execute(query, params)
+        columns = [d.name for d in cursor.description]
+        rows = await cursor.fetchall()
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+async def read_frames_async(queries, config = None, max_connections = None):
+    """Run {name: (query, params)} concurrently on up to max_connections async connections"""
+    config = config or Config()
+    max_connections = max_connections or config.DB_POOL_SIZE
+    connections = [await connect_async(config) for _ in range(min(max_connections, len(queries)))]
+    free = asyncio.Queue()
+    for conn in connections:
+        free.put_nowait(conn)
+
+    async def run(query, params):
+        conn = await free.get()
+        try:
+            return await read_frame_async(conn, query, params, config.PSYCOPG3_BINARY)
+        finally:
+            free.put_nowait(conn)
+
+    try:
+        results = await asyncio.gather(*(run(q, p) for q, p in queries.values()))
+        return dict(zip(queries, results))
+    finally:
+        for conn in connections:
+            await conn.close()
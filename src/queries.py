@@ -0,0 +1,567 @@
+import hashlib
+import logging
+import threading
+import time
+import weakref
+import pandas as pd
+from psycopg2 import sql
+from src import arrow_extract, psycopg3_backend
+
+try:
+    from psycopg import sql as pg3_sql
+except ImportError:  # psycopg 3 ships with requirements-full.txt only
+    pg3_sql = None
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# table placeholders every catalog query may use, and their default tables
+DEFAULT_TABLES = {
+    'raw': 'properties_raw',
+    'processed': 'properties_processed',
+    'timeseries': 'properties_timeseries',
+    'sketches': 'properties_sketches',
+    'valuation': 'properties_valuation',
+    'outlier_stats': 'properties_outlier_stats',
+    'outliers': 'properties_outliers',
+    'changelog': 'properties_changelog',
+    'change_offsets': 'properties_change_offsets',
+    'change_partitions': 'properties_change_partitions',
+    'table_loads': 'properties_table_loads',
+    'fact': 'fact_sales',
+    'dim_suburb': 'dim_suburb',
+    'dim_type': 'dim_property_type',
+}
+
+# every read query the pipeline issues, by name; {raw}/{processed}/... are
+# table identifiers, %s are parameters
+QUERIES = {
+    # analytics
+    'price_by_distance': """
+        select
+            distance_category,
+            count(*) as num_properties,
+            avg(price)::NUMERIC(10, 2) as avg_price,
+            avg(price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm,
+            avg(num_bed)::NUMERIC(3,1) as avg_bedrooms
+        from {processed}
+        where distance_category is not NULL
+        group by distance_category
+        order by
+            case distance_category
+                when 'Inner City' then 1
+                when 'Inner Suburbs' then 2
+                when 'Middle Suburbs' then 3
+                when 'Outer Suburbs' then 4
+            end
+    """,
+    'house_vs_apt': """
+        select
+            case when is_house then 'House' else 'Apt' end as property_category,
+            count(*) as count,
+            avg(price)::NUMERIC(10, 2) as avg_price,
+            avg(price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm,
+            avg(num_bed)::NUMERIC(3, 1) as avg_bedrooms,
+            avg(num_bath)::NUMERIC(3, 1) as avg_bathrooms
+        from {processed}
+        group by is_house
+        order by is_house desc
+    """,
+    'top_suburbs_by_value': """
+        select suburb, count(*) as num_properties, avg(price)::NUMERIC(10, 2) as avg_price,
+            avg(price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm,
+            avg(km_from_cbd)::NUMERIC(4,1) as avg_distance_cbd
+        from {processed}
+        where price_per_sqm is not NULL
+        group by suburb
+        having count(*) >= %s
+        order by avg_price_per_sqm asc
+        limit %s
+    """,
+    'most_expensive_suburbs': """
+        select
+            suburb,
+            count(*) as num_properties,
+            avg(price)::NUMERIC(10,2) as avg_price,
+            max(price)::NUMERIC(10,2) as max_price,
+            avg(km_from_cbd)::NUMERIC(4,1) as avg_distance_cbd
+        from {processed}
+        group by suburb
+        having count(*) >= %s
+        order by avg_price desc
+        limit %s
+    """,
+    'suburb_centroids': """
+        select
+            c.suburb,
+            c.lat,
+            c.lng,
+            c.km_from_cbd,
+            coalesce(p.num_properties, 0) as num_properties,
+            p.avg_price_per_sqm
+        from (
+            select suburb,
+                avg(suburb_lat)::float as lat,
+                avg(suburb_lng)::float as lng,
+                avg(km_from_cbd)::float as km_from_cbd
+            from {raw}
+            where suburb is not NULL
+                and suburb_lat is not NULL
+                and suburb_lng is not NULL
+            group by suburb
+        ) c
+        left join (
+            select suburb,
+                count(*) as num_properties,
+                avg(price_per_sqm)::float as avg_price_per_sqm
+            from {processed}
+            group by suburb
+        ) p on p.suburb = c.suburb
+    """,
+
+    # SCHEMA_MODE = 'star' variants: group by integer keys on fact_sales,
+    # join the (small) dimensions after aggregating
+    'price_by_distance_star': """
+        select
+            distance_category,
+            count(*) as num_properties,
+            avg(price)::NUMERIC(10, 2) as avg_price,
+            avg(price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm,
+            avg(num_bed)::NUMERIC(3,1) as avg_bedrooms
+        from {fact}
+        where distance_category is not NULL
+        group by distance_category
+        order by
+            case distance_category
+                when 'Inner City' then 1
+                when 'Inner Suburbs' then 2
+                when 'Middle Suburbs' then 3
+                when 'Outer Suburbs' then 4
+            end
+    """,
+    'house_vs_apt_star': """
+        select
+            case when t.is_house then 'House' else 'Apt' end as property_category,
+            count(*) as count,
+            avg(f.price)::NUMERIC(10, 2) as avg_price,
+            avg(f.price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm,
+            avg(f.num_bed)::NUMERIC(3, 1) as avg_bedrooms,
+            avg(f.num_bath)::NUMERIC(3, 1) as avg_bathrooms
+        from {fact} f
+        join {dim_type} t using (type_key)
+        group by t.is_house
+        order by t.is_house desc
+    """,
+    'top_suburbs_by_value_star': """
+        select s.suburb, f.num_properties, f.avg_price, f.avg_price_per_sqm, f.avg_distance_cbd
+        from (
+            select suburb_key, count(*) as num_properties, avg(price)::NUMERIC(10, 2) as avg_price,
+                avg(price_per_sqm)::NUMERIC(10, 2) as avg_price_per_sqm,
+                avg(km_from_cbd)::NUMERIC(4,1) as avg_distance_cbd
+            from {fact}
+            where price_per_sqm is not NULL
+            group by suburb_key
+            having count(*) >= %s
+        ) f
+        join {dim_suburb} s using (suburb_key)
+        order by f.avg_price_per_sqm asc
+        limit %s
+    """,
+    'most_expensive_suburbs_star': """
+        select s.suburb, f.num_properties, f.avg_price, f.max_price, f.avg_distance_cbd
+        from (
+            select
+                suburb_key,
+                count(*) as num_properties,
+                avg(price)::NUMERIC(10,2) as avg_price,
+                max(price)::NUMERIC(10,2) as max_price,
+                avg(km_from_cbd)::NUMERIC(4,1) as avg_distance_cbd
+            from {fact}
+            group by suburb_key
+            having count(*) >= %s
+        ) f
+        join {dim_suburb} s using (suburb_key)
+        order by f.avg_price desc
+        limit %s
+    """,
+    'suburb_centroids_star': """
+        select
+            s.suburb,
+            s.lat::float as lat,
+            s.lng::float as lng,
+            s.km_from_cbd::float as km_from_cbd,
+            coalesce(p.num_properties, 0) as num_properties,
+            p.avg_price_per_sqm
+        from {dim_suburb} s
+        left join (
+            select suburb_key,
+                count(*) as num_properties,
+                avg(price_per_sqm)::float as avg_price_per_sqm
+            from {fact}
+            group by suburb_key
+        ) p using (suburb_key)
+        where s.lat is not NULL
+            and s.lng is not NULL
+    """,
+
+    # ETL
+    'extract_raw': """
+        select price, date_sold, suburb, num_bath, num_bed,
+            num_parking, property_size, type, km_from_cbd
+        from {raw}
+        where price is not NULL
+            and suburb is not NULL
+            and type is not NULL
+    """,
+    'sketch_segments': """
+        select type, distance_category, num_rows, price_sketch, price_per_sqm_sketch, suburb_hll
+        from {sketches}
+    """,
+
+    # in-database sketch inputs; the bucket index is QuantileSketch's,
+    # ceil(ln(value) / ln(gamma)), and 'Unknown' is sketches.UNKNOWN_SEGMENT
+    'sketch_buckets': """
+        select coalesce(type, 'Unknown') as type, coalesce(distance_category, 'Unknown') as distance_category,
+            measure, ceil(ln(value) / %s)::bigint as bucket, count(*) as count,
+            min(value) as min_value, max(value) as max_value
+        from {processed}
+        cross join lateral (values ('price', price::float8), ('price_per_sqm', price_per_sqm::float8)) as m(measure, value)
+        where value > 0
+        group by 1, 2, 3, 4
+    """,
+    'sketch_suburbs': """
+        select coalesce(type, 'Unknown') as type, coalesce(distance_category, 'Unknown') as distance_category,
+            suburb, count(*) as num_rows
+        from {processed}
+        group by 1, 2, 3
+    """,
+    'processed_count': "select count(*) from {processed}",
+    # the cache fingerprint of a table: the transaction that last loaded it
+    'table_load_txid': "select coalesce(max(load_txid), 0) from {table_loads} where table_name = %s",
+
+    # valuation
+    'valuation_features': """
+        select suburb, type, is_house, distance_category, num_bed, num_bath,
+            num_parking, property_size::float as property_size, km_from_cbd::float as km_from_cbd,
+            price::float as price, date_sold
+        from {processed}
+    """,
+    'valuation_model': "select kind, name, num_rows, coefficients from {valuation}",
+
+    # outliers
+    'outlier_inputs': """
+        select suburb, type, price::float as price
+        from {raw}
+        where price is not NULL
+            and suburb is not NULL
+            and type is not NULL
+    """,
+    'outlier_stats': "select suburb, type, num_rows, median_log_price, mad_log_price, group_hash from {outlier_stats}",
+
+    # change feed
+    # a partition's digest sums the first 64 bits of each row's md5, so it
+    # does not depend on row order
+    'processed_partitions': """
+        select suburb, date_trunc('month', date_sold)::date as month, count(*) as num_rows,
+            min(id) as min_id, max(id) as max_id,
+            sum(('x' || left(md5(row(price, date_sold, suburb, num_bath, num_bed, num_parking, property_size,
+                type, km_from_cbd, price_per_sqm, is_house, distance_category)::text), 16))::bit(64)::bigint) as digest
+        from {processed}
+        group by 1, 2
+    """,
+    'change_partitions': "select suburb, month, num_rows, digest from {change_partitions}",
+    'processed_for_suburbs': "select * from {processed} where suburb = any(%s)",
+    'changelog_latest': "select coalesce(max(id), 0) from {changelog}",
+    'changelog_since': """
+        select id, table_name, etl_mode, num_rows, table_min_id, table_max_id, partitions_inserted,
+            partitions_updated, partitions_deleted, suburbs, months, created_at
+        from {changelog}
+        where id > %s
+        order by id
+    """,
+    'change_offset': "select coalesce(max(change_id), 0) from {change_offsets} where consumer = %s",
+
+    # data quality
+    'dq_null_critical': "select count(*) from {processed} where price is NULL or suburb is NULL or type is NULL",
+    'dq_invalid_price': "select count(*) from {processed} where price <= 0",
+    'dq_invalid_distance': "select count(*) from {processed} where km_from_cbd < 0",
+    'dq_missing_price_per_sqm': "select count(*) from {processed} where property_size > 0 and price_per_sqm is NULL",
+
+    # summary
+    'summary_stats': """
+        select
+            count(*) as total_records,
+            count(distinct suburb) as unique_suburbs,
+            count(distinct type) as unique_types,
+            avg(price)::NUMERIC(10,2) as avg_price,
+            min(price)::NUMERIC(10,2) as min_price,
+            max(price)::NUMERIC(10,2) as max_price,
+            avg(num_bed)::NUMERIC(3,1) as avg_bedrooms,
+            avg(price_per_sqm)::NUMERIC(10,2) as avg_price_per_sqm
+        from {processed}
+    """,
+    'summary_stats_single_pass': """
+        select
+            count(*) as total_records,
+            avg(price)::NUMERIC(10,2) as avg_price,
+            min(price)::NUMERIC(10,2) as min_price,
+            max(price)::NUMERIC(10,2) as max_price,
+            avg(num_bed)::NUMERIC(3,1) as avg_bedrooms,
+            avg(price_per_sqm)::NUMERIC(10,2) as avg_price_per_sqm
+        from {processed}
+    """,
+
+    # load verification
+    'verify_count': "select count(*) from {raw}",
+    'verify_sample': "select * from {raw} limit %s",
+    'verify_stats': """
+        select
+            count(*) as total_properties,
+            avg(price) as avg_price,
+            min(price) as min_price,
+            max(price) as max_price,
+            count(distinct suburb) as num_suburbs
+        from {raw}
+        where price is not NULL
+    """,
+
+    # row hash backfill for rows loaded before dedup (row_hash is indexed, NULLs included)
+    'raw_unhashed_exists': "select exists (select 1 from {raw} where row_hash is NULL)",
+    'raw_unhashed_rows': """
+        select id, price, date_sold, suburb, num_bath, num_bed, num_parking, property_size, type
+        from {raw}
+        where row_hash is NULL
+        order by id
+    """,
+    'raw_existing_hashes': "select row_hash from {raw} where row_hash = any(%s)",
+
+    # time series
+    'timeseries_last_month': "select max(period_start) from {timeseries} where period_type = 'month'",
+    'timeseries_window': "select max(rolling_window_months) from {timeseries} where period_type = 'month'",
+    'timeseries_inputs': """
+        select date_sold, suburb, distance_category, price, price_per_sqm
+        from {processed}
+        where date_sold is not NULL
+    """,
+    'timeseries_inputs_since': """
+        select date_sold, suburb, distance_category, price, price_per_sqm
+        from {processed}
+        where date_sold is not NULL and date_sold >= %s
+    """,
+    'timeseries_all': "select * from {timeseries}",
+    'timeseries_series': """
+        select period_start, num_sales, median_price, median_price_per_sqm,
+            rolling_median_price, rolling_num_sales, rolling_window_months
+        from {timeseries}
+        where period_type = %s and segment_type = %s and segment = %s
+        order by period_start
+    """,
+}
+
+
+class QueryStats:
+    """Per-statement call count and latency, shared by every catalog"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, name, seconds, prepared):
+        with self._lock:
+            entry = self.stats.setdefault(name, {'calls': 0, 'prepared_calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            ms = seconds * 1000
+            entry['calls'] += 1
+            entry['prepared_calls'] += int(prepared)
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+
+    def to_frame(self):
+        with self._lock:
+            df = pd.DataFrame.from_dict(self.stats, orient='index')
+        if df.empty:
+            return df
+        df['mean_ms'] = df['total_ms'] / df['calls']
+        return df.sort_values('total_ms', ascending=False)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+
+QUERY_STATS = QueryStats()
+
+# per connection: statement name -> executions so far / prepared
+_connection_state = weakref.WeakKeyDictionary()
+_state_lock = threading.Lock()
+
+
+def _to_server_placeholders(text):
+    # %s -> $1, $2, ... for PREPARE
+    parts = text.split('%s')
+    out = parts[0]
+    for i, part in enumerate(parts[1:], start=1):
+        out += f"${i}" + part
+    return out.replace('%%', '%')
+
+
+class QueryCatalog:
+    """Run catalog queries on a connection, preparing the repeated ones.
+
+    The first QUERY_PREPARE_THRESHOLD executions of a statement on a
+    connection are sent as plain text; after that it is PREPAREd once and run
+    with EXECUTE, so Postgres parses and plans it once per connection instead
+    of on every call. Tables are substituted with sql.Identifier, never string
+    formatting. Every call's latency is recorded in QUERY_STATS.
+
+    With DB_BACKEND = 'psycopg3' queries run on the db's psycopg 3 read
+    connection instead, which prepares by the same threshold natively, returns
+    NUMERIC as float and sends batches (scalars) in pipeline mode; with
+    PSYCOPG3_BINARY results come back in binary.
+
+    With SCHEMA_MODE = 'star', a query with a '<name>_star' variant runs that
+    variant (over fact_sales and its dimensions) instead.
+
+    With READ_FORMAT = 'arrow', read() streams the result with COPY into
+    Arrow record batches (src.arrow_extract) on the psycopg2 connection.
+    """
+
+    def __init__(self, db, threshold = None):
+        self.db = db
+        config = db.config
+        self.threshold = config.QUERY_PREPARE_THRESHOLD if threshold is None else threshold
+        self.psycopg3 = config.DB_BACKEND == 'psycopg3'
+        self.binary = self.psycopg3 and config.PSYCOPG3_BINARY
+        self.arrow = config.READ_FORMAT == 'arrow'
+        self.star = config.SCHEMA_MODE == 'star'
+
+    def _resolve(self, name):
+        if self.star and f"{name}_star" in QUERIES:
+            return f"{name}_star"
+        return name
+
+    def _compose(self, name, tables, sql_module = None):
+        if name not in QUERIES:
+            raise KeyError(f"Unknown query: {name}")
+        unknown = set(tables) - set(DEFAULT_TABLES)
+        if unknown:
+            raise ValueError(f"Unknown table placeholders for {name}: {unknown}")
+        sql_module = sql_module or (pg3_sql if self.psycopg3 else sql)
+        identifiers = {k: sql_module.Identifier(v) for k, v in {**DEFAULT_TABLES, **tables}.items()}
+        return sql_module.SQL(QUERIES[name].strip()).format(**identifiers)
+
+    def _statement_name(self, name, tables):
+        if not tables:
+            return f"q_{name}"
+        suffix = hashlib.md5(repr(sorted(tables.items())).encode()).hexdigest()[:8]
+        return f"q_{name}_{suffix}"
+
+    def _count_call(self, conn, statement):
+        """(calls so far, already prepared, prepare now) for a statement on conn"""
+        with _state_lock:
+            state = _connection_state.setdefault(conn, {})
+            calls, prepared = state.get(statement, (0, False))
+            prepare = not prepared and calls >= self.threshold
+            state[statement] = (calls + 1, prepared or prepare)
+        return calls, prepared, prepare
+
+    def _run(self, name, params, tables, consume):
+        name = self._resolve(name)
+        tables = {k: v for k, v in tables.items() if DEFAULT_TABLES.get(k) != v}
+        if self.psycopg3:
+            conn = self.db.get_read_conn()
+            _, prepared, prepare = self._count_call(conn, self._statement_name(name, tables))
+            started = time.perf_counter()
+            try:
+                # psycopg 3 prepares after prepare_threshold executions itself
+                with conn.cursor(binary = self.binary) as cursor:
+                    cursor.execute(self._compose(name, tables), params or None)
+                    return consume(cursor)
+            finally:
+                QUERY_STATS.record(name, time.perf_counter() - started, prepared or prepare)
+
+        conn, cursor = self.db.conn, self.db.cursor
+        statement = self._statement_name(name, tables)
+        calls, prepared, prepare = self._count_call(conn, statement)
+        started = time.perf_counter()
+        try:
+            if prepare:
+                query = self._compose(name, tables).as_string(conn)
+                cursor.execute(
+                    sql.SQL("PREPARE {} AS ").format(sql.Identifier(statement)).as_string(conn)
+                    + _to_server_placeholders(query)
+                )
+                # prepared statements outlive the transaction, even on rollback
+                prepare, prepared = False, True
+            if prepared:
+                execute = sql.SQL("EXECUTE {}").format(sql.Identifier(statement))
+                if params:
+                    execute += sql.SQL(" ({})").format(sql.SQL(', ').join(sql.Placeholder() * len(params)))
+                cursor.execute(execute, params)
+            else:
+                cursor.execute(self._compose(name, tables), params or None)
+            return consume(cursor)
+        except Exception:
+            if prepare:
+                # PREPARE itself failed; retry it next call
+                with _state_lock:
+                    _connection_state[conn][statement] = (calls + 1, False)
+            raise
+        finally:
+            QUERY_STATS.record(name, time.perf_counter() - started, prepared)
+
+    def fetchall(self, name, params = (), **tables):
+        return self._run(name, params, tables, lambda cursor: cursor.fetchall())
+
+    def fetchone(self, name, params = (), **tables):
+        return self._run(name, params, tables, lambda cursor: cursor.fetchone())
+
+    def scalar(self, name, params = (), **tables):
+        return self.fetchone(name, params, **tables)[0]
+
+    def scalars(self, names, **tables):
+        """First value of each named (parameterless) query, as one batch"""
+        if not self.psycopg3:
+            return [self.scalar(name, **tables) for name in names]
+        names = [self._resolve(name) for name in names]
+        tables = {k: v for k, v in tables.items() if DEFAULT_TABLES.get(k) != v}
+        conn = self.db.get_read_conn()
+        started = time.perf_counter()
+        values = psycopg3_backend.fetch_scalars(conn, [(self._compose(name, tables), None) for name in names], self.binary)
+        # one round trip for the whole batch; each query is recorded at its share
+        elapsed = (time.perf_counter() - started) / len(names)
+        for name in names:
+            _, prepared, prepare = self._count_call(conn, self._statement_name(name, tables))
+            QUERY_STATS.record(name, elapsed, prepared or prepare)
+        return values
+
+    def read(self, name, params = (), **tables):
+        """Run a catalog query into a DataFrame"""
+        if self.arrow:
+            return self.read_arrow(name, params, **tables)
+        def to_frame(cursor):
+            columns = [d[0] for d in cursor.description]
+            # coerce NUMERIC (Decimal) to float, as pd.read_sql does
+            return pd.DataFrame.from_records(cursor.fetchall(), columns=columns, coerce_float=True)
+        return self._run(name, params, tables, to_frame)
+
+
+    def read_arrow(self, name, params = (), arrow_dtypes = False, **tables):
+        """Run a catalog query into a DataFrame via Arrow, without per-cell Python objects"""
+        name = self._resolve(name)
+        tables = {k: v for k, v in tables.items() if DEFAULT_TABLES.get(k) != v}
+        conn = self.db.conn
+        query = self._compose(name, tables, sql).as_string(conn)
+        started = time.perf_counter()
+        try:
+            return arrow_extract.read_frame(conn, query, params or None, arrow_dtypes)
+        finally:
+            # COPY cannot run a prepared statement
+            QUERY_STATS.record(name, time.perf_counter() - started, False)
+
+
+def latency_report():
+    """Per-statement latency as a DataFrame, slowest total first"""
+    return QUERY_STATS.to_frame()
@@ -0,0 +1,278 @@
+import logging
+import math
+import struct
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# properties_processed columns a sketch segment is keyed on
+SEGMENT_COLUMNS = ['type', 'distance_category']
+UNKNOWN_SEGMENT = 'Unknown'
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative error guarantees.
+
+    Values are counted in logarithmic buckets (the DDSketch layout): any
+    quantile is returned within `relative_accuracy` of the true value, two
+    sketches merge by adding bucket counts, and the size depends on the value
+    range rather than the number of rows.
+    """
+
+    def __init__(self, relative_accuracy = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _grow(self, lo, hi):
+        if len(self.counts) == 0:
+            self.offset = lo
+            self.counts = np.zeros(hi - lo + 1, dtype=np.int64)
+            return
+        new_lo = min(lo, self.offset)
+        new_hi = max(hi, self.offset + len(self.counts) - 1)
+        if new_lo == self.offset and new_hi == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+        start = self.offset - new_lo
+        counts[start:start + len(self.counts)] = self.counts
+        self.offset, self.counts = new_lo, counts
+
+    def update(self, values):
+        """Add an array of values; non-positive and missing values are ignored"""
+        values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+        values = values[values > 0]
+        if len(values) == 0:
+            return self
+        index = np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+        lo, hi = int(index.min()), int(index.max())
+        self._grow(lo, hi)
+        np.add.at(self.counts, index - self.offset, 1)
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    def update_buckets(self, index, counts, vmin, vmax):
+        """Add pre-aggregated bucket counts (e.g. from a GROUP BY on the bucket index)"""
+        index = np.asarray(index, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        if len(index) == 0:
+            return self
+        self._grow(int(index.min()), int(index.max()))
+        np.add.at(self.counts, index - self.offset, counts)
+        self.count += int(counts.sum())
+        self.min = min(self.min, float(vmin))
+        self.max = max(self.max, float(vmax))
+        return self
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        if other.count == 0:
+            return self
+        self._grow(other.offset, other.offset + len(other.counts) - 1)
+        start = other.offset - self.offset
+        self.counts[start:start + len(other.counts)] += other.counts
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _bucket_value(self, index):
+        # midpoint (in relative terms) of bucket (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        cumulative = np.cumsum(self.counts)
+        bucket = int(np.searchsorted(cumulative, rank, side='right'))
+        value = self._bucket_value(self.offset + bucket)
+        return min(max(value, self.min), self.max)
+
+    def histogram(self, bins = 50):
+        """Approximate histogram (bin_start, bin_end, count) from bucket counts"""
+        if self.count == 0:
+            return pd.DataFrame(columns=['bin_start', 'bin_end', 'count'])
+        edges = np.linspace(self.min, self.max, bins + 1)
+        nonzero = np.flatnonzero(self.counts)
+        centres = self._bucket_value(self.offset + nonzero)
+        counts = np.histogram(centres, bins=edges, weights=self.counts[nonzero])[0]
+        return pd.DataFrame({'bin_start': edges[:-1], 'bin_end': edges[1:], 'count': counts.astype(np.int64)})
+
+    def to_bytes(self):
+        header = struct.pack('<dqqdd', self.relative_accuracy, self.offset, self.count, self.min, self.max)
+        return header + self.counts.astype('<i8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        size = struct.calcsize('<dqqdd')
+        accuracy, offset, count, vmin, vmax = struct.unpack('<dqqdd', data[:size])
+        sketch = cls(accuracy)
+        sketch.offset, sketch.count, sketch.min, sketch.max = offset, count, vmin, vmax
+        sketch.counts = np.frombuffer(data[size:], dtype='<i8').astype(np.int64)
+        return sketch
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter; merging is an element-wise max of registers"""
+
+    def __init__(self, precision = 12):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = np.zeros(self.num_registers, dtype=np.uint8)
+
+    def update(self, values):
+        values = pd.Series(values).dropna().astype(str)
+        if len(values) == 0:
+            return self
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        tail_bits = 64 - self.precision
+        index = (hashes >> np.uint64(tail_bits)).astype(np.int64)
+        tail = hashes & np.uint64((1 << tail_bits) - 1)
+        # rank = position of the leftmost 1-bit in the remaining bits; frexp's
+        # exponent is the bit length and is exact for values below 2**53
+        bit_length = np.frexp(tail.astype(np.float64))[1]
+        rank = (tail_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # small-range correction (linear counting)
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_bytes(self):
+        return struct.pack('<B', self.precision) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        hll = cls(struct.unpack('<B', data[:1])[0])
+        hll.registers = np.frombuffer(data[1:], dtype=np.uint8).copy()
+        return hll
+
+
+class SegmentSketch:
+    """Sketches for one (type, distance_category) segment"""
+
+    def __init__(self, relative_accuracy = 0.01, precision = 12):
+        self.num_rows = 0
+        self.price = QuantileSketch(relative_accuracy)
+        self.price_per_sqm = QuantileSketch(relative_accuracy)
+        self.suburbs = HyperLogLog(precision)
+
+    def update(self, df):
+        self.num_rows += len(df)
+        self.price.update(df['price'])
+        self.price_per_sqm.update(df['price_per_sqm'])
+        self.suburbs.update(df['suburb'])
+        return self
+
+    def merge(self, other):
+        self.num_rows += other.num_rows
+        self.price.merge(other.price)
+        self.price_per_sqm.merge(other.price_per_sqm)
+        self.suburbs.merge(other.suburbs)
+        return self
+
+
+class SketchStore:
+    """Per-segment sketches that merge into answers for any type/distance filter"""
+
+    def __init__(self, relative_accuracy = 0.01, precision = 12):
+        self.relative_accuracy = relative_accuracy
+        self.precision = precision
+        self.segments = {}
+
+    def _new_segment(self):
+        return SegmentSketch(self.relative_accuracy, self.precision)
+
+    @classmethod
+    def from_dataframe(cls, df, relative_accuracy = 0.01, precision = 12):
+        store = cls(relative_accuracy, precision)
+        keys = df[SEGMENT_COLUMNS].fillna(UNKNOWN_SEGMENT)
+        for key, group in df.groupby([keys[c] for c in SEGMENT_COLUMNS], sort=True):
+            store.segments[key] = store._new_segment().update(group)
+        logger.info(f"Built sketches for {len(store.segments)} segments from {len(df)} rows")
+        return store
+
+    @classmethod
+    def from_aggregates(cls, buckets, suburbs, relative_accuracy = 0.01, precision = 12):
+        """Build from per-segment aggregates instead of rows.
+
+        buckets has (type, distance_category, measure, bucket, count, min_value,
+        max_value) rows, measure being 'price' or 'price_per_sqm'; suburbs has
+        (type, distance_category, suburb, num_rows) rows. Both are small enough
+        to leave the database where the processed rows are not.
+        """
+        store = cls(relative_accuracy, precision)
+        for key, group in suburbs.groupby(SEGMENT_COLUMNS, sort=True):
+            segment = store._new_segment()
+            segment.num_rows = int(group['num_rows'].sum())
+            segment.suburbs.update(group['suburb'])
+            store.segments[key] = segment
+        for (prop_type, distance, measure), group in buckets.groupby(SEGMENT_COLUMNS + ['measure']):
+            getattr(store.segments[(prop_type, distance)], measure).update_buckets(
+                group['bucket'], group['count'], group['min_value'].min(), group['max_value'].max()
+            )
+        logger.info(f"Built sketches for {len(store.segments)} segments from {len(buckets)} bucket counts")
+        return store
+
+    def merged(self, types = None, distance_categories = None):
+        """Merge the segments matching the filters (None = no filter)"""
+        result = self._new_segment()
+        for (prop_type, distance), segment in self.segments.items():
+            if types is not None and prop_type not in types:
+                continue
+            if distance_categories is not None and distance not in distance_categories:
+                continue
+            result.merge(segment)
+        return result
+
+    def to_records(self):
+        return [
+            (prop_type, distance, s.num_rows, s.price.to_bytes(),
+             s.price_per_sqm.to_bytes(), s.suburbs.to_bytes())
+            for (prop_type, distance), s in self.segments.items()
+        ]
+
+    @classmethod
+    def from_records(cls, records):
+        store = cls()
+        for prop_type, distance, num_rows, price, price_per_sqm, suburbs in records:
+            segment = SegmentSketch()
+            segment.num_rows = num_rows
+            segment.price = QuantileSketch.from_bytes(price)
+            segment.price_per_sqm = QuantileSketch.from_bytes(price_per_sqm)
+            segment.suburbs = HyperLogLog.from_bytes(suburbs)
+            store.segments[(prop_type, distance)] = segment
+        if store.segments:
+            first = next(iter(store.segments.values()))
+            store.relative_accuracy = first.price.relative_accuracy
+            store.precision = first.suburbs.precision
+        return store
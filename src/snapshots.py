@@ -0,0 +1,228 @@
+import contextlib
+import csv
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+import pandas as pd
+from src.config import Config
+
+try:
+    import pyarrow  # noqa: F401  (parquet engine)
+    ARCHIVE_FORMAT = 'parquet'
+except ImportError:  # pyarrow ships with requirements-full.txt only
+    ARCHIVE_FORMAT = 'csv.gz'
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = 'properties_processed_'
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = 'manifest.lock'
+
+
+def count_records(path):
+    """Data rows in a CSV with a header; quoted fields may span lines"""
+    with open(path, newline = '') as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+class SnapshotManager:
+    """Versioned processed-data snapshots tracked in a manifest.
+
+    manifest.json lists every snapshot (path, format, record count, size,
+    creation time) and names the latest one, so lookups never scan the
+    directory. Beyond the newest SNAPSHOT_KEEP_UNCOMPRESSED, snapshots are
+    compacted from CSV to a compressed archive (SNAPSHOT_ARCHIVE_FORMAT;
+    by default parquet when pyarrow is installed, else csv.gz); snapshots beyond SNAPSHOT_RETENTION_COUNT or
+    older than SNAPSHOT_RETENTION_DAYS are deleted. The latest snapshot is
+    never compacted or deleted.
+
+    Manifest updates hold a lock (a thread lock, then flock on
+    manifest.lock), so concurrent loaders and runners never lose each
+    other's entries. A directory with snapshot CSVs but no manifest entries
+    adopts them on the first latest() call.
+    """
+
+    def __init__(self, directory = None, config = None):
+        self.config = config or Config()
+        self.directory = directory or self.config.PROCESSED_DATA_PATH
+        self.archive_format = self.config.SNAPSHOT_ARCHIVE_FORMAT
+        if self.archive_format == 'auto':
+            self.archive_format = ARCHIVE_FORMAT
+        elif self.archive_format == 'parquet' and ARCHIVE_FORMAT != 'parquet':
+            raise ImportError("SNAPSHOT_ARCHIVE_FORMAT = 'parquet' needs pyarrow: pip install pyarrow")
+        self.manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok = True)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'latest': None, 'snapshots': {}}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the manifest lock: threads of this process, then other processes"""
+        with self._lock, open(os.path.join(self.directory, LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent = 2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def save(self, df):
+        """Write df as a new CSV snapshot, make it the latest and apply the policies"""
+        version = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        path = os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{version}.csv")
+        df.to_csv(path, index = False)
+        self._register(version, path, 'csv', len(df))
+        logger.info(f"Saved snapshot {version} ({len(df)} records) to {path}")
+        self.compact()
+        self.apply_retention()
+        return version, path
+
+    def _add_entry(self, manifest, version, path, fmt, records, created = None):
+        manifest['snapshots'][version] = {
+            'path': path,
+            'format': fmt,
+            'records': records,
+            'size': os.path.getsize(path),
+            'created': created or datetime.now().isoformat(),
+        }
+        if manifest['latest'] is None or version > manifest['latest']:
+            manifest['latest'] = version
+
+    def _register(self, version, path, fmt, records, created = None):
+        with self._locked():
+            manifest = self._load_manifest()
+            self._add_entry(manifest, version, path, fmt, records, created)
+            self._save_manifest(manifest)
+
+    def latest(self):
+        """(version, entry) of the newest snapshot, or None"""
+        manifest = self._load_manifest()
+        # snapshots written before the manifest existed
+        if manifest['latest'] is None and self.adopt_existing():
+            manifest = self._load_manifest()
+        version = manifest['latest']
+        if version is None:
+            return None
+        return version, manifest['snapshots'][version]
+
+    def get(self, version):
+        return self._load_manifest()['snapshots'].get(version)
+
+    def list(self):
+        return self._load_manifest()['snapshots']
+
+    def read(self, version = None):
+        """Load a snapshot (default: latest) as a DataFrame, whatever its format"""
+        if version is None:
+            latest = self.latest()
+            if latest is None:
+                raise FileNotFoundError(f"No snapshots in {self.manifest_path}")
+            version = latest[0]
+        entry = self.get(version)
+        if entry is None:
+            raise KeyError(f"Unknown snapshot: {version}")
+        if entry['format'] == 'parquet':
+            return pd.read_parquet(entry['path'])
+        return pd.read_csv(entry['path'])
+
+    def compact(self, keep = None):
+        """Archive CSV snapshots older than the newest `keep`"""
+        keep = self.config.SNAPSHOT_KEEP_UNCOMPRESSED if keep is None else keep
+        with self._locked():
+            manifest = self._load_manifest()
+            versions = sorted(manifest['snapshots'], reverse = True)
+            compacted = 0
+            for version in versions[max(keep, 1):]:
+                entry = manifest['snapshots'][version]
+                if entry['format'] != 'csv':
+                    continue
+                df = pd.read_csv(entry['path'])
+                archive_path = os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{version}.{self.archive_format}")
+                if self.archive_format == 'parquet':
+                    df.to_parquet(archive_path, index = False, compression = 'zstd')
+                else:
+                    df.to_csv(archive_path, index = False, compression = 'gzip')
+                os.remove(entry['path'])
+                entry.update(path = archive_path, format = self.archive_format, size = os.path.getsize(archive_path))
+                compacted += 1
+            if compacted:
+                self._save_manifest(manifest)
+                logger.info(f"Compacted {compacted} snapshots to {self.archive_format}")
+        return compacted
+
+    def apply_retention(self, max_count = None, max_age_days = None):
+        """Delete snapshots beyond the newest max_count or older than max_age_days"""
+        max_count = max_count or self.config.SNAPSHOT_RETENTION_COUNT
+        max_age_days = max_age_days or self.config.SNAPSHOT_RETENTION_DAYS
+        cutoff = datetime.now() - timedelta(days = max_age_days)
+        with self._locked():
+            manifest = self._load_manifest()
+            versions = sorted(manifest['snapshots'], reverse = True)
+            removed = []
+            for position, version in enumerate(versions):
+                if version == manifest['latest']:
+                    continue
+                entry = manifest['snapshots'][version]
+                if position >= max_count or datetime.fromisoformat(entry['created']) < cutoff:
+                    if os.path.exists(entry['path']):
+                        os.remove(entry['path'])
+                    del manifest['snapshots'][version]
+                    removed.append(version)
+            if removed:
+                self._save_manifest(manifest)
+                logger.info(f"Retention removed {len(removed)} snapshots: {removed}")
+        return removed
+
+    def adopt_existing(self):
+        """Register timestamped snapshot CSVs written before the manifest existed"""
+        adopted = 0
+        with self._locked():
+            manifest = self._load_manifest()
+            known = {e['path'] for e in manifest['snapshots'].values()}
+            for path in sorted(glob.glob(os.path.join(self.directory, f"{SNAPSHOT_PREFIX}2*.csv"))):
+                if path in known:
+                    continue
+                version = os.path.basename(path)[len(SNAPSHOT_PREFIX):-len('.csv')]
+                created = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+                self._add_entry(manifest, version, path, 'csv', count_records(path), created)
+                adopted += 1
+            if adopted:
+                self._save_manifest(manifest)
+        if adopted:
+            logger.info(f"Adopted {adopted} existing snapshots into {self.manifest_path}")
+            self.compact()
+            self.apply_retention()
+        return adopted
+
+
+def main():
+    manager = SnapshotManager()
+    manager.adopt_existing()
+    manager.compact()
+    manager.apply_retention()
+    for version, entry in sorted(manager.list().items()):
+        logger.info(f"{version}: {entry['format']}, {entry['records']} records, {entry['size']:,} bytes")
+    latest = manager.latest()
+    logger.info(f"Latest snapshot: {latest[0] if latest else None}")
+
+
+if __name__ == "__main__":
+    main()
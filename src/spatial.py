@@ -0,0 +1,185 @@
+import logging
+import math
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = EARTH_RADIUS_KM * math.pi / 180
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distance (km) from one point to arrays of points"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlng = np.radians(lngs) - math.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SuburbSpatialIndex:
+    """In-memory grid index over suburb centroids.
+
+    Centroids are bucketed into lat/lng cells. A radius query only looks at the
+    cells overlapping the exact bounding box of the search circle and then runs
+    a vectorised haversine over those candidates, so the cost depends on the
+    number of nearby suburbs rather than the size of the state.
+    """
+
+    COLUMNS = ['suburb', 'lat', 'lng', 'km_from_cbd', 'num_properties', 'avg_price_per_sqm']
+
+    def __init__(self, suburbs_df, cell_km = 5.0):
+        df = suburbs_df.dropna(subset=['lat', 'lng']).reset_index(drop=True)
+        if 'avg_price_per_sqm' not in df.columns:
+            df['avg_price_per_sqm'] = np.nan
+        self.cell_deg = cell_km / KM_PER_DEGREE_LAT
+
+        # sort points by grid cell so each cell is a contiguous slice
+        cell_lat = np.floor(df['lat'].to_numpy(dtype=float) / self.cell_deg).astype(np.int64)
+        cell_lng = np.floor(df['lng'].to_numpy(dtype=float) / self.cell_deg).astype(np.int64)
+        order = np.lexsort((cell_lng, cell_lat))
+        df = df.iloc[order].reset_index(drop=True)
+        cell_lat, cell_lng = cell_lat[order], cell_lng[order]
+
+        self.suburbs = df['suburb'].to_numpy()
+        self.lats = df['lat'].to_numpy(dtype=float)
+        self.lngs = df['lng'].to_numpy(dtype=float)
+        self.frame = df
+        self.position = {name: i for i, name in enumerate(self.suburbs)}
+
+        self.cells = {}
+        if len(df):
+            boundaries = np.flatnonzero((np.diff(cell_lat) != 0) | (np.diff(cell_lng) != 0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(df)]))
+            for start, end in zip(starts, ends):
+                self.cells[(cell_lat[start], cell_lng[start])] = (start, end)
+
+        # suburbs ordered by price/sqm for comparable lookups
+        self.ppsqm = pd.to_numeric(df['avg_price_per_sqm'], errors='coerce').to_numpy(dtype=float)
+        valid = np.flatnonzero(~np.isnan(self.ppsqm))
+        self.ppsqm_order = valid[np.argsort(self.ppsqm[valid], kind='stable')]
+        self.ppsqm_sorted = self.ppsqm[self.ppsqm_order]
+
+        logger.info(f"Built spatial index over {len(df)} suburbs in {len(self.cells)} cells")
+
+    def __len__(self):
+        return len(self.suburbs)
+
+    def _resolve(self, location):
+        # accept either a suburb name or a (lat, lng) pair
+        if isinstance(location, str):
+            if location not in self.position:
+                raise KeyError(f"Unknown suburb: {location}")
+            i = self.position[location]
+            return self.lats[i], self.lngs[i]
+        lat, lng = location
+        return float(lat), float(lng)
+
+    def _candidates(self, lat, lng, radius_km):
+        # exact lat/lng bounding box of a spherical cap
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        ratio = math.sin(radius_km / EARTH_RADIUS_KM) / max(math.cos(math.radians(lat)), 1e-12)
+        dlng = 180.0 if ratio >= 1 else math.degrees(math.asin(ratio))
+
+        lat_lo = math.floor((lat - dlat) / self.cell_deg)
+        lat_hi = math.floor((lat + dlat) / self.cell_deg)
+        lng_lo = math.floor((lng - dlng) / self.cell_deg)
+        lng_hi = math.floor((lng + dlng) / self.cell_deg)
+
+        # fall back to a full scan when the box covers more cells than exist
+        if (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1) > len(self.cells):
+            return np.arange(len(self.suburbs))
+
+        slices = []
+        for i in range(lat_lo, lat_hi + 1):
+            for j in range(lng_lo, lng_hi + 1):
+                span = self.cells.get((i, j))
+                if span is not None:
+                    slices.append(np.arange(span[0], span[1]))
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def within_radius(self, location, radius_km):
+        """Suburbs within radius_km of a suburb or (lat, lng), nearest first"""
+        lat, lng = self._resolve(location)
+        candidates = self._candidates(lat, lng, radius_km)
+        distances = haversine_km(lat, lng, self.lats[candidates], self.lngs[candidates])
+        keep = distances <= radius_km
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+
+        result = self.frame.iloc[candidates[order]].copy()
+        result['distance_km'] = distances[order].round(2)
+        return result.reset_index(drop=True)
+
+    def nearest(self, location, k = 5):
+        """k geographically nearest suburbs, excluding the query suburb itself"""
+        exclude = location if isinstance(location, str) else None
+        wanted = k + (1 if exclude else 0)
+        radius = max(self.cell_deg * KM_PER_DEGREE_LAT, 1.0)
+
+        # grow the search circle until it holds enough suburbs
+        while True:
+            result = self.within_radius(location, radius)
+            if len(result) >= wanted or len(result) == len(self.suburbs):
+                break
+            radius *= 2
+        if exclude:
+            result = result[result['suburb'] != exclude]
+        return result.head(k).reset_index(drop=True)
+
+    def comparable_by_price_per_sqm(self, suburb, k = 5, radius_km = None):
+        """k suburbs with the closest average price/sqm to the given suburb.
+
+        With radius_km set, only suburbs inside that radius are considered.
+        """
+        if suburb not in self.position:
+            raise KeyError(f"Unknown suburb: {suburb}")
+        i = self.position[suburb]
+        target = self.ppsqm[i]
+        if np.isnan(target):
+            return self.frame.iloc[[]].assign(price_per_sqm_diff=[])
+
+        if radius_km is not None:
+            nearby = self.within_radius(suburb, radius_km)
+            nearby = nearby[(nearby['suburb'] != suburb) & nearby['avg_price_per_sqm'].notna()].copy()
+            nearby['price_per_sqm_diff'] = (nearby['avg_price_per_sqm'] - target).abs().round(2)
+            return nearby.nsmallest(k, 'price_per_sqm_diff').reset_index(drop=True)
+
+        # walk outwards from the target's position in the sorted price/sqm array
+        pos = int(np.searchsorted(self.ppsqm_sorted, target))
+        lo, hi = pos - 1, pos
+        picked = []
+        n = len(self.ppsqm_sorted)
+        while len(picked) < k and (lo >= 0 or hi < n):
+            lo_diff = target - self.ppsqm_sorted[lo] if lo >= 0 else np.inf
+            hi_diff = self.ppsqm_sorted[hi] - target if hi < n else np.inf
+            if lo_diff <= hi_diff:
+                candidate = self.ppsqm_order[lo]
+                lo -= 1
+            else:
+                candidate = self.ppsqm_order[hi]
+                hi += 1
+            if candidate != i:
+                picked.append(candidate)
+
+        result = self.frame.iloc[picked].copy()
+        result['price_per_sqm_diff'] = (result['avg_price_per_sqm'] - target).abs().round(2)
+        return result.reset_index(drop=True)
+
+    def to_csv(self, filepath):
+        self.frame[[c for c in self.COLUMNS if c in self.frame.columns]].to_csv(filepath, index = False)
+        logger.info(f"Saved {len(self)} suburb centroids to {filepath}")
+        return filepath
+
+    @classmethod
+    def from_csv(cls, filepath, cell_km = 5.0):
+        return cls(pd.read_csv(filepath), cell_km = cell_km)
@@ -0,0 +1,183 @@
+import io
+import logging
+import pandas as pd
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from src.config import Config
+from src.db_setup import DatabaseSetup
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+FACT_TABLE = 'fact_sales'
+FACT_COLUMNS = [
+    'suburb_key', 'type_key', 'price', 'date_sold', 'num_bath', 'num_bed',
+    'num_parking', 'property_size', 'km_from_cbd', 'price_per_sqm', 'distance_category'
+]
+INTEGER_COLUMNS = ['suburb_key', 'type_key', 'num_bath', 'num_bed', 'num_parking']
+
+# suburb-level attributes repeated on every properties_raw row
+SUBURB_ATTRIBUTES = {
+    'population': 'suburb_population',
+    'median_income': 'suburb_median_income',
+    'sqkm': 'suburb_sqkm',
+    'lat': 'suburb_lat',
+    'lng': 'suburb_lng',
+    'elevation': 'suburb_elevation',
+    'km_from_cbd': 'km_from_cbd',
+}
+
+
+class KeyLookup:
+    """Natural key -> surrogate key for one dimension table, cached in memory.
+
+    Keys are never deleted or reassigned, so the cache stays valid across
+    loads; only values not seen before cost a round trip.
+    """
+
+    def __init__(self, db, table, key_column, name_column):
+        self.db = db
+        self.table = table
+        self.key_column = key_column
+        self.name_column = name_column
+        self.keys = None
+
+    def _fetch(self, names = None):
+        query = sql.SQL("SELECT {}, {} FROM {}").format(
+            sql.Identifier(self.name_column), sql.Identifier(self.key_column), sql.Identifier(self.table))
+        if names is not None:
+            query += sql.SQL(" WHERE {} = ANY(%s)").format(sql.Identifier(self.name_column))
+        self.db.cursor.execute(query, (names,) if names is not None else None)
+        return dict(self.db.cursor.fetchall())
+
+    def lookup(self, df, attributes = ()):
+        """Surrogate keys for df[name_column], inserting unseen values with their attributes"""
+        if self.keys is None:
+            self.keys = self._fetch()
+        values = df[self.name_column]
+        new = df.loc[values.notna() & ~values.isin(self.keys), [self.name_column, *attributes]]
+        new = new.drop_duplicates(self.name_column)
+        if len(new):
+            columns = sql.SQL(', ').join(map(sql.Identifier, new.columns))
+            query = sql.SQL("INSERT INTO {} ({}) VALUES %s ON CONFLICT ({}) DO NOTHING").format(
+                sql.Identifier(self.table), columns, sql.Identifier(self.name_column))
+            execute_values(self.db.cursor, query.as_string(self.db.conn),
+                           list(new.astype(object).itertuples(index = False, name = None)))
+            self.keys.update(self._fetch(new[self.name_column].tolist()))
+            logger.info(f"Added {len(new)} new keys to {self.table}")
+        return values.map(self.keys)
+
+
+class StarSchemaLoader:
+    """Loads fact_sales from the processed frame with dictionary-encoded suburb/type.
+
+    fact_sales is loaded alongside properties_processed, not instead of it
+    (SCHEMA_MODE = 'star' is additive): it only serves the analytics queries.
+    """
+
+    def __init__(self, db = None, config = None):
+        self.config = config or Config()
+        if db is None:
+            db = DatabaseSetup(config = self.config)
+            db.connect()
+        self.db = db
+        self.db.create_table_loads_table()
+        self.suburbs = KeyLookup(db, 'dim_suburb', 'suburb_key', 'suburb')
+        self.types = KeyLookup(db, 'dim_property_type', 'type_key', 'type')
+
+    def refresh_suburb_dimension(self):
+        """Upsert each suburb's attributes from properties_raw into dim_suburb"""
+        targets = sql.SQL(', ').join(map(sql.Identifier, ['suburb', *SUBURB_ATTRIBUTES]))
+        sources = sql.SQL(', ').join(
+            sql.SQL("avg({})").format(sql.Identifier(column)) for column in SUBURB_ATTRIBUTES.values())
+        updates = sql.SQL(', ').join(
+            sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column)) for column in SUBURB_ATTRIBUTES)
+        query = sql.SQL("""
+            INSERT INTO dim_suburb ({})
+            SELECT suburb, {} FROM properties_raw WHERE suburb IS NOT NULL GROUP BY suburb
+            ON CONFLICT (suburb) DO UPDATE SET {}
+        """).format(targets, sources, updates)
+        self.db.cursor.execute(query)
+        return self.db.cursor.rowcount
+
+    def load(self, df):
+        """Replace fact_sales with df (PROCESSED_COLUMNS); TRUNCATE and COPY commit together"""
+        try:
+            suburbs = self.refresh_suburb_dimension()
+            facts = df.copy()
+            facts['suburb_key'] = self.suburbs.lookup(facts)
+            facts['type_key'] = self.types.lookup(facts, attributes = ['is_house'])
+            facts = facts[FACT_COLUMNS]
+            for col in INTEGER_COLUMNS:
+                # COPY rejects '2.0' for INTEGER columns
+                facts[col] = pd.to_numeric(facts[col], errors='coerce').round().astype('Int64')
+
+            buffer = io.StringIO()
+            facts.to_csv(buffer, index = False, header = False)
+            buffer.seek(0)
+            self.db.cursor.execute(sql.SQL("TRUNCATE TABLE {};").format(sql.Identifier(FACT_TABLE)))
+            copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+                sql.Identifier(FACT_TABLE), sql.SQL(', ').join(map(sql.Identifier, FACT_COLUMNS)))
+            self.db.cursor.copy_expert(copy_query.as_string(self.db.conn), buffer)
+            self.db.mark_loaded(FACT_TABLE)
+            self.db.conn.commit()
+            logger.info(f"Loaded {len(facts)} records to {FACT_TABLE} ({suburbs} suburbs refreshed)")
+            return len(facts)
+        except Exception as e:
+            logger.error(f"error loading star schema: {e}")
+            self.db.conn.rollback()
+            # keys inserted in the rolled-back transaction are gone
+            self.suburbs.keys = self.types.keys = None
+            raise
+
+    def load_from_processed(self):
+        """Replace fact_sales from properties_processed in-database (ETL_MODE = 'in_database')"""
+        columns = sql.SQL(', ').join(map(sql.Identifier, FACT_COLUMNS))
+        selected = sql.SQL(', ').join(
+            sql.SQL("p.{}").format(sql.Identifier(col)) for col in FACT_COLUMNS[2:])
+        try:
+            self.refresh_suburb_dimension()
+            self.db.cursor.execute("""
+                INSERT INTO dim_property_type (type, is_house)
+                SELECT DISTINCT ON (type) type, is_house FROM properties_processed
+                ON CONFLICT (type) DO NOTHING;
+            """)
+            self.db.cursor.execute(sql.SQL("TRUNCATE TABLE {};").format(sql.Identifier(FACT_TABLE)))
+            self.db.cursor.execute(sql.SQL("""
+                INSERT INTO {} ({})
+                SELECT s.suburb_key, t.type_key, {}
+                FROM properties_processed p
+                JOIN dim_suburb s ON s.suburb = p.suburb
+                JOIN dim_property_type t ON t.type = p.type
+            """).format(sql.Identifier(FACT_TABLE), columns, selected))
+            loaded = self.db.cursor.rowcount
+            self.db.mark_loaded(FACT_TABLE)
+            self.db.conn.commit()
+            logger.info(f"Loaded {loaded} records to {FACT_TABLE} in-database")
+            return loaded
+        except Exception as e:
+            logger.error(f"error loading star schema in-database: {e}")
+            self.db.conn.rollback()
+            raise
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    # rebuild the star schema from the current properties_processed
+    loader = StarSchemaLoader()
+    try:
+        loader.db.create_star_tables()
+        loader.load_from_processed()
+    except Exception as e:
+        logger.error(f"Star schema load failed: {e}")
+    finally:
+        loader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import bisect
+import logging
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from src.change_feed import earliest_month
+from src.config import Config
+from src.db_setup import DatabaseSetup
+from src.queries import QueryCatalog
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# segment_type -> column in properties_processed (None = all of Sydney)
+SEGMENTS = {
+    'all': None,
+    'distance_category': 'distance_category',
+    'suburb': 'suburb',
+}
+ALL_SEGMENT = 'Sydney'
+# properties_change_offsets consumer name of the rollup refresh
+ROLLUP_CONSUMER = 'timeseries'
+
+ROLLUP_COLUMNS = [
+    'period_type', 'period_start', 'segment_type', 'segment', 'num_sales',
+    'median_price', 'median_price_per_sqm',
+    'rolling_median_price', 'rolling_num_sales', 'rolling_window_months'
+]
+
+
+def month_ordinal(dates):
+    """Months since year 0, so month arithmetic is plain integer arithmetic"""
+    return dates.dt.year * 12 + dates.dt.month - 1
+
+
+def ordinal_to_date(months):
+    months = np.asarray(months, dtype=np.int64)
+    return pd.to_datetime({'year': months // 12, 'month': months % 12 + 1, 'day': 1}).dt.date
+
+
+class RollingMedian:
+    """Exact median over a sliding window of months.
+
+    Prices are kept in one sorted list. Adding a month inserts its prices with
+    bisect and evicts the month that falls out of the window, so each step only
+    touches the rows entering and leaving the window.
+    """
+
+    def __init__(self, window_months = 12):
+        self.window_months = window_months
+        self.values = []
+        self.months = deque()
+
+    def add(self, month, prices):
+        for price in prices:
+            bisect.insort(self.values, price)
+        self.months.append((month, prices))
+
+        while self.months and self.months[0][0] <= month - self.window_months:
+            _, expired = self.months.popleft()
+            for price in expired:
+                del self.values[bisect.bisect_left(self.values, price)]
+
+    def median(self):
+        n = len(self.values)
+        if n == 0:
+            return None
+        mid = n // 2
+        if n % 2:
+            return self.values[mid]
+        return (self.values[mid - 1] + self.values[mid]) / 2
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _period_rollups(frame, segment_type, period_type, since):
+    period_col = 'month' if period_type == 'month' else 'quarter'
+    rows = frame if since is None else frame[frame[period_col] >= since]
+    grouped = rows.groupby(['segment', period_col]).agg(
+        num_sales = ('price', 'size'),
+        median_price = ('price', 'median'),
+        median_price_per_sqm = ('price_per_sqm', 'median')
+    ).reset_index()
+
+    grouped['period_type'] = period_type
+    grouped['period_start'] = ordinal_to_date(grouped[period_col]).values
+    grouped['segment_type'] = segment_type
+    return grouped.drop(columns=[period_col])
+
+
+def _rolling_rollups(frame, window_months, since):
+    rows = []
+    frame = frame.sort_values(['segment', 'month'], kind='stable')
+    for segment, seg_frame in frame.groupby('segment', sort=False):
+        window = RollingMedian(window_months)
+        months = seg_frame['month'].to_numpy()
+        prices = seg_frame['price'].to_numpy(dtype=float)
+        bounds = np.flatnonzero(np.diff(months)) + 1
+
+        for month_block, price_block in zip(np.split(months, bounds), np.split(prices, bounds)):
+            month = month_block[0]
+            window.add(month, price_block.tolist())
+            if since is None or month >= since:
+                rows.append((segment, month, window.median(), len(window)))
+
+    rolling = pd.DataFrame(rows, columns=['segment', 'month', 'rolling_median_price', 'rolling_num_sales'])
+    rolling['rolling_window_months'] = window_months
+    return rolling
+
+
+def build_rollups(df, since_month = None, window_months = 12):
+    """Monthly and quarterly medians per segment, with a rolling monthly median.
+
+    Monthly rows carry the median and sale count of the window_months months
+    ending at that month, and the window length itself (rolling_window_months).
+
+    df needs date_sold, price, price_per_sqm, suburb and distance_category.
+    With since_month (a month ordinal) only periods from that month onwards are
+    returned; earlier rows in df are used to seed the rolling window.
+    """
+    df = df.dropna(subset=['date_sold', 'price'])
+    dates = pd.to_datetime(df['date_sold'], errors='coerce')
+    base = pd.DataFrame({
+        'month': month_ordinal(dates),
+        'price': pd.to_numeric(df['price'], errors='coerce'),
+        'price_per_sqm': pd.to_numeric(df['price_per_sqm'], errors='coerce'),
+    }).dropna(subset=['month', 'price'])
+    base['month'] = base['month'].astype(np.int64)
+    base['quarter'] = base['month'] - base['month'] % 3
+    since_quarter = None if since_month is None else since_month - since_month % 3
+
+    results = []
+    for segment_type, column in SEGMENTS.items():
+        frame = base.copy()
+        frame['segment'] = ALL_SEGMENT if column is None else df.loc[base.index, column]
+        frame = frame.dropna(subset=['segment'])
+
+        monthly = _period_rollups(frame, segment_type, 'month', since_month)
+        rolling = _rolling_rollups(frame, window_months, since_month)
+        rolling['period_start'] = ordinal_to_date(rolling['month']).values
+        monthly = monthly.merge(rolling.drop(columns=['month']), on=['segment', 'period_start'], how='left')
+
+        results.append(monthly)
+        results.append(_period_rollups(frame, segment_type, 'quarter', since_quarter))
+
+    rollups = pd.concat(results, ignore_index=True)
+    for col in ROLLUP_COLUMNS:
+        if col not in rollups.columns:
+            rollups[col] = None
+    return rollups[ROLLUP_COLUMNS].sort_values(
+        ['period_type', 'segment_type', 'segment', 'period_start']
+    ).reset_index(drop=True)
+
+
+class TimeSeriesRollup:
+    """Maintain properties_timeseries from properties_processed"""
+
+    def __init__(self, db = None, config = None):
+        self.config = config or Config()
+        if db is None:
+            db = DatabaseSetup(config = self.config)
+            db.connect()
+        self.db = db
+        self.queries = QueryCatalog(db)
+
+    def _last_month(self):
+        last = self.queries.scalar('timeseries_last_month')
+        if last is None:
+            return None
+        return last.year * 12 + last.month - 1
+
+    def refresh(self, full = False, since = None):
+        """Recompute rollups from the last stored month onwards (or everything).
+
+        since: the earliest date whose sales changed, if before the last stored month
+        """
+        window = self.config.ROLLING_WINDOW_MONTHS
+        since_month = None if full else self._last_month()
+        if since_month is not None and self.queries.scalar('timeseries_window') != window:
+            # the stored rows rolled over a different window; recompute them all
+            logger.info(f"ROLLING_WINDOW_MONTHS is now {window}, rebuilding every rollup")
+            since_month = None
+        if since_month is not None and since is not None:
+            since_month = min(since_month, since.year * 12 + since.month - 1)
+
+        try:
+            if since_month is None:
+                df = self.queries.read('timeseries_inputs')
+            else:
+                # the latest stored month may be partial, so recompute it along with
+                # enough history to seed the rolling window and its whole quarter
+                since_quarter = since_month - since_month % 3
+                lookback = min(since_month - (window - 1), since_quarter)
+                df = self.queries.read('timeseries_inputs_since', (ordinal_to_date([lookback])[0],))
+            logger.info(f"Building time-series rollups from {len(df)} sales"
+                        + ("" if since_month is None else f" (incremental from {ordinal_to_date([since_month])[0]})"))
+            rollups = build_rollups(df, since_month = since_month, window_months = window)
+
+            if since_month is None:
+                self.db.cursor.execute("TRUNCATE TABLE properties_timeseries;")
+            else:
+                self.db.cursor.execute(
+                    """
+                    delete from properties_timeseries
+                    where (period_type = 'month' and period_start >= %s)
+                        or (period_type = 'quarter' and period_start >= %s);
+                    """,
+                    (ordinal_to_date([since_month])[0], ordinal_to_date([since_quarter])[0])
+                )
+
+            values = [
+                tuple(None if pd.isnull(v) else v for v in row)
+                for row in rollups.itertuples(index=False, name=None)
+            ]
+            cols_str = ', '.join(ROLLUP_COLUMNS)
+            query = f"INSERT INTO properties_timeseries ({cols_str}) VALUES %s"
+            execute_values(self.db.cursor, query, values, page_size=self.config.EXECUTE_VALUES_PAGE_SIZE)
+            self.db.conn.commit()
+
+            logger.info(f"Wrote {len(values)} rows to properties_timeseries")
+            return rollups
+        except Exception as e:
+            logger.error(f"Error refreshing time-series rollups: {e}")
+            self.db.conn.rollback()
+            raise
+
+    def refresh_changes(self, feed):
+        """Recompute rollups from the earliest month changed since the last applied change feed entry.
+
+        Returns the rollups, or None if properties_processed has not changed.
+        """
+        changes = feed.changes_since(feed.offset(ROLLUP_CONSUMER))
+        if not changes and self._last_month() is not None:
+            logger.info("No properties_processed changes since the last rollup refresh")
+            return None
+        rollups = self.refresh(since = earliest_month(changes))
+        if changes:
+            feed.commit_offset(ROLLUP_CONSUMER, changes[-1]['id'])
+        return rollups
+
+    def get_series(self, segment_type = 'all', segment = ALL_SEGMENT, period_type = 'month'):
+        return self.queries.read('timeseries_series', (period_type, segment_type, segment))
+
+    def export_csv(self, filepath = None):
+        """Write the rollup table for the dashboard"""
+        filepath = filepath or self.config.TIMESERIES_PATH
+        os.makedirs(os.path.dirname(filepath), exist_ok = True)
+        df = self.queries.read('timeseries_all')
+        df.to_csv(filepath, index = False)
+        logger.info(f"Saved {len(df)} rollup rows to {filepath}")
+        return filepath
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    rollup = TimeSeriesRollup()
+    try:
+        rollup.refresh()
+        print(rollup.get_series().tail(12).to_string(index=False))
+    except Exception as e:
+        logger.error(f"Time-series refresh failed: {e}")
+        raise
+    finally:
+        rollup.close()
+
+
+if __name__ == "__main__":
+    main()
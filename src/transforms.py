@@ -0,0 +1,221 @@
+import logging
+import numpy as np
+import pandas as pd
+from src.config import Config
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class TransformStep:
+    """One transform: the columns it reads, the columns it writes and how.
+
+    kind='column' steps return {output_column: Series}; kind='filter' steps
+    return a boolean mask of rows to keep. `sql` is the same transform as a
+    Postgres expression template: {output_column: template} for column steps,
+    a WHERE-condition template for filters. Templates reference input columns
+    as {column} and config values as {config.NAME}.
+    """
+
+    def __init__(self, name, inputs, outputs, func, kind = 'column', sql = None):
+        if kind not in ('column', 'filter'):
+            raise ValueError(f"Unknown transform kind: {kind}")
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.func = func
+        self.kind = kind
+        self.sql = sql
+
+    def is_cached(self, columns):
+        # a derived column that is already present does not need recomputing;
+        # steps that rewrite their own inputs (fills, parsing) always run
+        return (
+            self.kind == 'column'
+            and set(self.outputs) <= set(columns)
+            and not set(self.outputs) & set(self.inputs)
+        )
+
+    def __repr__(self):
+        return f"TransformStep({self.name!r}, {self.inputs} -> {self.outputs}, {self.kind})"
+
+
+TRANSFORM_STEPS = {}
+
+
+def register_step(name, inputs, outputs = (), kind = 'column', sql = None):
+    """Decorator adding a transform function to the registry"""
+    def decorator(func):
+        if name in TRANSFORM_STEPS:
+            raise ValueError(f"Transform step already registered: {name}")
+        TRANSFORM_STEPS[name] = TransformStep(name, inputs, outputs, func, kind, sql)
+        return func
+    return decorator
+
+
+@register_step(
+    'remove_outliers', inputs=['price'], kind='filter',
+    sql="{price} BETWEEN {config.OUTLIER_MIN_PRICE} AND {config.OUTLIER_MAX_PRICE}"
+)
+def remove_outliers(df, config):
+    return (df['price'] >= config.OUTLIER_MIN_PRICE) & (df['price'] <= config.OUTLIER_MAX_PRICE)
+
+
+@register_step(
+    'price_per_sqm', inputs=['price', 'property_size'], outputs=['price_per_sqm'],
+    sql={'price_per_sqm': "CASE WHEN {property_size} > 0 THEN {price} / {property_size} END"}
+)
+def price_per_sqm(df, config):
+    size = pd.to_numeric(df['property_size'], errors='coerce')
+    price = pd.to_numeric(df['price'], errors='coerce')
+    return {'price_per_sqm': price.div(size.where(size > 0))}
+
+
+@register_step(
+    'is_house', inputs=['type'], outputs=['is_house'],
+    sql={'is_house': "COALESCE({type}, '') ILIKE '%house%'"}
+)
+def is_house(df, config):
+    return {'is_house': df['type'].astype(str).str.lower().str.contains('house', regex=False)}
+
+
+DISTANCE_BINS = [-np.inf, 5, 10, 20, np.inf]
+DISTANCE_LABELS = ['Inner City', 'Inner Suburbs', 'Middle Suburbs', 'Outer Suburbs']
+
+
+@register_step(
+    'distance_category', inputs=['km_from_cbd'], outputs=['distance_category'],
+    sql={'distance_category': (
+        "CASE WHEN {km_from_cbd} IS NULL THEN NULL"
+        " WHEN {km_from_cbd} < 5 THEN 'Inner City'"
+        " WHEN {km_from_cbd} < 10 THEN 'Inner Suburbs'"
+        " WHEN {km_from_cbd} < 20 THEN 'Middle Suburbs'"
+        " ELSE 'Outer Suburbs' END"
+    )}
+)
+def distance_category(df, config):
+    km = pd.to_numeric(df['km_from_cbd'], errors='coerce')
+    categories = pd.cut(km, bins=DISTANCE_BINS, labels=DISTANCE_LABELS, right=False)
+    return {'distance_category': categories.astype(object).where(categories.notna(), None)}
+
+
+@register_step(
+    'fill_parking', inputs=['num_parking'], outputs=['num_parking'],
+    sql={'num_parking': "COALESCE({num_parking}, 0)"}
+)
+def fill_parking(df, config):
+    return {'num_parking': df['num_parking'].fillna(0)}
+
+
+@register_step(
+    'parse_date_sold', inputs=['date_sold'], outputs=['date_sold'],
+    sql={'date_sold': "{date_sold}::DATE"}
+)
+def parse_date_sold(df, config):
+    return {'date_sold': pd.to_datetime(df['date_sold'], errors='coerce')}
+
+
+class TransformExecutor:
+    """Plan and run registered transform steps over a DataFrame.
+
+    Steps are ordered by their declared columns. Row filters run as soon as
+    their inputs exist, so derived columns are only computed for surviving
+    rows. Column steps that are ready at the same point are fused: their
+    outputs are computed from the same frame and attached with one assign.
+    Steps whose derived outputs are already present are skipped.
+    """
+
+    def __init__(self, steps = None, config = None):
+        if steps is None:
+            steps = list(TRANSFORM_STEPS.values())
+        else:
+            steps = [TRANSFORM_STEPS[s] if isinstance(s, str) else s for s in steps]
+        self.steps = steps
+        self.config = config or Config()
+
+    def plan(self, columns):
+        """List of stages: ('filter' | 'column', [steps]), in execution order"""
+        available = set(columns)
+        remaining = [s for s in self.steps if not s.is_cached(columns)]
+        stages = []
+
+        while remaining:
+            def ready(step):
+                for col in step.inputs:
+                    if col not in available:
+                        return False
+                    # wait for any other pending step that still writes this column
+                    if any(col in other.outputs for other in remaining if other is not step):
+                        return False
+                return True
+
+            ready_steps = [s for s in remaining if ready(s)]
+            if not ready_steps:
+                missing = {s.name: [c for c in s.inputs if c not in available] for s in remaining}
+                raise ValueError(f"Cannot schedule transform steps, unresolved inputs: {missing}")
+
+            filters = [s for s in ready_steps if s.kind == 'filter']
+            stage = ('filter', filters) if filters else ('column', ready_steps)
+            stages.append(stage)
+            for step in stage[1]:
+                remaining.remove(step)
+                available.update(step.outputs)
+
+        return stages
+
+    def run(self, df):
+        stages = self.plan(df.columns)
+        skipped = [s.name for s in self.steps if s.is_cached(df.columns)]
+        if skipped:
+            logger.info(f"Skipping cached transform steps: {skipped}")
+
+        for kind, steps in stages:
+            names = [s.name for s in steps]
+            if kind == 'filter':
+                mask = pd.Series(True, index=df.index)
+                for step in steps:
+                    mask &= step.func(df, self.config).fillna(False).astype(bool)
+                before = len(df)
+                df = df[mask]
+                logger.info(f"Applied filter {names}: removed {before - len(df)} records")
+            else:
+                new_columns = {}
+                for step in steps:
+                    new_columns.update(step.func(df, self.config))
+                # assign returns a new frame, so filtered views are never written to
+                df = df.assign(**new_columns)
+                logger.info(f"Applied column steps {names}")
+
+        return df
+
+    def to_sql(self, source_table, source_columns, output_columns, conditions = ()):
+        """Compile the plan into one SELECT over source_table.
+
+        Each column starts as itself and is replaced by its step's expression,
+        so later steps and filters see earlier outputs, mirroring run().
+        """
+        expressions = {col: col for col in source_columns}
+        where = list(conditions)
+
+        for kind, steps in self.plan(source_columns):
+            for step in steps:
+                if step.sql is None:
+                    raise ValueError(f"Transform step {step.name} has no SQL definition")
+            resolved = dict(expressions)
+            for step in steps:
+                args = {col: f"({expressions[col]})" for col in step.inputs}
+                if kind == 'filter':
+                    where.append(step.sql.format(config = self.config, **args))
+                else:
+                    for output, template in step.sql.items():
+                        resolved[output] = template.format(config = self.config, **args)
+            expressions = resolved
+
+        select = ",\n    ".join(f"{expressions[col]} AS {col}" for col in output_columns)
+        query = f"SELECT\n    {select}\nFROM {source_table}"
+        if where:
+            query += "\nWHERE " + "\n    AND ".join(f"({c})" for c in where)
+        return query
@@ -0,0 +1,198 @@
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+from src.config import Config
+from src.transforms import DISTANCE_BINS, DISTANCE_LABELS
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# hedonic model: log(price) ~ intercept + FEATURES, fitted per segment
+FEATURES = ['num_bed', 'num_bath', 'num_parking', 'log_property_size', 'km_from_cbd']
+SEGMENTS = [
+    f"{kind}|{distance}" for kind in ['Apt', 'House'] for distance in DISTANCE_LABELS
+]
+GLOBAL_SEGMENT = 'All'
+# columns score() needs
+INPUT_COLUMNS = ['suburb', 'is_house', 'num_bed', 'num_bath', 'num_parking', 'property_size', 'km_from_cbd']
+
+
+class ValuationModel:
+    """Per-segment least-squares price model with per-suburb adjustments.
+
+    Segments are (house/apartment, distance category). Each one gets its own
+    coefficients over FEATURES on log(price), falling back to the pooled
+    model when it has fewer than VALUATION_MIN_SEGMENT_ROWS sales. A suburb's
+    adjustment is its mean residual shrunk towards zero by
+    VALUATION_SUBURB_SHRINKAGE pseudo-sales. Everything is held in a few
+    float arrays, so score() is a gather plus one row-wise dot product.
+    """
+
+    def __init__(self, min_segment_rows = None, suburb_shrinkage = None, config = None):
+        config = config or Config()
+        self.min_segment_rows = min_segment_rows or config.VALUATION_MIN_SEGMENT_ROWS
+        self.suburb_shrinkage = config.VALUATION_SUBURB_SHRINKAGE if suburb_shrinkage is None else suburb_shrinkage
+        # row i: [intercept, *FEATURES, smearing factor] of SEGMENTS[i]; last row pooled
+        self.coefficients = None
+        self.segment_rows = None
+        # feature medians, filled in for missing values
+        self.fill = None
+        self.suburbs = pd.Index([])
+        # one per suburb, plus a trailing 0 for suburbs the model has not seen
+        self.suburb_offsets = np.zeros(1)
+        self.suburb_rows = np.zeros(0, dtype = np.int64)
+
+    def _features(self, df, fill = None):
+        """(n, 1 + len(FEATURES)) design matrix and the segment index of each row"""
+        n = len(df)
+        X = np.empty((n, len(FEATURES) + 1))
+        X[:, 0] = 1.0
+        for i, col in enumerate(FEATURES, start = 1):
+            if col == 'log_property_size':
+                size = pd.to_numeric(df['property_size'], errors='coerce').to_numpy(dtype = float)
+                with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                    X[:, i] = np.where(size > 0, np.log(size), np.nan)
+            else:
+                X[:, i] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype = float)
+        if fill is None:
+            fill = np.nanmedian(X[:, 1:], axis = 0)
+        missing = np.isnan(X[:, 1:])
+        if missing.any():
+            X[:, 1:] = np.where(missing, fill, X[:, 1:])
+
+        is_house = df['is_house'].fillna(False).to_numpy(dtype = bool)
+        # distance bins straight from km_from_cbd (imputed), as the ETL assigns them
+        distance = np.searchsorted(DISTANCE_BINS[1:-1], X[:, FEATURES.index('km_from_cbd') + 1], side = 'right')
+        segment = is_house.astype(np.int64) * len(DISTANCE_LABELS) + distance
+        return X, segment, fill
+
+    def _suburb_codes(self, suburbs):
+        # -1 (unknown suburb) picks the trailing 0 offset
+        return self.suburbs.get_indexer(suburbs)
+
+    def fit(self, df):
+        """Fit on processed rows (needs price and INPUT_COLUMNS)"""
+        df = df[df['price'] > 0]
+        X, segment, self.fill = self._features(df)
+        y = np.log(df['price'].to_numpy(dtype = float))
+
+        k = X.shape[1]
+        self.coefficients = np.zeros((len(SEGMENTS) + 1, k + 1))
+        self.segment_rows = np.bincount(segment, minlength = len(SEGMENTS) + 1)
+        self.segment_rows[-1] = len(y)
+        pooled, *_ = np.linalg.lstsq(X, y, rcond = None)
+        self.coefficients[:, :k] = pooled
+        for i in range(len(SEGMENTS)):
+            mask = segment == i
+            if self.segment_rows[i] >= max(self.min_segment_rows, k):
+                self.coefficients[i, :k], *_ = np.linalg.lstsq(X[mask], y[mask], rcond = None)
+        residual = y - np.einsum('ij,ij->i', X, self.coefficients[segment, :k])
+
+        # suburb effect: shrunk mean residual
+        self.suburbs = pd.Index(df['suburb'].astype(str).unique())
+        codes = self._suburb_codes(df['suburb'].astype(str))
+        self.suburb_rows = np.bincount(codes, minlength = len(self.suburbs))
+        sums = np.bincount(codes, weights = residual, minlength = len(self.suburbs))
+        self.suburb_offsets = np.append(sums / (self.suburb_rows + self.suburb_shrinkage), 0.0)
+        residual = residual - self.suburb_offsets[codes]
+
+        # smearing factor: mean exp(residual) per segment, to undo the log bias
+        smear = np.bincount(segment, weights = np.exp(residual), minlength = len(SEGMENTS) + 1)
+        self.coefficients[:, k] = np.exp(residual).mean()
+        seen = self.segment_rows[:-1] > 0
+        self.coefficients[:-1, k][seen] = smear[:-1][seen] / self.segment_rows[:-1][seen]
+        logger.info(f"Fitted valuation model on {len(y)} sales, {len(self.suburbs)} suburbs "
+                    f"(log-price residual std {residual.std():.3f})")
+        return self
+
+    def score(self, df):
+        """Fair value of each row, vectorised over the whole frame"""
+        if self.coefficients is None:
+            raise ValueError("Valuation model is not fitted")
+        X, segment, _ = self._features(df, self.fill)
+        k = X.shape[1]
+        # small segments already hold the pooled coefficients
+        coefficients = self.coefficients[segment]
+        log_value = np.einsum('ij,ij->i', X, coefficients[:, :k])
+        log_value += self.suburb_offsets[self._suburb_codes(df['suburb'].astype(str))]
+        return np.exp(log_value) * coefficients[:, k]
+
+    def residuals(self, df):
+        """df with fair_value, residual (price - fair value) and residual_pct added"""
+        result = df.copy()
+        result['fair_value'] = self.score(df).round(2)
+        result['residual'] = result['price'] - result['fair_value']
+        result['residual_pct'] = (100 * result['residual'] / result['fair_value']).round(1)
+        return result
+
+    def to_records(self):
+        """(kind, name, num_rows, coefficients bytes) rows for properties_valuation"""
+        records = [
+            ('segment', name, int(rows), coefficients.astype('<f8').tobytes())
+            for name, rows, coefficients in zip(SEGMENTS + [GLOBAL_SEGMENT], self.segment_rows, self.coefficients)
+        ]
+        records.append(('fill', GLOBAL_SEGMENT, 0, self.fill.astype('<f8').tobytes()))
+        records.extend(
+            ('suburb', name, int(rows), np.array([offset], dtype = '<f8').tobytes())
+            for name, rows, offset in zip(self.suburbs, self.suburb_rows, self.suburb_offsets[:-1])
+        )
+        return records
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        model = cls(**kwargs)
+        segments = {}
+        suburbs, offsets, counts = [], [], []
+        for kind, name, num_rows, data in records:
+            values = np.frombuffer(bytes(data), dtype = '<f8')
+            if kind == 'segment':
+                segments[name] = (num_rows, values)
+            elif kind == 'fill':
+                model.fill = values.copy()
+            elif kind == 'suburb':
+                suburbs.append(name)
+                offsets.append(values[0])
+                counts.append(num_rows)
+        if not segments:
+            return model
+        order = SEGMENTS + [GLOBAL_SEGMENT]
+        model.segment_rows = np.array([segments[name][0] for name in order], dtype = np.int64)
+        model.coefficients = np.vstack([segments[name][1] for name in order])
+        model.suburbs = pd.Index(suburbs)
+        model.suburb_offsets = np.append(np.array(offsets, dtype = float), 0.0)
+        model.suburb_rows = np.array(counts, dtype = np.int64)
+        return model
+
+
+def main():
+    from src.db_setup import DatabaseSetup
+    from src.queries import QueryCatalog
+
+    parser = argparse.ArgumentParser(description = "Fit the valuation model and measure scoring throughput")
+    parser.add_argument('--rows', type = int, default = 2_000_000, help = "rows to score")
+    args = parser.parse_args()
+
+    db = DatabaseSetup()
+    db.connect()
+    try:
+        df = QueryCatalog(db).read('valuation_features')
+        started = time.perf_counter()
+        model = ValuationModel().fit(df)
+        logger.info(f"Fit: {time.perf_counter() - started:.3f}s")
+
+        batch = df.sample(args.rows, replace = True, random_state = 0).reset_index(drop = True)
+        started = time.perf_counter()
+        model.score(batch)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Scored {len(batch):,} rows in {elapsed:.3f}s ({len(batch) / elapsed:,.0f} rows/s)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from src.change_feed import ChangeFeed, changed_suburbs, earliest_month, partition_changes
+from src.config import Config
+from src.etl_pipeline import ETLPipeline
+from tests.conftest import insert_raw, raw_fixture, shadow_tables
+
+
+def test_partition_changes():
+    before = {('Bondi', 1): (3, 10), ('Bondi', 2): (1, 20), ('Penrith', 1): (2, 30)}
+    after = {('Bondi', 1): (3, 10), ('Bondi', 2): (1, 21), ('Parramatta', 1): (4, 40)}
+    assert partition_changes(before, after) == ({('Parramatta', 1)}, {('Bondi', 2)}, {('Penrith', 1)})
+    assert partition_changes(after, after) == (set(), set(), set())
+
+
+def test_record_changes_logs_only_changed_partitions(db):
+    shadow_tables(db, 'properties_raw', 'properties_processed', 'properties_table_loads', 'properties_changelog',
+                  'properties_change_partitions', 'properties_change_offsets')
+    raw = raw_fixture()
+    insert_raw(db, raw)
+    config = Config(OUTLIER_METHOD = 'fixed', TRANSFORM_WORKERS = 1, PROCESSED_LOAD_STRATEGY = 'truncate')
+    pipeline = ETLPipeline(db = db, config = config)
+    feed = ChangeFeed(db = db, config = config)
+
+    def load():
+        pipeline.load_to_processed(pipeline.transform_data(pipeline.extract_from_raw()))
+        return pipeline.record_changes()
+
+    first = load()
+    [change] = feed.changes_since(0)
+    assert change['id'] == first and change['partitions_updated'] == change['partitions_deleted'] == 0
+    assert change['partitions_inserted'] > 0 and change['num_rows'] > 0
+    # rewriting identical rows is not a change
+    assert load() is None
+
+    # reprice the Bondi sales of one month
+    month = raw.loc[raw['suburb'] == 'Bondi', 'date_sold'].min().date().replace(day = 1)
+    db.cursor.execute(
+        "UPDATE properties_raw SET price = price + 1000 WHERE suburb = 'Bondi' AND date_trunc('month', date_sold) = %s",
+        (month,))
+    db.conn.commit()
+    second = load()
+    [change] = feed.changes_since(first)
+    assert change['id'] == second
+    assert (change['partitions_inserted'], change['partitions_updated'], change['partitions_deleted']) == (0, 1, 0)
+    assert changed_suburbs([change]) == ['Bondi']
+    assert earliest_month([change]) == month
+
+    feed.commit_offset('test', second)
+    assert feed.offset('test') == second
+    assert feed.changes_since(feed.offset('test')) == []
+    assert feed.latest_id() == second
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from src.comparables import ComparablesIndex, RESULT_COLUMNS, load_or_build
+from src.config import Config
+
+
+def sales(seed = 5, size = 4000):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'suburb': rng.choice(['Bondi', 'Penrith', 'Parramatta'], size),
+        'num_bed': rng.integers(1, 5, size),
+        'is_house': rng.random(size) > 0.4,
+        'property_size': rng.integers(50, 1000, size).astype(float),
+        'date_sold': pd.Timestamp('2019-01-01') + pd.to_timedelta(rng.integers(0, 1800, size), unit = 'D'),
+        'price': rng.uniform(400000, 3000000, size).round(2),
+        'num_bath': rng.integers(1, 4, size),
+    })
+
+
+def brute_force(df, suburb, num_bed, is_house, property_size, tolerance, months):
+    as_of = df['date_sold'].max()
+    rows = df[
+        (df['suburb'] == suburb) & (df['num_bed'] == num_bed) & (df['is_house'] == is_house)
+        & (df['property_size'] >= property_size * (1 - tolerance))
+        & (df['property_size'] <= property_size * (1 + tolerance))
+        & (df['date_sold'] > as_of - pd.DateOffset(months = months)) & (df['date_sold'] <= as_of)
+    ]
+    return sorted(zip(rows['property_size'], rows['date_sold'].dt.date, rows['price']))
+
+
+def result_rows(index, *args, **kwargs):
+    df = index.comparables(*args, **kwargs)
+    assert list(df.columns) == RESULT_COLUMNS
+    assert df['date_sold'].is_monotonic_decreasing
+    return sorted(zip(df['property_size'], pd.to_datetime(df['date_sold']).dt.date, df['price']))
+
+
+def test_query_matches_a_full_scan():
+    df = sales()
+    # sales on the edges of the 12 month window: only the later one is in it
+    as_of = df['date_sold'].max()
+    edges = df.iloc[[0, 0]].assign(suburb = 'Bondi', num_bed = 3, is_house = True, property_size = 500.0,
+                                   date_sold = [as_of - pd.DateOffset(months = 12), as_of - pd.DateOffset(months = 12, days = -1)])
+    df = pd.concat([df, edges], ignore_index = True)
+    index = ComparablesIndex.from_dataframe(df, Config())
+    for suburb, num_bed, is_house, size in [('Bondi', 3, True, 500), ('Penrith', 1, False, 80), ('Parramatta', 4, True, 990)]:
+        for tolerance, months in [(0.1, 12), (0.25, 6), (0.0, 60)]:
+            expected = brute_force(df, suburb, num_bed, is_house, size, tolerance, months)
+            actual = result_rows(index, suburb, num_bed, is_house, size, tolerance = tolerance, months = months)
+            assert actual == expected, (suburb, num_bed, is_house, size, tolerance, months)
+    assert index.comparables('Nowhere', 3, True, 500).empty
+
+
+def test_refresh_rebuilds_only_changed_groups(tmp_path):
+    df = sales()
+    path = str(tmp_path / 'comparables.npz')
+    ComparablesIndex.from_dataframe(df, Config()).save(path)
+
+    changed = df.copy()
+    bondi_houses = (changed['suburb'] == 'Bondi') & changed['is_house'] & (changed['num_bed'] == 2)
+    changed.loc[bondi_houses, 'price'] *= 1.1
+    changed = changed[~((changed['suburb'] == 'Penrith') & (changed['num_bed'] == 1) & ~changed['is_house'])]
+
+    index = ComparablesIndex.load(path, Config())
+    assert index.refresh(df) == 0
+    assert index.refresh(changed) == 1
+    assert ('Penrith', 1, False) not in index.groups
+
+    rebuilt = ComparablesIndex.from_dataframe(changed, Config())
+    for key in [('Bondi', 2, True), ('Bondi', 3, True)]:
+        assert len(index.comparables(*key, 500, tolerance = 0.5, months = 120)) > 0
+        assert result_rows(index, *key, 500, tolerance = 0.5, months = 120) == \
+            result_rows(rebuilt, *key, 500, tolerance = 0.5, months = 120)
+    # back to the saved sales: the repriced group is rebuilt and the removed one restored
+    assert index.refresh(df) == 2
+    assert load_or_build(df, path, Config()).refresh(df) == 0
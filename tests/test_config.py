@@ -0,0 +1,43 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from src.config import Config, ConfigError, load_config
+
+
+def setting(config, name):
+    return getattr(config, name)
+
+
+@pytest.fixture
+def restore_config():
+    yield
+    # back to defaults < environment for the other tests
+    load_config()
+
+
+def test_layers_and_coercion(tmp_path, restore_config):
+    path = tmp_path / 'pipeline.env'
+    path.write_text("TRANSFORM_WORKERS=2\nETL_MODE=in_database\n")
+    config = load_config(str(path), ['TRANSFORM_WORKERS=4'], environ = {'CHANGE_FEED_ENABLED': 'off', 'ETL_MODE': 'pandas'})
+    assert (config.TRANSFORM_WORKERS, config.ETL_MODE, config.CHANGE_FEED_ENABLED) == (4, 'pandas', False)
+    assert Config().TRANSFORM_WORKERS == 4
+
+
+def test_invalid_settings_are_reported_together(restore_config):
+    with pytest.raises(ConfigError) as error:
+        load_config(overrides = ['ETL_MODE=spark', 'TRANSFORM_WORKERS=-1'], environ = {})
+    for name in ['ETL_MODE', 'TRANSFORM_WORKERS']:
+        assert name in str(error.value)
+    with pytest.raises(ConfigError):
+        load_config(overrides = ['DB_PORT=abc'], environ = {})
+    with pytest.raises(ConfigError):
+        Config(NO_SUCH_SETTING = 1)
+
+
+def test_overrides_reach_spawned_workers(restore_config):
+    config = load_config(overrides = ['ETL_MODE=in_database', 'OUTLIER_MAD_THRESHOLD=5.5'], environ = {})
+    # a spawned worker re-imports src.config and only sees the defaults on the class
+    with ProcessPoolExecutor(1, mp_context = multiprocessing.get_context('spawn')) as pool:
+        assert pool.submit(setting, config, 'ETL_MODE').result() == 'in_database'
+        assert pool.submit(setting, Config(), 'OUTLIER_MAD_THRESHOLD').result() == 5.5
+        assert pool.submit(setting, Config(ROLLING_WINDOW_MONTHS = 6), 'ROLLING_WINDOW_MONTHS').result() == 6
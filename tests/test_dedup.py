@@ -0,0 +1,61 @@
+import pandas as pd
+from psycopg2.extras import execute_values
+from src.db_loader import DatabaseLoader
+from src.dedup import compute_row_hash
+from tests.conftest import RAW_FIXTURE_COLUMNS, raw_fixture, shadow_tables
+
+
+def write_csv(df, path):
+    # the processed snapshot format: dd/mm/yyyy dates
+    df.assign(date_sold = df['date_sold'].dt.strftime('%d/%m/%Y')).to_csv(path, index = False)
+    return path
+
+
+def raw_count(db):
+    db.cursor.execute("SELECT count(*), count(row_hash) FROM properties_raw;")
+    return db.cursor.fetchone()
+
+
+def test_row_hash_ignores_representation():
+    df = raw_fixture().head(50)
+    # how the same rows come back from properties_raw: DECIMAL prices, dates,
+    # padded text and float counts
+    from_db = df.assign(
+        price = df['price'].map(lambda p: f"{p:.2f}"),
+        date_sold = df['date_sold'].dt.date,
+        suburb = df['suburb'] + '  ',
+        num_bed = df['num_bed'].astype(float),
+    )
+    pd.testing.assert_series_equal(compute_row_hash(df), compute_row_hash(from_db))
+
+
+def test_row_hash_changes_with_the_natural_key():
+    df = raw_fixture().head(50)
+    moved = df.assign(price = df['price'] + 1)
+    assert not (compute_row_hash(df) == compute_row_hash(moved)).any()
+    assert not compute_row_hash(df).duplicated().any()
+
+
+def test_reingest_is_idempotent(db, tmp_path):
+    shadow_tables(db, 'properties_raw', 'properties_table_loads')
+    df = raw_fixture()
+    csv_path = write_csv(df, tmp_path / 'snapshot.csv')
+    loader = DatabaseLoader(db = db)
+
+    assert loader.load_csv_streaming(csv_path, chunksize = 100) == len(df)
+    assert loader.load_csv_streaming(csv_path, chunksize = 100) == 0
+    assert raw_count(db) == (len(df), len(df))
+
+
+def test_reingest_backfills_rows_loaded_before_dedup(db, tmp_path):
+    shadow_tables(db, 'properties_raw', 'properties_table_loads')
+    df = raw_fixture()
+    # an unhashed table holding every sale, some of them twice
+    legacy = pd.concat([df, df.head(20)])
+    values = [tuple(None if pd.isna(v) else v for v in row) for row in legacy[RAW_FIXTURE_COLUMNS].itertuples(index = False)]
+    execute_values(db.cursor, f"INSERT INTO properties_raw ({', '.join(RAW_FIXTURE_COLUMNS)}) VALUES %s", values)
+    db.conn.commit()
+    loader = DatabaseLoader(db = db)
+
+    assert loader.load_csv_streaming(write_csv(df, tmp_path / 'snapshot.csv')) == 0
+    assert raw_count(db) == (len(df), len(df))
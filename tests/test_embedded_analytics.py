@@ -0,0 +1,56 @@
+from decimal import Decimal
+import pandas as pd
+import pytest
+from src.analytics import PropertyAnalytics
+from src.config import Config
+from src.db_loader import DatabaseLoader
+from src.embedded_analytics import RAW_TYPES, SnapshotQueryEngine
+from src.etl_pipeline import ETLPipeline
+from src.snapshots import SnapshotManager
+from tests.conftest import raw_fixture, shadow_tables
+
+pytest.importorskip('duckdb')
+
+REPORTS = ['price_by_distance', 'house_vs_apt', 'top_suburbs_by_value', 'most_expensive_suburbs']
+
+
+def report_frames(analytics):
+    frames = {}
+    for name in REPORTS:
+        df = getattr(analytics, name)()
+        # Postgres returns the NUMERIC columns as Decimal objects
+        for col in df.columns:
+            if df[col].map(lambda v: isinstance(v, Decimal)).any():
+                df[col] = df[col].astype(float)
+        frames[name] = df.reset_index(drop = True)
+    return frames
+
+
+@pytest.mark.parametrize('outlier_method', ['fixed', 'robust'])
+def test_snapshot_reports_match_postgres(db, tmp_path, outlier_method):
+    shadow_tables(db, 'properties_raw', 'properties_processed', 'properties_outlier_stats',
+                  'properties_outliers', 'properties_table_loads')
+    config = Config(OUTLIER_METHOD = outlier_method, OUTLIER_ACTION = 'quarantine', TRANSFORM_WORKERS = 1,
+                    PROCESSED_LOAD_STRATEGY = 'truncate', DUCKDB_TEMP_PATH = str(tmp_path / 'duckdb'))
+    df = raw_fixture()
+    # repeated sales: the load and the snapshot view both keep the first
+    df = pd.concat([df, df.head(15)], ignore_index = True)
+    # a snapshot carries every properties_raw column; the reports only read the fixture's
+    df = df.reindex(columns = list(RAW_TYPES))
+    snapshots = SnapshotManager(str(tmp_path), config = config)
+    _, path = snapshots.save(df.assign(date_sold = df['date_sold'].dt.strftime('%d/%m/%Y')))
+
+    DatabaseLoader(db = db, config = config).load_csv_streaming(path)
+    pipeline = ETLPipeline(db = db, config = config)
+    pipeline.load_to_processed(pipeline.transform_data(pipeline.extract_from_raw()))
+    expected = report_frames(PropertyAnalytics(db = db, config = config))
+
+    engine = SnapshotQueryEngine(snapshots = snapshots, config = config)
+    try:
+        actual = report_frames(PropertyAnalytics(engine = engine, config = config))
+    finally:
+        engine.close()
+
+    for name in REPORTS:
+        assert len(expected[name]) > 0, name
+        pd.testing.assert_frame_equal(actual[name], expected[name], check_dtype = False, obj = name)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.config import Config
+from src.etl_pipeline import (
+    INTEGER_COLUMNS, OUTLIER_COLUMNS, OUTLIER_STAGING_TABLES, OUTLIERS_TABLE, PROCESSED_COLUMNS, ETLPipeline
+)
+from tests.conftest import insert_raw, raw_fixture, shadow_tables
+
+QUANTILES = [0, 0.1, 0.25, 0.5, 0.75, 0.9, 1]
+SORT_COLUMNS = ['price', 'date_sold', 'suburb', 'property_size', 'num_bed', 'num_bath', 'type', 'km_from_cbd']
+
+
+def normalise(df, columns = PROCESSED_COLUMNS):
+    df = df[columns].copy()
+    df['date_sold'] = pd.to_datetime(df['date_sold'], errors = 'coerce')
+    for col in ['price', 'property_size', 'km_from_cbd', 'price_per_sqm'] + INTEGER_COLUMNS:
+        # both sides are stored as DECIMAL(_, 2)
+        df[col] = pd.to_numeric(df[col], errors = 'coerce').astype(float).round(2)
+    df['is_house'] = df['is_house'].astype(bool)
+    df['distance_category'] = df['distance_category'].astype(object).where(df['distance_category'].notna(), None)
+    return df.sort_values(SORT_COLUMNS, na_position = 'last').reset_index(drop = True)
+
+
+@pytest.mark.parametrize('outlier_method', ['fixed', 'robust'])
+def test_in_database_query_matches_transform_data(db, outlier_method):
+    shadow_tables(db, 'properties_raw', 'properties_processed', 'properties_outlier_stats', 'properties_outliers')
+    insert_raw(db, raw_fixture())
+    config = Config(OUTLIER_METHOD = outlier_method, OUTLIER_ACTION = 'quarantine', TRANSFORM_WORKERS = 1)
+    pipeline = ETLPipeline(db = db, config = config)
+    try:
+        # the robust pandas stage stages the statistics the SQL then matches against
+        expected = normalise(pipeline.transform_data(pipeline.extract_from_raw()))
+        db.cursor.execute(f"INSERT INTO properties_processed ({', '.join(PROCESSED_COLUMNS)}) "
+                          + pipeline.build_in_database_query())
+        db.cursor.execute(f"SELECT {', '.join(PROCESSED_COLUMNS)} FROM properties_processed")
+        actual = normalise(pd.DataFrame(db.cursor.fetchall(), columns = PROCESSED_COLUMNS))
+    finally:
+        db.conn.rollback()
+        pipeline._drop_outlier_staging()
+
+    assert len(actual) == len(expected)
+    assert 0 < len(actual) < len(raw_fixture())
+    # SQL divides exact DECIMALs, pandas divides floats
+    pd.testing.assert_series_equal(actual.pop('price_per_sqm'), expected.pop('price_per_sqm'), atol = 0.011)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+
+def staged_outliers(db):
+    db.cursor.execute(f"SELECT {', '.join(OUTLIER_COLUMNS)} FROM {OUTLIER_STAGING_TABLES[OUTLIERS_TABLE]}")
+    df = pd.DataFrame(db.cursor.fetchall(), columns = OUTLIER_COLUMNS)
+    df[['low_price', 'high_price']] = df[['low_price', 'high_price']].astype(float)
+    return normalise(df, OUTLIER_COLUMNS)
+
+
+@pytest.mark.parametrize('outlier_action', ['quarantine', 'flag'])
+def test_outlier_stage_matches_in_database(db, outlier_action):
+    shadow_tables(db, 'properties_raw', 'properties_processed', 'properties_outlier_stats', 'properties_outliers')
+    insert_raw(db, raw_fixture())
+    config = Config(OUTLIER_METHOD = 'robust', OUTLIER_ACTION = outlier_action, TRANSFORM_WORKERS = 1)
+    pipeline = ETLPipeline(db = db, config = config)
+    try:
+        pipeline.transform_data(pipeline.extract_from_raw())
+        expected = staged_outliers(db)
+        pipeline.outlier_stage_in_database()
+        actual = staged_outliers(db)
+    finally:
+        db.conn.rollback()
+        pipeline._drop_outlier_staging()
+
+    assert len(expected) > 0
+    # flagged sales are stored with their derived columns
+    assert expected['distance_category'].notna().any()
+    pd.testing.assert_series_equal(actual.pop('price_per_sqm'), expected.pop('price_per_sqm'), atol = 0.011)
+    pd.testing.assert_frame_equal(actual, expected, atol = 0.01)
+
+
+def test_in_database_sketches_match_the_loaded_frame(db):
+    shadow_tables(db, 'properties_raw', 'properties_processed', 'properties_table_loads')
+    insert_raw(db, raw_fixture())
+    config = Config(OUTLIER_METHOD = 'fixed', TRANSFORM_WORKERS = 1, PROCESSED_LOAD_STRATEGY = 'truncate')
+    pipeline = ETLPipeline(db = db, config = config)
+    df = pipeline.transform_data(pipeline.extract_from_raw())
+    pipeline.load_to_processed(df)
+
+    # in-database ETL: bucket counts and distinct suburbs come from SQL aggregates
+    from_sql = pipeline._sketch_store(None)
+    from_frame = pipeline._sketch_store(df)
+
+    assert set(from_sql.segments) == set(from_frame.segments)
+    for key, expected in from_frame.segments.items():
+        actual = from_sql.segments[key]
+        assert actual.num_rows == expected.num_rows, key
+        assert actual.suburbs.estimate() == expected.suburbs.estimate(), key
+        # prices are the same on both sides, so they land in the same buckets
+        assert [actual.price.quantile(q) for q in QUANTILES] == [expected.price.quantile(q) for q in QUANTILES], key
+        # the frame's price_per_sqm is unrounded; the table stores it to the cent
+        for q in QUANTILES:
+            assert np.isclose(actual.price_per_sqm.quantile(q), expected.price_per_sqm.quantile(q),
+                              rtol = 2 * config.SKETCH_RELATIVE_ACCURACY), (key, q)
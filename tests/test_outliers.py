@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+from src.outliers import MAD_SCALE, MIN_LOG_SCALE, TYPE_WIDE, OutlierStats
+from tests.conftest import raw_fixture
+
+THRESHOLD = 3.0
+MIN_GROUP_ROWS = 10
+
+
+def reference_bounds(df):
+    """(low_price, high_price) per (suburb, type), straight from the definition"""
+    sales = df[df['price'] > 0].assign(log_price = lambda d: np.log(d['price'].astype(float)))
+
+    def center_scale(log_price):
+        median = np.median(log_price)
+        mad = np.median(np.abs(log_price - median))
+        return median, max(mad * MAD_SCALE, MIN_LOG_SCALE)
+
+    by_type = {type_: center_scale(group.to_numpy()) for type_, group in sales.groupby('type')['log_price']}
+    bounds = {}
+    for (suburb, type_), group in sales.groupby(['suburb', 'type'])['log_price']:
+        center, scale = by_type[type_] if len(group) < MIN_GROUP_ROWS else center_scale(group.to_numpy())
+        bounds[(suburb, type_)] = (np.exp(center - THRESHOLD * scale), np.exp(center + THRESHOLD * scale))
+    return bounds
+
+
+def new_stats():
+    return OutlierStats(threshold = THRESHOLD, min_group_rows = MIN_GROUP_ROWS)
+
+
+def test_bounds_match_the_definition():
+    df = raw_fixture()
+    stats = new_stats()
+    stats.refresh(df)
+    bounds = stats.bounds()
+
+    expected = reference_bounds(df)
+    for (suburb, type_), (low, high) in expected.items():
+        assert np.isclose(bounds.loc[(suburb, type_), 'low_price'], low), (suburb, type_)
+        assert np.isclose(bounds.loc[(suburb, type_), 'high_price'], high), (suburb, type_)
+    # the Tiny suburb is below MIN_GROUP_ROWS and falls back to the type-wide row
+    assert np.allclose(bounds.loc[('Tiny', 'House')], bounds.loc[(TYPE_WIDE, 'House')])
+
+
+def test_mask_and_price_bounds():
+    df = raw_fixture()
+    stats = new_stats()
+    stats.refresh(df)
+    bounds = stats.bounds()
+    low, high = bounds.loc[('Bondi', 'House')]
+
+    probe = pd.DataFrame({
+        'suburb': ['Bondi'] * 6 + ['Nowhere'],
+        'type': ['House'] * 7,
+        'price': [low, high, low * 0.99, high * 1.01, 0.0, None, 123.0],
+    })
+    row_low, row_high = stats.price_bounds(probe)
+    assert np.allclose(row_low[:6], low) and np.allclose(row_high[:6], high)
+    assert np.isnan(row_low[6]) and np.isnan(row_high[6])
+    # bounds are inclusive, non-positive and missing prices are always
+    # outliers, and groups the stats have not seen are let through
+    assert stats.mask(probe).tolist() == [True, True, False, False, False, False, True]
+
+    # the large prices the fixture plants in Vaucluse and Tiny are flagged
+    flagged = df[~stats.mask(df)]
+    assert {95000000.0, 25000000.0} <= set(flagged['price'])
+
+
+def test_incremental_refresh_matches_a_full_recompute():
+    df = raw_fixture()
+    stats = new_stats()
+    stats.refresh(df)
+
+    changed = df.copy()
+    changed.loc[changed['suburb'] == 'Bondi', 'price'] *= 1.2
+    # only Bondi's (suburb, type) groups and the type-wide rows of their types change
+    bondi_types = changed.loc[changed['suburb'] == 'Bondi', 'type'].nunique()
+    assert stats.refresh(changed) == 2 * bondi_types
+
+    full = new_stats()
+    full.refresh(changed)
+    pd.testing.assert_frame_equal(stats.bounds().sort_index(), full.bounds().sort_index())
+
+
+def test_records_round_trip():
+    stats = new_stats()
+    stats.refresh(raw_fixture())
+    records = [(suburb, type_, num_rows, median, mad, group_hash)
+               for suburb, type_, num_rows, median, mad, _, _, group_hash in stats.to_records()]
+    restored = OutlierStats.from_records(records, threshold = THRESHOLD, min_group_rows = MIN_GROUP_ROWS)
+
+    pd.testing.assert_frame_equal(restored.bounds().sort_index(), stats.bounds().sort_index())
+    # nothing changed since the statistics were stored
+    assert restored.refresh(raw_fixture()) == 0
@@ -0,0 +1,47 @@
+import math
+import pytest
+from src import psycopg3_backend
+from src.config import Config
+from src.db_loader import DatabaseLoader
+from tests.conftest import RAW_FIXTURE_COLUMNS, raw_fixture, shadow_tables
+from tests.test_dedup import write_csv
+
+pytest.importorskip('psycopg')
+
+NUMERICS = ['0', '1', '-1', '0.01', '-0.5', '1234.56', '99999999.99', '-33.868820', '151.209290',
+            '0.0735', '123456789012.34', '10000', '1e-20', '12345678901234567890']
+
+
+def test_binary_numeric_loader_matches_text(db):
+    conn = psycopg3_backend.connect(db.config)
+    try:
+        query = "SELECT v::numeric FROM unnest(%s::text[]) AS v"
+        text = psycopg3_backend.read_frame(conn, query, (NUMERICS,))
+        binary = psycopg3_backend.read_frame(conn, query, (NUMERICS,), binary = True)
+        nan = psycopg3_backend.read_frame(conn, "SELECT 'NaN'::numeric AS v, NULL::numeric AS w", binary = True)
+    finally:
+        conn.close()
+    assert binary['v'].tolist() == text['v'].tolist() == [float(v) for v in NUMERICS]
+    assert math.isnan(nan['v'][0]) and nan['w'].isna().all()
+
+
+def test_binary_copy_load_matches_text_copy(db, tmp_path):
+    shadow_tables(db, 'properties_table_loads')
+    csv_path = write_csv(raw_fixture(), tmp_path / 'snapshot.csv')
+    tables = {}
+    try:
+        for name, binary in [('text', False), ('binary', True)]:
+            # a regular table: the psycopg 3 connection cannot see this session's TEMP tables
+            table = f"test_raw_load_{name}"
+            db.cursor.execute(f"DROP TABLE IF EXISTS {table}; CREATE TABLE {table} (LIKE properties_raw INCLUDING ALL);")
+            db.conn.commit()
+            config = Config(DB_BACKEND = 'psycopg3', PSYCOPG3_BINARY = binary)
+            DatabaseLoader(db = db, config = config).load_csv_streaming(csv_path, table, chunksize = 100)
+            db.cursor.execute(f"SELECT {', '.join(RAW_FIXTURE_COLUMNS)}, row_hash FROM {table} ORDER BY row_hash;")
+            tables[name] = db.cursor.fetchall()
+    finally:
+        db.cursor.execute("DROP TABLE IF EXISTS test_raw_load_text, test_raw_load_binary;")
+        db.cursor.execute("DELETE FROM public.properties_table_loads WHERE table_name LIKE 'test_raw_load_%';")
+        db.conn.commit()
+    assert len(tables['binary']) == len(raw_fixture())
+    assert tables['binary'] == tables['text']
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from src.sketches import HyperLogLog, QuantileSketch, SketchStore
+
+QUANTILES = [0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1]
+
+
+def prices(seed = 0, size = 20000):
+    return np.random.default_rng(seed).lognormal(np.log(1200000), 0.6, size)
+
+
+def test_quantiles_within_relative_accuracy():
+    values = prices()
+    for accuracy in [0.01, 0.05]:
+        sketch = QuantileSketch(accuracy).update(values)
+        for q in QUANTILES:
+            # the sketch ranks like numpy's 'lower' quantile
+            exact = np.quantile(values, q, method = 'lower')
+            assert abs(sketch.quantile(q) - exact) <= accuracy * exact, (accuracy, q)
+
+
+def test_quantile_sketch_ignores_non_positive_and_missing_values():
+    sketch = QuantileSketch().update(pd.Series([0, -5, None, np.nan, 'n/a', 100.0]))
+    assert sketch.count == 1
+    assert sketch.quantile(0.5) == 100.0
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_merged_sketches_equal_one_sketch_of_all_values():
+    values = prices()
+    whole = QuantileSketch().update(values)
+    # the halves cover different bucket ranges, so merging grows the counts
+    ordered = np.sort(values)
+    merged = QuantileSketch().update(ordered[:5000]).merge(QuantileSketch().update(ordered[5000:]))
+
+    assert merged.count == whole.count and merged.min == whole.min and merged.max == whole.max
+    assert [merged.quantile(q) for q in QUANTILES] == [whole.quantile(q) for q in QUANTILES]
+
+    restored = QuantileSketch.from_bytes(merged.to_bytes())
+    assert [restored.quantile(q) for q in QUANTILES] == [whole.quantile(q) for q in QUANTILES]
+
+
+def test_hyperloglog_estimates():
+    names = [f"suburb-{i}" for i in range(30000)]
+    for precision in [10, 12, 14]:
+        error = 1.04 / np.sqrt(1 << precision)
+        # small cardinalities use linear counting
+        assert abs(HyperLogLog(precision).update(names[:200]).estimate() - 200) <= 200 * 3 * error
+        full = HyperLogLog(precision).update(names)
+        assert abs(full.estimate() - len(names)) <= len(names) * 3 * error, precision
+
+        # merging overlapping sets estimates their union; duplicates count once
+        left = HyperLogLog(precision).update(names[:20000] * 2)
+        right = HyperLogLog(precision).update(names[10000:])
+        assert left.merge(right).estimate() == full.estimate()
+        assert HyperLogLog.from_bytes(full.to_bytes()).estimate() == full.estimate()
+
+
+def test_store_merges_segments_for_any_filter():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        'type': rng.choice(['House', 'Unit', 'Townhouse'], 5000),
+        'distance_category': rng.choice(['Inner City', 'Outer Suburbs', None], 5000),
+        'suburb': rng.choice([f"suburb-{i}" for i in range(300)], 5000),
+        'price': prices(2, 5000),
+        'price_per_sqm': rng.uniform(2000, 30000, 5000),
+    })
+    store = SketchStore.from_records(SketchStore.from_dataframe(df).to_records())
+
+    for types, distances in [(None, None), (['House'], None), (['House', 'Unit'], ['Inner City', 'Unknown'])]:
+        rows = df
+        if types is not None:
+            rows = rows[rows['type'].isin(types)]
+        if distances is not None:
+            rows = rows[rows['distance_category'].fillna('Unknown').isin(distances)]
+        segment = store.merged(types, distances)
+        direct = QuantileSketch().update(rows['price'])
+
+        assert segment.num_rows == len(rows)
+        assert segment.price.quantile(0.5) == direct.quantile(0.5)
+        assert segment.suburbs.estimate() == HyperLogLog().update(rows['suburb']).estimate()
@@ -0,0 +1,45 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from src.config import Config
+from src.snapshots import SNAPSHOT_PREFIX, SnapshotManager, count_records
+
+CONFIG = Config(SNAPSHOT_KEEP_UNCOMPRESSED = 1, SNAPSHOT_RETENTION_COUNT = 100, SNAPSHOT_ARCHIVE_FORMAT = 'csv.gz')
+
+
+def frame(rows):
+    return pd.DataFrame({'price': range(rows), 'suburb': ['Bondi'] * rows})
+
+
+def register_snapshots(directory, worker, count):
+    manager = SnapshotManager(directory, config = CONFIG)
+    for i in range(count):
+        path = os.path.join(directory, f"{SNAPSHOT_PREFIX}worker{worker}_{i}.csv")
+        frame(i + 1).to_csv(path, index = False)
+        manager._register(f"2020_w{worker}_{i:03d}", path, 'csv', i + 1)
+
+
+def test_save_compact_and_read(tmp_path):
+    manager = SnapshotManager(str(tmp_path), config = CONFIG)
+    first, _ = manager.save(frame(3))
+    latest, path = manager.save(frame(5))
+    assert manager.latest()[0] == latest and latest > first
+    assert manager.get(first)['format'] == 'csv.gz'
+    assert len(manager.read(first)) == 3 and len(manager.read()) == 5
+    assert count_records(path) == 5
+
+
+def test_latest_adopts_snapshots_written_before_the_manifest(tmp_path):
+    for version, rows in [('20240101_000000_000000', 2), ('20240201_000000_000000', 4)]:
+        frame(rows).to_csv(tmp_path / f"{SNAPSHOT_PREFIX}{version}.csv", index = False)
+    version, entry = SnapshotManager(str(tmp_path), config = CONFIG).latest()
+    assert version == '20240201_000000_000000' and entry['records'] == 4
+
+
+def test_concurrent_processes_keep_every_entry(tmp_path):
+    workers, count = 4, 10
+    with ProcessPoolExecutor(workers, mp_context = multiprocessing.get_context('spawn')) as pool:
+        for future in [pool.submit(register_snapshots, str(tmp_path), w, count) for w in range(workers)]:
+            future.result()
+    assert len(SnapshotManager(str(tmp_path), config = CONFIG).list()) == workers * count
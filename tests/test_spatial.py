@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.spatial import SuburbSpatialIndex, haversine_km
+
+
+def centroids(seed = 3, size = 600):
+    """Random suburb centroids over greater Sydney"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'suburb': [f"suburb-{i}" for i in range(size)],
+        'lat': rng.uniform(-34.2, -33.4, size),
+        'lng': rng.uniform(150.5, 151.4, size),
+        'km_from_cbd': rng.uniform(0, 60, size),
+        'num_properties': rng.integers(1, 500, size),
+        'avg_price_per_sqm': rng.uniform(2000, 30000, size),
+    })
+
+
+def brute_force(df, lat, lng, radius_km):
+    distances = haversine_km(lat, lng, df['lat'].to_numpy(), df['lng'].to_numpy())
+    return set(df['suburb'][distances <= radius_km])
+
+
+def test_haversine_known_distance():
+    # Sydney CBD to Parramatta is about 20 km
+    assert haversine_km(-33.8688, 151.2093, np.array([-33.8150]), np.array([151.0011]))[0] == pytest.approx(20.0, abs = 0.5)
+
+
+@pytest.mark.parametrize('cell_km', [1.0, 5.0, 50.0])
+def test_within_radius_matches_a_full_scan(cell_km):
+    df = centroids()
+    index = SuburbSpatialIndex(df, cell_km = cell_km)
+    for location in ['suburb-0', 'suburb-77', (-33.8688, 151.2093), (-34.5, 150.0)]:
+        lat, lng = index._resolve(location)
+        for radius in [0.5, 3, 12, 80]:
+            result = index.within_radius(location, radius)
+            assert set(result['suburb']) == brute_force(df, lat, lng, radius), (location, radius)
+            assert result['distance_km'].is_monotonic_increasing
+
+
+def test_nearest_excludes_the_query_suburb():
+    df = centroids()
+    index = SuburbSpatialIndex(df)
+    lat, lng = index._resolve('suburb-5')
+    distances = haversine_km(lat, lng, df['lat'].to_numpy(), df['lng'].to_numpy())
+    expected = df['suburb'].iloc[np.argsort(distances, kind = 'stable')[1:6]].tolist()
+
+    assert index.nearest('suburb-5', k = 5)['suburb'].tolist() == expected
+    assert len(index.nearest((-33.8688, 151.2093), k = len(df) + 10)) == len(df)
+    with pytest.raises(KeyError):
+        index.nearest('Nowhere')
+
+
+def test_comparable_by_price_per_sqm_matches_a_sort():
+    df = centroids()
+    index = SuburbSpatialIndex(df)
+    target = df.loc[df['suburb'] == 'suburb-9', 'avg_price_per_sqm'].iloc[0]
+    others = df[df['suburb'] != 'suburb-9']
+    diffs = (others['avg_price_per_sqm'] - target).abs()
+
+    expected = others.loc[diffs.nsmallest(5).index, 'suburb'].tolist()
+    assert index.comparable_by_price_per_sqm('suburb-9', k = 5)['suburb'].tolist() == expected
+
+    lat, lng = index._resolve('suburb-9')
+    nearby = others[others['suburb'].isin(brute_force(df, lat, lng, 15))]
+    expected = nearby.loc[diffs[nearby.index].nsmallest(3).index, 'suburb'].tolist()
+    assert index.comparable_by_price_per_sqm('suburb-9', k = 3, radius_km = 15)['suburb'].tolist() == expected
+
+
+def test_rows_without_coordinates_are_skipped():
+    df = centroids(size = 20)
+    df.loc[[2, 3], 'lat'] = None
+    index = SuburbSpatialIndex(df)
+    assert len(index) == 18
+    assert 'suburb-2' not in set(index.within_radius('suburb-0', 500)['suburb'])
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.timeseries import build_rollups, month_ordinal
+
+
+def sales(seed = 3, rows = 600):
+    rng = np.random.default_rng(seed)
+    price = rng.lognormal(13.5, 0.4, rows).round(2)
+    return pd.DataFrame({
+        'date_sold': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 700, rows), unit = 'D'),
+        'price': price,
+        'price_per_sqm': (price / rng.uniform(80, 600, rows)).round(2),
+        'suburb': rng.choice(['Bondi', 'Manly', 'Penrith'], rows),
+        'distance_category': rng.choice(['Inner City', 'Outer Suburbs'], rows),
+    })
+
+
+@pytest.mark.parametrize('window', [1, 3, 12])
+@pytest.mark.parametrize('since', ['2020-11-01', '2021-02-01', '2021-06-01'])
+def test_incremental_rollups_match_a_full_rebuild(window, since):
+    df = sales()
+    since_month = int(month_ordinal(pd.Series([pd.Timestamp(since)]))[0])
+    # what refresh() reads for an incremental run
+    lookback = min(since_month - (window - 1), since_month - since_month % 3)
+    recent = df[month_ordinal(df['date_sold']) >= lookback]
+
+    full = build_rollups(df, window_months = window)
+    incremental = build_rollups(recent, since_month = since_month, window_months = window)
+    since_quarter = pd.Timestamp(since).to_period('Q').start_time
+    expected = full[
+        ((full['period_type'] == 'month') & (pd.to_datetime(full['period_start']) >= pd.Timestamp(since)))
+        | ((full['period_type'] == 'quarter') & (pd.to_datetime(full['period_start']) >= since_quarter))
+    ].reset_index(drop = True)
+    pd.testing.assert_frame_equal(incremental.reset_index(drop = True), expected, check_dtype = False)
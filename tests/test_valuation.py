@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from src.transforms import DISTANCE_BINS, DISTANCE_LABELS
+from src.valuation import FEATURES, GLOBAL_SEGMENT, SEGMENTS, ValuationModel
+
+
+def sales(seed = 11, size = 3000):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'suburb': rng.choice([f"suburb-{i}" for i in range(40)], size),
+        'is_house': rng.random(size) > 0.5,
+        'num_bed': rng.integers(1, 6, size),
+        'num_bath': rng.integers(1, 4, size),
+        'num_parking': rng.integers(0, 3, size),
+        'property_size': rng.uniform(50, 1200, size),
+        'km_from_cbd': rng.uniform(0, 40, size),
+    })
+
+
+def segment_of(df):
+    distance = np.searchsorted(DISTANCE_BINS[1:-1], df['km_from_cbd'].to_numpy(), side = 'right')
+    return df['is_house'].to_numpy(dtype = int) * len(DISTANCE_LABELS) + distance
+
+
+def priced(df, seed = 12):
+    """log(price) exactly linear in the features, with its own coefficients per segment"""
+    rng = np.random.default_rng(seed)
+    coefficients = rng.normal(0, 0.1, (len(SEGMENTS), len(FEATURES) + 1))
+    coefficients[:, 0] = 13
+    X = np.column_stack([np.ones(len(df)), df['num_bed'], df['num_bath'], df['num_parking'],
+                         np.log(df['property_size']), df['km_from_cbd']])
+    log_price = np.einsum('ij,ij->i', X, coefficients[segment_of(df)])
+    return df.assign(price = np.exp(log_price)), coefficients
+
+
+def test_recovers_per_segment_models():
+    df, coefficients = priced(sales())
+    model = ValuationModel(min_segment_rows = 30, suburb_shrinkage = 0).fit(df)
+
+    assert np.allclose(model.coefficients[:len(SEGMENTS), :-1], coefficients, atol = 1e-6)
+    # no residual left: no suburb effects and no smearing
+    assert np.allclose(model.suburb_offsets, 0, atol = 1e-9)
+    assert np.allclose(model.coefficients[:, -1], 1, atol = 1e-9)
+    assert np.allclose(model.score(df), df['price'], rtol = 1e-6)
+
+
+def test_small_segments_use_the_pooled_model():
+    df, _ = priced(sales())
+    far_houses = df['is_house'] & (df['km_from_cbd'] >= 20)
+    df = pd.concat([df[~far_houses], df[far_houses].head(10)])
+    model = ValuationModel(min_segment_rows = 30, suburb_shrinkage = 0).fit(df)
+
+    small = SEGMENTS.index('House|Outer Suburbs')
+    assert model.segment_rows[small] == 10
+    assert np.array_equal(model.coefficients[small, :-1], model.coefficients[-1, :-1])
+
+
+def test_unknown_suburbs_and_missing_features():
+    df, _ = priced(sales())
+    df['price'] *= np.where(df['suburb'] == 'suburb-0', 1.5, 1.0)
+    model = ValuationModel(min_segment_rows = 30, suburb_shrinkage = 5).fit(df)
+
+    known = df.head(20)
+    assert (model.score(known.assign(suburb = 'suburb-0')) > model.score(known.assign(suburb = 'Nowhere'))).all()
+    # shrinkage pulls the offset towards 0, below the full log(1.5)
+    offset = model.suburb_offsets[model.suburbs.get_loc('suburb-0')]
+    assert 0 < offset < np.log(1.5)
+
+    gaps = known.assign(num_parking = None, property_size = 0.0, km_from_cbd = None)
+    assert np.isfinite(model.score(gaps)).all()
+
+
+def test_records_round_trip():
+    df, _ = priced(sales())
+    df['price'] *= np.random.default_rng(0).lognormal(0, 0.2, len(df))
+    model = ValuationModel(min_segment_rows = 30, suburb_shrinkage = 5).fit(df)
+    records = model.to_records()
+    restored = ValuationModel.from_records(records)
+
+    assert [r[1] for r in records if r[0] == 'segment'] == SEGMENTS + [GLOBAL_SEGMENT]
+    assert np.array_equal(restored.score(df), model.score(df))